@@ -9,11 +9,11 @@ Testing continous audio playback with multiproccessing
 import context
 context.get()
 
-from multiprocessing import Manager, Queue
 import magSonify
 from datetime import datetime ,timedelta
 from magSonify import THEMISdata
-from magSonify.Buffering import BaseProcess
+from magSonify.Buffering import startPipeline, measureStageTimes, allocateWorkers
+from magSonify.PipelineMetrics import PipelineMetrics
 
 dataClass = THEMISdata
 start = datetime(2007,9,20)
@@ -23,24 +23,27 @@ events = ((
     start+timedelta(hours=(i+1)*intervalHours)
     ) for i in range(30))
 events = list(events)
+sonificationArgs = (1,"waveletStretch",(12,0.5,12))
 
 if __name__ == "__main__":
-    manager = Manager()
-    queues = (manager.Queue(maxsize=5) for i in range(3))
-    queues = list(queues)
-    processes = {}
-    for task, taskArgs in {
-        "importer": (events,), 
-        "processing": (), 
-        "sonification": (1,"waveletStretch",(12,0.5,12)), 
-        "playback": (44100//2,)
-    }.items():
-        processes[task] = BaseProcess(
-            task=task,
-            taskArgs=taskArgs,
-            queues=queues
-        )
-        processes[task].start()
-    for task, p in processes.items():
+    stageTimes = measureStageTimes(events[0],dataClass,sonificationArgs=sonificationArgs)
+    workers = allocateWorkers(stageTimes)
+    print("Stage times:",stageTimes)
+    print("Workers:",workers)
+    metrics = PipelineMetrics()
+    processes = startPipeline(
+        events,
+        workers,
+        dataClass,
+        sonificationArgs=sonificationArgs,
+        sampleRate=44100//2,
+        queueBudgets=(2**28, 2**28, 2**27),
+        maxTotalBytes=2**29,
+        metrics=metrics,
+    )
+    for p in processes:
         p.join()
-        print(p,"joined")
\ No newline at end of file
+        print(p,"joined")
+    metrics.close()
+    print(metrics.summary())
+    metrics.writeJsonLines("pipelineMetrics.jsonl")
@@ -0,0 +1,51 @@
+"""
+DEVELOPMENT TESTING
+MAY BE INCOMPLETE / NON FUNCTIONAL
+
+Compares the time to send a DataSet_1D with wavelet coefficients between processes through a 
+manager queue, with and without the shared memory transport.
+"""
+
+import context
+context.get()
+
+from multiprocessing import Manager, Process
+from datetime import datetime
+from timeit import default_timer as timer
+import numpy as np
+
+from magSonify import DataSet_1D, generateTimeSeries
+from magSonify.SharedMemoryTransport import SharedMemoryTransport
+
+NUMBER_ITEMS = 10
+
+def generateDataSet(numberSamples=2**17,numberScales=40):
+    ts = generateTimeSeries(datetime(2007,9,4),datetime(2007,9,5),number=numberSamples)
+    dataSet = DataSet_1D(ts,np.random.normal(0,1,numberSamples))
+    dataSet.coefficients = np.random.normal(0,1,(numberScales,numberSamples)) * 1j
+    return dataSet
+
+def produce(queue):
+    dataSet = generateDataSet()
+    for i in range(NUMBER_ITEMS):
+        queue.put(dataSet)
+    queue.put(None)
+
+def benchmark(name,queue):
+    producer = Process(target=produce,args=(queue,))
+    producer.start()
+    # Exclude the time to generate the first item
+    queue.get()
+    start = timer()
+    while queue.get() is not None:
+        pass
+    perItem = (timer() - start) / (NUMBER_ITEMS - 1)
+    producer.join()
+    print(f"{name}: {round(perItem*1e3,1)} ms per item")
+
+if __name__ == "__main__":
+    nbytes = generateDataSet().coefficients.nbytes
+    print(f"Coefficients: {round(nbytes/1024**2)} MiB")
+    manager = Manager()
+    benchmark("Manager queue",manager.Queue(maxsize=5))
+    benchmark("Manager queue with shared memory",SharedMemoryTransport(manager.Queue(maxsize=5)))
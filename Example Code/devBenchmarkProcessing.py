@@ -0,0 +1,137 @@
+"""
+DEVELOPMENT TESTING
+MAY BE INCOMPLETE / NON FUNCTIONAL
+
+Benchmarks THEMISdata.defaultProcessing on simulated data, so no CDAS connection is required.
+Reports the run time and the number of times the parsing TimeSeries constructor is called.
+"""
+
+import context
+context.get()
+
+from datetime import datetime
+from copy import deepcopy
+from timeit import default_timer as timer
+import tracemalloc
+import numpy as np
+
+from magSonify import THEMISdata, TimeSeries, DataSet, DataSet_3D
+
+rng = np.random.default_rng(0)
+
+def simulateEvent(hours=12, meanSpacingSeconds=3.17):
+    """Generates a THEMISdata instance populated with noisy simulated data, with sample spacing
+    similar to that of the raw THEMIS magnetometer data."""
+    number = int(hours * 3600 / meanSpacingSeconds)
+    spacing = rng.normal(meanSpacingSeconds, 0.05, number).clip(0.5)
+    times = np.datetime64(datetime(2007,9,4,6)) + (
+        np.cumsum(spacing) * 1e3
+    ).astype('timedelta64[ms]')
+    timeSeries = TimeSeries(times)
+
+    mag = THEMISdata()
+    mag.magneticField = DataSet_3D(timeSeries,{
+        i: 20 * np.sin(np.linspace(0,50*(i+1),number)) + rng.normal(0,5,number)
+        for i in (0,1,2)
+    })
+    radius = 4 + 6 * np.abs(np.sin(np.linspace(0,np.pi,number)))
+    mag.position = DataSet_3D(timeSeries,{
+        0: radius * 6371, 1: radius * 0.2 * 6371, 2: radius * 0.1 * 6371, 'radius': radius
+    })
+    return mag
+
+class countConstructorCalls():
+    """Counts calls of the parsing constructor ``TimeSeries.__init__`` while in scope"""
+    def __enter__(self):
+        self.count = 0
+        self.originalInit = TimeSeries.__init__
+        def _countingInit(timeSeries, *args, **kwargs):
+            self.count += 1
+            self.originalInit(timeSeries, *args, **kwargs)
+        TimeSeries.__init__ = _countingInit
+        return self
+    def __exit__(self,_1,_2,_3):
+        TimeSeries.__init__ = self.originalInit
+
+def benchmarkDefaultProcessing(repeats=5):
+    times = []
+    for i in range(repeats):
+        mag = simulateEvent()
+        with countConstructorCalls() as counter:
+            start = timer()
+            mag.defaultProcessing()
+            times.append(timer() - start)
+    print(f"defaultProcessing: {round(np.min(times)*1e3,1)} ms (best of {repeats})")
+    print(f"    TimeSeries.__init__ calls: {counter.count}")
+
+def benchmarkDerivedDataSets(repeats=200):
+    mag = simulateEvent()
+    mag.interpolate()
+    field = mag.magneticField
+    start = timer()
+    for i in range(repeats):
+        -field
+    perCall = (timer() - start) / repeats
+    print(f"DataSet.__neg__: {round(perCall*1e6,1)} us per call, {len(field.timeSeries)} samples")
+
+def meanFieldCoordinatesComposed(mag: THEMISdata) -> DataSet_3D:
+    """Mean field coordinate transform composed from the individual DataSet_3D methods"""
+    fieldUnitVector = mag.meanField.copy()
+    fieldUnitVector.makeUnitVector()
+    earthUnitVector = -(mag.position.copy())
+    earthUnitVector.makeUnitVector()
+    polUnitVector = fieldUnitVector.cross(earthUnitVector)
+    polUnitVector.makeUnitVector()
+    torUnitVector = fieldUnitVector.cross(polUnitVector)
+    torUnitVector.makeUnitVector()
+    return mag.magneticField.coordinateTransform(fieldUnitVector,polUnitVector,torUnitVector)
+
+def benchmarkMeanFieldCoordinates(repeats=50):
+    mag = simulateEvent()
+    mag.interpolate()
+    mag.meanField = mag.magneticField.runningAverage(
+        timeWindow=np.timedelta64(35,"m"), shrinkEdges=True
+    )
+    mag.magneticField -= mag.meanField
+    for name, transform in {
+        "Composed": meanFieldCoordinatesComposed,
+        "Fused": lambda mag: mag.magneticField.meanFieldAlignedTransform(
+            mag.meanField, mag.position
+        ),
+    }.items():
+        start = timer()
+        for i in range(repeats):
+            res = transform(mag)
+        perCall = (timer() - start) / repeats
+        print(f"Mean field coordinates, {name}: {round(perCall*1e3,2)} ms per call")
+    reference = meanFieldCoordinatesComposed(mag)
+    maxDifference = max(np.nanmax(np.abs(res.data[i] - reference.data[i])) for i in (0,1,2))
+    print(f"    Max difference between methods: {maxDifference:.2e}")
+
+def benchmarkChunkedProcessing(chunkSize=2**13):
+    """Compares the run time and peak memory of defaultProcessing and defaultProcessingChunked"""
+    event = simulateEvent(hours=48)
+    event.interpolate()
+    results = {}
+    for name, process in {
+        "defaultProcessing": lambda mag: mag.defaultProcessing(),
+        "defaultProcessingChunked": lambda mag: mag.defaultProcessingChunked(chunkSize=chunkSize),
+    }.items():
+        mag = deepcopy(event)
+        tracemalloc.start()
+        start = timer()
+        process(mag)
+        runTime = timer() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name}: {round(runTime*1e3,1)} ms, peak memory {round(peak/1024**2,1)} MiB")
+        results[name] = mag.magneticFieldMeanFieldCoordinates
+    reference, chunked = results.values()
+    maxDifference = max(np.max(np.abs(reference.data[i] - chunked.data[i])) for i in (0,1,2))
+    print(f"    Max difference between methods: {maxDifference:.2e}")
+
+if __name__ == "__main__":
+    benchmarkDefaultProcessing()
+    benchmarkDerivedDataSets()
+    benchmarkMeanFieldCoordinates()
+    benchmarkChunkedProcessing()
@@ -0,0 +1,65 @@
+"""
+DEVELOPMENT TESTING
+MAY BE INCOMPLETE / NON FUNCTIONAL
+
+Measures the time to import magSonify and its main classes with ``python -X importtime``, each
+in a new interpreter, and compares it to a budget. Slow dependencies, eg. ``ai.cdas``, 
+``audiotsm``, ``soundfile`` and ``scipy``, should only be imported when they are used, see 
+``magSonify/__init__.py``. Exits with status 1 if any statement exceeds its budget.
+
+Run from the root of the repository::
+
+    python "Example Code/devImportTime.py"
+"""
+
+import os
+import subprocess
+import sys
+
+# Milliseconds, including numpy where it is imported
+BUDGETS = {
+    "import magSonify": 20,
+    "from magSonify import TimeSeries": 200,
+    "from magSonify import SimulateData": 250,
+    "from magSonify import THEMISdata": 300,
+    "from magSonify.Buffering import startPipeline": 400,
+}
+REPEATS = 5
+SLOW_MODULES = ("ai.cdas", "audiotsm", "soundfile", "scipy.interpolate", "scipy.signal")
+
+def importTime(statement: str, startupModules=()) -> tuple:
+    """Returns the import time of ``statement`` in milliseconds, and the names of the modules 
+    imported, in a new interpreter. ``startupModules``, imported by the interpreter before the 
+    statement is run, are not counted."""
+    environment = {**os.environ, "PYTHONPATH": os.path.abspath(".")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, env=environment, check=True,
+    )
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        selfTime, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() in startupModules:
+            continue
+        modules.append(name.strip())
+        # Only modules imported directly by the statement, as the cumulative time includes the
+        # modules they import
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1000, modules
+
+if __name__ == "__main__":
+    overBudget = False
+    startupTime, startupModules = importTime("pass")
+    print(f"{'Statement':<50}{'Time (ms)':>10}{'Budget':>8}  Slow modules")
+    for statement, budget in BUDGETS.items():
+        times, modules = zip(*(
+            importTime(statement,startupModules) for i in range(REPEATS)
+        ))
+        slow = [module for module in SLOW_MODULES if module in modules[0]]
+        overBudget |= min(times) > budget
+        print(f"{statement:<50}{min(times):>10.1f}{budget:>8}  {', '.join(slow)}")
+    sys.exit(1 if overBudget else 0)
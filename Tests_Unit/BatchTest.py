@@ -0,0 +1,86 @@
+
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import tempfile
+import json
+import os
+from datetime import datetime
+
+import soundfile
+from magSonify.MagnetometerData import THEMISdata
+from magSonify.Batch import generateEvents, sonifyEvents
+from magSonify.DataSource import MemoryDataSource, simulateTHEMISdataSets
+from simulatedTHEMISdata import SimulatedTHEMISdata
+
+
+class MemoryTHEMISdata(THEMISdata):
+    """Imports simulated data for satellite ``"D"`` only"""
+    def __init__(self):
+        super().__init__()
+        self.dataSource = MemoryDataSource(
+            simulateTHEMISdataSets(datetime(2007,9,1),datetime(2007,9,1,6))
+        )
+
+
+class BatchTest(unittest.TestCase):
+    def test_generateEvents(self):
+        events = generateEvents(datetime(2007,9,1),datetime(2007,9,2,6),satellites="AD")
+        self.assertEqual(len(events),6)
+        self.assertTupleEqual(events[0],(datetime(2007,9,1),datetime(2007,9,1,12),"A"))
+        self.assertTupleEqual(events[2],(datetime(2007,9,2),datetime(2007,9,2,6),"A"))
+        self.assertEqual(events[3][2],"D")
+
+    def test_sonifyEvents(self):
+        events = [
+            (datetime(2007,9,1),datetime(2007,9,1,3),"D"),
+            (datetime(2007,9,1),datetime(2007,9,1,3),"X"),
+            (datetime(2007,9,1,3),datetime(2007,9,1,6),"D"),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = sonifyEvents(
+                events,
+                directory,
+                dataClass=SimulatedTHEMISdata,
+                algorithm="paulStretch",
+                algArgs=(2,),
+                maxWorkers=2,
+            )
+            self.assertListEqual([entry['status'] for entry in manifest],['ok','failed','ok'])
+            self.assertIn("No data for satellite X",manifest[1]['error'])
+            self.assertIsNone(manifest[1]['file'])
+            for entry in (manifest[0],manifest[2]):
+                audio, sampleRate = soundfile.read(entry['file'])
+                self.assertEqual(len(audio),entry['numberSamples'])
+                self.assertSetEqual(
+                    set(entry['timings']),{'import','processing','sonification','write'}
+                )
+            self.assertNotEqual(manifest[0]['file'],manifest[2]['file'])
+            with open(os.path.join(directory,"manifest.json")) as file:
+                self.assertEqual(len(json.load(file)),3)
+
+    def test_eventsWithSameStart(self):
+        events = [
+            (datetime(2007,9,1),datetime(2007,9,1,3),"D"),
+            (datetime(2007,9,1),datetime(2007,9,1,2),"D"),
+            (datetime(2007,9,1),datetime(2007,9,1,3),"A"),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = sonifyEvents(
+                events,
+                directory,
+                dataClass=MemoryTHEMISdata,
+                algorithm="paulStretch",
+                algArgs=(2,),
+                maxWorkers=2,
+            )
+            self.assertListEqual([entry['status'] for entry in manifest],['ok','ok','failed'])
+            self.assertNotEqual(manifest[0]['file'],manifest[1]['file'])
+            self.assertGreater(manifest[0]['numberSamples'],manifest[1]['numberSamples'])
+            # The import error, rather than the failure of processing without data
+            self.assertIn("CdasNoDataReturnedError",manifest[2]['error'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,276 @@
+
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import multiprocessing as mp
+import queue
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+from magSonify.TimeSeries import generateTimeSeries
+from magSonify.DataSet import DataSet_3D
+from magSonify.DataSet_1D import DataSet_1D
+from magSonify.MagnetometerData import THEMISdata
+from magSonify.PipelineMetrics import PipelineMetrics
+from magSonify.DataSource import LocalDataSource, MemoryDataSource, simulateTHEMISdataSets
+from magSonify.Buffering import (
+    STOPVALUE, 
+    ReorderBuffer, 
+    AudioRingBuffer, 
+    FakeSoundDevice, 
+    BaseProcess, 
+    MemoryBudget,
+    BudgetedQueue,
+    itemBytes,
+    allocateWorkers, 
+    createTransports, 
+    _createProcesses,
+)
+from simulatedTHEMISdata import SimulatedTHEMISdata
+
+
+class BufferingTest(unittest.TestCase):
+    def test_reorderBuffer(self):
+        reorderBuffer = ReorderBuffer()
+        self.assertListEqual(reorderBuffer.add(2,"c"),[])
+        self.assertListEqual(reorderBuffer.add(1,"b"),[])
+        self.assertListEqual(reorderBuffer.add(0,"a"),["a","b","c"])
+        self.assertListEqual(reorderBuffer.add(3,"d"),["d"])
+        self.assertEqual(len(reorderBuffer),0)
+
+    def test_allocateWorkers(self):
+        stageTimes = {"importer": 1, "processing": 2, "sonification": 10}
+        self.assertDictEqual(
+            allocateWorkers(stageTimes,totalWorkers=7),
+            {"importer": 1, "processing": 1, "sonification": 5, "playback": 1}
+        )
+        self.assertDictEqual(
+            allocateWorkers(stageTimes,totalWorkers=2),
+            {"importer": 1, "processing": 1, "sonification": 1, "playback": 1}
+        )
+
+    def test_multipleWorkersInOrder(self):
+        self._runStagesInOrder(createTransports([mp.Queue(maxsize=3) for i in range(3)]))
+
+    def test_budgetedQueuesInOrder(self):
+        # Budgets smaller than any item, so each queue holds a single item at a time
+        budget = MemoryBudget((1, 1, 1), maxTotalBytes=1)
+        queues = createTransports([BudgetedQueue(mp.Queue(),budget,i) for i in range(3)])
+        metrics = PipelineMetrics()
+        self._runStagesInOrder(queues,metrics)
+        metrics.close()
+        self.assertEqual(budget.used(),0)
+
+        stages = metrics.stageSummary()
+        self.assertListEqual(sorted(stages),["importer","processing","sonification"])
+        for stage in stages.values():
+            self.assertEqual(stage['items'],7)
+            self.assertGreater(stage['bytes'],0)
+            self.assertTrue(0 <= stage['utilisation'] <= 1)
+        self.assertEqual(len(metrics.ofKind('worker')),7)
+        largestItem = {
+            i: max(r['bytes'] for r in metrics.ofKind('item') if r['stage'] == stage)
+            for i, stage in enumerate(("importer","processing","sonification"))
+        }
+        for record in metrics.ofKind('queue'):
+            # Each queue holds at most one item with data
+            self.assertLessEqual(record['bytes'],largestItem[record['queue']])
+
+    def _runStagesInOrder(self,queues,metrics=None):
+        satellites = "DDXDDDD"
+        events = [
+            (datetime(2007,9,1,3*i),datetime(2007,9,1,3*i+2),satellite)
+            for i, satellite in enumerate(satellites)
+        ]
+        processes = _createProcesses(
+            queues,
+            {
+                "importer": (events,SimulatedTHEMISdata),
+                "processing": ((),),
+                "sonification": (1,"paulStretch",(2,)),
+            },
+            {"importer": 2, "processing": 2, "sonification": 3},
+            metrics=metrics,
+        )
+        for process in processes:
+            process.start()
+
+        reorderBuffer = ReorderBuffer()
+        received = []
+        stops = 0
+        # Each sonification worker puts its own STOPVALUE
+        while stops < 3:
+            item = queues[2].get(timeout=60)
+            if isinstance(item,STOPVALUE):
+                stops += 1
+                continue
+            received.extend(reorderBuffer.add(*item))
+        for process in processes:
+            process.join()
+
+        self.assertEqual(len(received),len(events))
+        for (start, end, satellite), ax in zip(events,received):
+            if satellite == "X":
+                self.assertIsNone(ax)
+            else:
+                self.assertEqual(ax.timeSeries.startTime,np.datetime64(start))
+
+
+    def test_stopAfterEveryProducer(self):
+        # The STOPVALUE of one importer may arrive before the last item of another
+        importedQueue, processedQueue = queue.Queue(), queue.Queue()
+        for item in ((0, None), STOPVALUE(), (1, None), STOPVALUE()):
+            importedQueue.put(item)
+        process = BaseProcess(
+            "processing",
+            ((),),
+            (importedQueue,processedQueue,None),
+            useSharedMemory=False,
+            numberConsumers=2,
+            numberProducers=2,
+        )
+        process.processing()
+        received = [processedQueue.get_nowait() for i in range(processedQueue.qsize())]
+        self.assertListEqual(received[:2],[(0, None), (1, None)])
+        self.assertEqual(len(received),4)
+        self.assertTrue(all(isinstance(item,STOPVALUE) for item in received[2:]))
+
+    def test_importFromLocalDataSource(self):
+        events = [(datetime(2007,9,1,3*i),datetime(2007,9,1,3*i+2),"D") for i in range(4)]
+        with tempfile.TemporaryDirectory() as directory:
+            dataSource = LocalDataSource(directory)
+            dataSource.mirror(
+                MemoryDataSource(simulateTHEMISdataSets(datetime(2007,9,1),datetime(2007,9,2))),
+                THEMISdata,
+                events
+            )
+            queues = createTransports([mp.Queue() for i in range(3)])
+            processes = _createProcesses(
+                queues,
+                {
+                    "importer": (events,THEMISdata,2,6,dataSource),
+                    "processing": ((),),
+                    "sonification": (1,"paulStretch",(2,)),
+                },
+                {"importer": 2, "processing": 1, "sonification": 2},
+            )
+            for process in processes:
+                process.start()
+            reorderBuffer = ReorderBuffer()
+            received = []
+            stops = 0
+            while stops < 2:
+                item = queues[2].get(timeout=60)
+                if isinstance(item,STOPVALUE):
+                    stops += 1
+                    continue
+                received.extend(reorderBuffer.add(*item))
+            for process in processes:
+                process.join()
+
+        self.assertEqual(len(received),len(events))
+        for (start, end, satellite), ax in zip(events,received):
+            self.assertEqual(ax.timeSeries.startTime,np.datetime64(start))
+
+
+class MemoryBudgetTest(unittest.TestCase):
+    def test_itemBytes(self):
+        ts = generateTimeSeries(datetime(2020,4,2),datetime(2020,4,2,1),number=1000)
+        field = DataSet_3D(ts,{i: np.zeros(1000) for i in (0,1,2)})
+        mag = THEMISdata()
+        mag.magneticField = field
+        mag.meanField = DataSet_3D(ts,{i: np.zeros(1000) for i in (0,1,2)})
+        timeBytes = itemBytes(ts)
+        self.assertGreater(timeBytes,0)
+        self.assertEqual(itemBytes((0, mag)),6*8000 + 2*timeBytes)
+        # Arrays referenced more than once are counted once
+        self.assertEqual(itemBytes([field, field.data]),3*8000 + timeBytes)
+        self.assertEqual(itemBytes(STOPVALUE()),0)
+
+    def test_reserveWaitsForRelease(self):
+        budget = MemoryBudget((100,))
+        self.assertTrue(budget.reserve(0,60))
+        self.assertFalse(budget.reserve(0,60,timeout=0.01))
+        threading.Timer(0.05,budget.release,(0,60)).start()
+        self.assertTrue(budget.reserve(0,60,timeout=10))
+        self.assertEqual(budget.used(0),60)
+
+    def test_oversizedItemAcceptedWhenEmpty(self):
+        budget = MemoryBudget((100,))
+        self.assertTrue(budget.reserve(0,1000,timeout=0))
+        self.assertFalse(budget.reserve(0,1,timeout=0))
+
+    def test_waitToImport(self):
+        budget = MemoryBudget((100,100),maxTotalBytes=150)
+        budget.reserve(0,80)
+        budget.reserve(1,80)
+        self.assertFalse(budget.waitToImport(timeout=0.01))
+        budget.release(1,80)
+        self.assertTrue(budget.waitToImport(timeout=0))
+
+    def test_budgetedQueue(self):
+        budget = MemoryBudget((8000,))
+        budgetedQueue = BudgetedQueue(queue.Queue(),budget,0)
+        budgetedQueue.put((0, np.zeros(1000)))
+        self.assertEqual(budget.used(0),8000)
+        sequence, item = budgetedQueue.get()
+        self.assertEqual(len(item),1000)
+        self.assertEqual(budget.used(0),0)
+
+
+class PlaybackTest(unittest.TestCase):
+    def test_ringBuffer(self):
+        ringBuffer = AudioRingBuffer(8)
+        out = np.empty(5,np.float32)
+        self.assertEqual(ringBuffer.write(np.arange(1,7)),6)
+        self.assertEqual(ringBuffer.read(out),5)
+        self.assertListEqual(list(out),[1,2,3,4,5])
+        # Wraps around the end of the buffer
+        self.assertEqual(ringBuffer.write(np.arange(7,20)),7)
+        self.assertEqual(ringBuffer.overruns,1)
+        self.assertEqual(ringBuffer.available(),8)
+        self.assertEqual(ringBuffer.read(out),5)
+        self.assertListEqual(list(out),[6,7,8,9,10])
+        self.assertEqual(ringBuffer.read(out),3)
+        self.assertListEqual(list(out),[11,12,13,0,0])
+        self.assertEqual(ringBuffer.underruns,1)
+        ringBuffer.finished = True
+        ringBuffer.read(out)
+        self.assertEqual(ringBuffer.underruns,1)
+
+    def test_playbackInOrder(self):
+        rng = np.random.default_rng(0)
+        ts = generateTimeSeries(datetime(2020,4,2),datetime(2020,4,2,1),number=5000)
+        audio = [rng.uniform(0.1,1,5000) for i in range(3)]
+        sonifiedQueue = queue.Queue()
+        for item in (
+            (1, DataSet_1D(ts,audio[1])),
+            (0, DataSet_1D(ts,audio[0])),
+            (3, None),
+            (2, DataSet_1D(ts,audio[2])),
+            STOPVALUE(),
+        ):
+            sonifiedQueue.put(item)
+        metrics = PipelineMetrics()
+        process = BaseProcess(
+            "playback",(),(None,None,sonifiedQueue),useSharedMemory=False,metrics=metrics
+        )
+
+        soundDevice = FakeSoundDevice()
+        # Buffer smaller than the audio for each event, so the playback loop blocks for space
+        process.playback(44100,bufferSize=4096,soundDevice=soundDevice)
+        played = soundDevice.played[:,0]
+        self.assertTrue(np.array_equal(
+            played[played != 0],
+            np.concatenate(audio).astype(np.float32)
+        ))
+        metrics.close()
+        self.assertEqual(len(metrics.ofKind('audio')),4)
+        self.assertIn("Audio: min headroom",metrics.summary())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import multiprocessing as mp
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from magSonify.Caching import CachedDataSource, IntervalCache, defaultCacheDirectory
+from magSonify.DataSource import MemoryDataSource, simulateTHEMISdataSets
+
+start = datetime(2007,9,4)
+
+def request(hour: int) -> tuple:
+    return ('sp_phys','THD_L2_FGM',start + timedelta(hours=hour),start + timedelta(hours=hour+1),[])
+
+def _readManyTimes(cache: CachedDataSource, results) -> None:
+    for i in range(20):
+        data = cache.get_data(*request(i % 4))
+        results.put(len(data["UT"]))
+
+
+class CachedDataSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = MemoryDataSource(simulateTHEMISdataSets(start,start + timedelta(days=1)))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hitsAndMisses(self):
+        cache = CachedDataSource(self.source,self.directory.name)
+        first = cache.get_data(*request(0))
+        second = cache.get_data(*request(0))
+        cache.get_data(*request(1))
+        self.assertEqual(len(self.source.requests),2)
+        for key in first:
+            self.assertTrue(np.array_equal(first[key],second[key]))
+        statistics = cache.statistics()
+        self.assertEqual(statistics['hits'],1)
+        self.assertEqual(statistics['misses'],2)
+        self.assertEqual(statistics['files'],2)
+        self.assertEqual(statistics['bytesWritten'],statistics['size'])
+        self.assertGreater(statistics['bytesRead'],0)
+
+    def test_missingDatasetNotCached(self):
+        cache = CachedDataSource(self.source,self.directory.name)
+        self.assertIsNone(cache.get_data('sp_phys','THA_L2_FGM',start,start,[]))
+        self.assertEqual(cache.statistics()['files'],0)
+
+    def test_leastRecentlyUsedEvicted(self):
+        cache = CachedDataSource(self.source,self.directory.name)
+        cache.get_data(*request(0))
+        fileSize = cache.statistics()['size']
+        cache.maxBytes = 2 * fileSize
+        fileNames = [cache._fileName(*request(hour)[1:4],[]) for hour in range(3)]
+        cache.get_data(*request(1))
+        # Request 0 is used more recently than request 1
+        os.utime(fileNames[1],(1,1))
+        cache.get_data(*request(0))
+        cache.get_data(*request(2))
+        self.assertEqual(cache.evictions,1)
+        self.assertListEqual([os.path.exists(f) for f in fileNames],[True,False,True])
+
+    def test_damagedFileReplaced(self):
+        cache = CachedDataSource(self.source,self.directory.name)
+        cache.get_data(*request(0))
+        with open(cache._fileName(*request(0)[1:4],[]),"wb") as file:
+            file.write(b"damaged")
+        self.assertEqual(len(cache.get_data(*request(0))["UT"]),1201)
+        self.assertEqual(cache.misses,2)
+        self.assertEqual(len(cache.get_data(*request(0))["UT"]),1201)
+        self.assertEqual(cache.hits,1)
+
+    def test_concurrentProcesses(self):
+        # Small enough that files are evicted while other processes read them
+        cache = CachedDataSource(self.source,self.directory.name,maxBytes=100000)
+        results = mp.Queue()
+        processes = [mp.Process(target=_readManyTimes,args=(cache,results)) for i in range(4)]
+        for process in processes:
+            process.start()
+        lengths = [results.get(timeout=60) for i in range(80)]
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode,0)
+        self.assertListEqual(lengths,[1201]*80)
+
+    def test_defaultCacheDirectory(self):
+        with mock.patch.dict(os.environ,{"MAGSONIFY_CACHE_DIR": "/tmp/myCache"}):
+            self.assertEqual(defaultCacheDirectory(),"/tmp/myCache")
+        with mock.patch.dict(os.environ,{"MAGSONIFY_CACHE_DIR": ""}):
+            self.assertTrue(defaultCacheDirectory().endswith("magSonify"))
+
+    def test_deleteCacheKeepsOtherFiles(self):
+        from magSonify.devCaching import cacheControl
+        cacheDirectory = self.directory.name
+        cdasCache = os.path.join(cacheDirectory,"CDAScache")
+        owned = [
+            os.path.join(cdasCache,"response"),
+            os.path.join(cacheDirectory,"responses","a.npz"),
+        ]
+        # eg. MAGSONIFY_CACHE_DIR set to a shared directory
+        other = [
+            os.path.join(cacheDirectory,"notes.txt"),
+            os.path.join(cacheDirectory,"intervals","a.npz"),
+        ]
+        for fileName in owned + other:
+            os.makedirs(os.path.dirname(fileName),exist_ok=True)
+            open(fileName,"w").close()
+        with mock.patch.multiple(
+            cacheControl,local_app_path=cacheDirectory,cdas_cache_path=cdasCache
+        ), mock.patch('builtins.print'):
+            cacheControl.deleteCache()
+            cacheControl.deleteCache()
+        self.assertFalse(any(os.path.exists(fileName) for fileName in owned))
+        self.assertTrue(all(os.path.exists(fileName) for fileName in other))
+
+
+def window(startHour: float, hours: float) -> tuple:
+    return (
+        'sp_phys','THD_L2_FGM',
+        start + timedelta(hours=startHour),start + timedelta(hours=startHour+hours),
+        ['BX_FGS-D'],
+    )
+
+
+class IntervalCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dataSets = simulateTHEMISdataSets(start,start + timedelta(days=2))
+        self.source = MemoryDataSource(self.dataSets)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertDataEqual(self, data, expected):
+        self.assertListEqual(sorted(data),sorted(expected))
+        for key in expected:
+            self.assertTrue(np.array_equal(data[key],expected[key]))
+
+    def test_slidingWindowsFetchGaps(self):
+        cache = IntervalCache(self.source,self.directory.name)
+        direct = MemoryDataSource(self.dataSets)
+        for i in range(6):
+            args = window(6*i,12)
+            self.assertDataEqual(cache.get_data(*args),direct.get_data(*args))
+        # The first window, then only the 6 hours not yet cached for each window
+        requested = [(r[2],r[3]) for r in self.source.requests]
+        self.assertListEqual(requested,[
+            (start + timedelta(hours=6*i + (6 if i else 0)),start + timedelta(hours=6*i + 12))
+            for i in range(6)
+        ])
+        self.assertEqual(cache.misses,1)
+        self.assertEqual(cache.partialHits,5)
+        # Compacted into one chunk
+        self.assertEqual(cache.statistics()['files'],1)
+
+    def test_subRangeServedFromCache(self):
+        cache = IntervalCache(self.source,self.directory.name)
+        cache.get_data(*window(0,12))
+        args = window(3.5,2)
+        self.assertDataEqual(cache.get_data(*args),MemoryDataSource(self.dataSets).get_data(*args))
+        self.assertEqual(len(self.source.requests),1)
+        self.assertEqual(cache.hits,1)
+
+    def test_gapBetweenChunks(self):
+        cache = IntervalCache(self.source,self.directory.name)
+        cache.get_data(*window(0,2))
+        cache.get_data(*window(4,2))
+        self.assertEqual(cache.statistics()['files'],2)
+        args = window(1,4)
+        self.assertDataEqual(cache.get_data(*args),MemoryDataSource(self.dataSets).get_data(*args))
+        self.assertEqual(self.source.requests[-1][2:4],(start + timedelta(hours=2),start + timedelta(hours=4)))
+        self.assertEqual(cache.statistics()['files'],1)
+
+    def test_emptyRangeNotRequestedAgain(self):
+        cache = IntervalCache(self.source,self.directory.name)
+        args = window(72,2)
+        for i in range(2):
+            with self.assertRaises(ValueError):
+                cache.get_data(*args)
+        self.assertEqual(len(self.source.requests),1)
+
+    def test_requestLargerThanCache(self):
+        # The chunks of the request are not evicted before being read
+        cache = IntervalCache(self.source,self.directory.name,maxBytes=1000)
+        direct = MemoryDataSource(self.dataSets)
+        for args in (window(0,24),window(0,6),window(30,6)):
+            self.assertDataEqual(cache.get_data(*args),direct.get_data(*args))
+        # Evicted for the third request, then requested again
+        self.assertEqual(cache.evictions,1)
+        self.assertDataEqual(cache.get_data(*window(3,6)),direct.get_data(*window(3,6)))
+        self.assertEqual(len(self.source.requests),3)
+
+    def test_compactionBounded(self):
+        # Each window is about 230kB, so at most three are merged into a chunk
+        cache = IntervalCache(self.source,self.directory.name,maxChunkBytes=800000)
+        for i in range(8):
+            cache.get_data(*window(6*i,6))
+        statistics = cache.statistics()
+        self.assertGreater(statistics['files'],1)
+        # Without the limit each window rewrites all of the previous windows, about 5x the size
+        self.assertLess(statistics['bytesWritten'],3 * statistics['size'])
+        for root, directories, names in os.walk(self.directory.name):
+            for name in names:
+                self.assertLessEqual(os.path.getsize(os.path.join(root,name)),800000)
+        args = window(3,42)
+        self.assertDataEqual(cache.get_data(*args),MemoryDataSource(self.dataSets).get_data(*args))
+        self.assertEqual(len(self.source.requests),8)
+
+    def test_missingDatasetNotCached(self):
+        cache = IntervalCache(self.source,self.directory.name)
+        self.assertIsNone(cache.get_data('sp_phys','THA_L2_FGM',start,start + timedelta(hours=1),[]))
+        self.assertEqual(cache.statistics()['files'],0)
+
+    def test_variablesCachedSeparately(self):
+        cache = IntervalCache(self.source,self.directory.name)
+        cache.get_data(*window(0,2))
+        args = window(0,2)[:4] + (['BY_FGS-D'],)
+        cache.get_data(*args)
+        self.assertEqual(len(self.source.requests),2)
+
+if __name__ == "__main__":
+    unittest.main()
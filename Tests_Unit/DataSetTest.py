@@ -0,0 +1,472 @@
+
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+from unittest import mock
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from numpyUnitTestCase import numpyunittest_TestCase
+from magSonify.TimeSeries import TimeSeries, generateTimeSeries
+from magSonify.DataSet import DataSet, DataSet_3D
+from magSonify.DataSet_1D import DataSet_1D
+from magSonify.LazyDataSet import LazyDataSet
+from magSonify.Audio import writeoutAudio
+import soundfile
+
+
+class DataSetTest(numpyunittest_TestCase):
+    def initialise(self):
+        # One sample every 36 s
+        ts = generateTimeSeries(
+            datetime(2020,4,2),
+            datetime(2020,4,2,1),
+            spacing=np.timedelta64(36,'s')
+        )
+        n = len(ts)
+        data = {
+            0: np.arange(n,dtype=np.float64),
+            1: np.sin(np.arange(n)),
+            2: np.cos(np.arange(n)),
+            'radius': np.linspace(1,10,n),
+        }
+        return DataSet_3D(ts,data)
+
+    def test_sliceTime(self):
+        dataSet = self.initialise()
+        window = dataSet.sliceTime(datetime(2020,4,2,0,0,36),datetime(2020,4,2,0,3))
+        self.assertEqual(len(window.timeSeries),5)
+        self.assertNumpyClose(window.data[0],np.arange(1,6,dtype=np.float64))
+        self.assertEqual(window.timeSeries.getStart(),np.datetime64(datetime(2020,4,2,0,0,36)))
+        self.assertTrue(np.shares_memory(window.data[0],dataSet.data[0]))
+
+    def test_sliceIsView(self):
+        dataSet = self.initialise()
+        window = dataSet[10:20:2]
+        self.assertIsInstance(window,DataSet_3D)
+        self.assertEqual(len(window.timeSeries),5)
+        self.assertEqual(len(window.data['radius']),5)
+        self.assertTrue(np.shares_memory(window.timeSeries.times,dataSet.timeSeries.times))
+        self.assertTrue(np.all(
+            window.timeSeries.asDatetime() == dataSet.timeSeries.asDatetime()[10:20:2]
+        ))
+        self.assertEqual(len(dataSet[20:10].timeSeries),0)
+
+    def test_fillNaNOfView(self):
+        dataSet = self.initialise()
+        dataSet.data[0][12] = np.nan
+        window = dataSet[10:20]
+        window.fillNaN(-1)
+        self.assertEqual(window.data[0][2],-1)
+        self.assertTrue(np.isnan(dataSet.data[0][12]))
+        dataSet[10:20].fillNaN(-1,inPlace=True)
+        self.assertEqual(dataSet.data[0][12],-1)
+
+    def test_arithmetic(self):
+        dataSet = self.initialise()
+        result = 2 * (dataSet + dataSet) / 4 - dataSet
+        for key in dataSet.keys():
+            self.assertNumpyClose(result.data[key],np.zeros_like(dataSet.data[key]))
+        self.assertNumpyClose((1 - dataSet).data[1],1 - dataSet.data[1])
+        self.assertNumpyClose((np.float64(3) * dataSet).data[2],3 * dataSet.data[2])
+
+    def test_inPlaceArithmetic(self):
+        dataSet = self.initialise()
+        expected = dataSet.data[1] * 3 - dataSet.data[1] + 1
+        other = dataSet.copy()
+        component = dataSet.data[1]
+        dataSet *= 3
+        dataSet -= other
+        dataSet += 1
+        self.assertIs(dataSet.data[1],component)
+        self.assertNumpyClose(dataSet.data[1],expected)
+        dataSet /= dataSet
+        self.assertNumpyClose(dataSet.data['radius'],np.ones(len(dataSet.timeSeries)))
+
+    def test_runningAverage(self):
+        dataSet = self.initialise() # 101 samples, component 0 is arange
+        mean = dataSet.runningAverage(samples=5)
+        self.assertTrue(np.all(np.isnan(mean.data[0][:2])))
+        self.assertTrue(np.all(np.isnan(mean.data[0][-2:])))
+        self.assertNumpyClose(mean.data[0][2:-2],np.arange(2,99,dtype=np.float64))
+        meanTime = dataSet.runningAverage(timeWindow=np.timedelta64(180,'s'))
+        self.assertNumpyClose(meanTime.data[0][3:-3],mean.data[0][3:-3])
+
+    def test_runningAverageNaNAndEdges(self):
+        dataSet = self.initialise()
+        dataSet.data[0][50] = np.nan
+        mean, counts = dataSet.runningAverage(samples=5,shrinkEdges=True,returnCounts=True)
+        self.assertFalse(np.any(np.isnan(mean.data[0])))
+        self.assertAlmostEqual(mean.data[0][0],1)
+        self.assertAlmostEqual(mean.data[0][50],50)
+        self.assertAlmostEqual(mean.data[0][49],(47+48+49+51)/4)
+        self.assertListEqual(list(counts.data[0][:3]),[3,4,5])
+        self.assertListEqual(list(counts.data[0][47:54]),[5,4,4,4,4,4,5])
+
+    def test_meanFieldAlignedTransform(self):
+        field = self.initialise()
+        meanField = field.runningAverage(samples=5,shrinkEdges=True) + 10
+        position = field.copy()
+        position.data[0] = position.data[0] + 3
+
+        fieldUnitVector = meanField.copy()
+        fieldUnitVector.makeUnitVector()
+        earthUnitVector = -position
+        earthUnitVector.makeUnitVector()
+        polUnitVector = fieldUnitVector.cross(earthUnitVector)
+        polUnitVector.makeUnitVector()
+        torUnitVector = fieldUnitVector.cross(polUnitVector)
+        torUnitVector.makeUnitVector()
+        expected = field.coordinateTransform(fieldUnitVector,polUnitVector,torUnitVector)
+
+        result = field.meanFieldAlignedTransform(meanField,position)
+        for i in (0,1,2):
+            self.assertNumpyClose(result.data[i],expected.data[i])
+        field.meanFieldAlignedTransform(meanField,position,out=field)
+        for i in (0,1,2):
+            self.assertNumpyClose(field.data[i],expected.data[i])
+
+    def test_clean(self):
+        dataSet = self.initialise()
+        dataSet.data[0][[3,7]] = np.nan
+        dataSet.data['radius'][4] = np.nan
+        flags = np.zeros(len(dataSet.timeSeries),dtype=bool)
+        flags[[1,7,90]] = True
+        counts = dataSet.clean(maxAbsoluteValue=50,fillNaNValue=-100,flags=flags,blockSize=8)
+        # Data set has 4 components, 0 is arange, 101 samples
+        self.assertDictEqual(counts,{'nan': 3, 'clipped': 3 + 50, 'flagged': 3 * 4})
+        self.assertEqual(dataSet.data[0][3],-50)
+        self.assertEqual(dataSet.data['radius'][4],-50)
+        self.assertEqual(dataSet.data[0][7],0)
+        self.assertEqual(dataSet.data[0][90],0)
+        self.assertEqual(dataSet.data[0][80],50)
+        self.assertEqual(dataSet.data[0][20],20)
+
+    def _dataSetWithTimes(self,times):
+        times = np.array(times,dtype=np.float64)
+        return DataSet(TimeSeries(times),{0: times * 10, 'a': -times})
+
+    def test_removeDuplicateTimesNoDuplicates(self):
+        dataSet = self._dataSetWithTimes([0,1,2,3])
+        component = dataSet.data[0]
+        dataSet.removeDuplicateTimes()
+        self.assertIs(dataSet.data[0],component)
+
+    def test_removeDuplicateTimes(self):
+        for times, duplicate in (([0,1,1,2,3,3,3,4],2), ([0,2,1,1,3,4,3,3],3)):
+            dataSet = self._dataSetWithTimes(times)
+            dataSet.data[0][duplicate] = -1 # Second occurence of 1, should be removed
+            dataSet.removeDuplicateTimes()
+            self.assertNumpyClose(dataSet.timeSeries.times,np.arange(5,dtype=np.float64))
+            self.assertNumpyClose(dataSet.data[0],np.arange(5) * 10.)
+            self.assertNumpyClose(dataSet.data['a'],-np.arange(5.))
+
+
+class SaveLoadTest(numpyunittest_TestCase):
+    initialise = DataSetTest.initialise
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_saveLoad(self):
+        dataSet = self.initialise()
+        dataSet.save(self.directory.name)
+        for mmapMode in ('c',None):
+            loaded = DataSet.load(self.directory.name,mmapMode)
+            self.assertIsInstance(loaded,DataSet_3D)
+            self.assertEqual(loaded.timeSeries.startTime,dataSet.timeSeries.startTime)
+            self.assertEqual(loaded.timeSeries.timeUnit,dataSet.timeSeries.timeUnit)
+            self.assertTrue(loaded.timeSeries == dataSet.timeSeries)
+            self.assertListEqual(list(loaded.keys()),list(dataSet.keys()))
+            for i in dataSet.keys():
+                self.assertEqual(isinstance(loaded.data[i],np.memmap),mmapMode is not None)
+                self.assertNumpyClose(loaded.data[i],dataSet.data[i])
+
+    def test_loadIsCopyOnWrite(self):
+        dataSet = self.initialise()
+        dataSet.save(self.directory.name)
+        loaded = DataSet.load(self.directory.name)
+        loaded -= 1
+        loaded.save(self.directory.name)
+        self.assertNumpyClose(loaded.data[0],dataSet.data[0] - 1)
+        self.assertNumpyClose(DataSet.load(self.directory.name).data[0],dataSet.data[0] - 1)
+
+    def test_saveInvalidKey(self):
+        dataSet = DataSet(TimeSeries(np.arange(3.)),{(0,1): np.zeros(3)})
+        with self.assertRaises(TypeError):
+            dataSet.save(self.directory.name)
+
+
+class LazyDataSetTest(numpyunittest_TestCase):
+    initialise = DataSetTest.initialise
+    # Chunks smaller than the data set and the running average windows
+    chunkSize = 16
+
+    def test_lazyArithmetic(self):
+        dataSet = self.initialise()
+        expected = -(dataSet * 2 - 1) / 4
+        result = (-(dataSet.lazy() * 2 - 1) / 4).evaluate(self.chunkSize)
+        self.assertIsInstance(result,DataSet_3D)
+        for i in dataSet.keys():
+            self.assertNumpyClose(result.data[i],expected.data[i])
+
+    def test_lazyDoesNotModifyInput(self):
+        dataSet = self.initialise()
+        dataSet.lazy().constrainAbsoluteValue(5).fillNaN().evaluate(self.chunkSize)
+        self.assertNumpyClose(dataSet.data[0],np.arange(101,dtype=np.float64))
+
+    def test_lazyRunningAverage(self):
+        dataSet = self.initialise()
+        dataSet.data[0][50] = np.nan
+        for kwargs in (
+            {'samples': 5},
+            {'samples': 5, 'shrinkEdges': True},
+            {'timeWindow': np.timedelta64(15,'m')},
+        ):
+            expected = dataSet.runningAverage(**kwargs)
+            result = dataSet.lazy().runningAverage(**kwargs).evaluate(self.chunkSize)
+            for i in dataSet.keys():
+                np.testing.assert_allclose(result.data[i],expected.data[i],equal_nan=True)
+
+    def test_lazyMeanFieldAlignedTransform(self):
+        field = self.initialise()
+        flags = np.zeros(len(field.timeSeries),dtype=bool)
+        flags[40:45] = True
+
+        meanField = field.runningAverage(samples=5,shrinkEdges=True) + 10
+        expectedField = field - meanField
+        expectedField.fillFlagged(flags)
+        expected = expectedField.meanFieldAlignedTransform(meanField,field)
+
+        lazyField = field.lazy()
+        lazyMeanField = lazyField.runningAverage(samples=5,shrinkEdges=True) + 10
+        lazyField = (lazyField - lazyMeanField).fillFlagged(flags)
+        resultMeanField, result = LazyDataSet.evaluateMany(
+            (lazyMeanField,lazyField.meanFieldAlignedTransform(lazyMeanField,field)),
+            self.chunkSize
+        )
+        for i in (0,1,2):
+            self.assertNumpyClose(resultMeanField.data[i],meanField.data[i])
+            self.assertNumpyClose(result.data[i],expected.data[i])
+
+    def test_lazyDifferentTimeSeries(self):
+        dataSet = self.initialise()
+        other = dataSet.sliceTime(datetime(2020,4,2),datetime(2020,4,2,0,30))
+        with self.assertRaises(ValueError):
+            dataSet.lazy() + other
+
+
+class MemmapDataSetTest(numpyunittest_TestCase):
+    initialise = DataSetTest.initialise
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Blocks smaller than the data set
+        self.blockSize = mock.patch.object(DataSet,'memmapBlockSize',16)
+        self.blockSize.start()
+
+    def tearDown(self):
+        self.blockSize.stop()
+        self.directory.cleanup()
+
+    def initialiseMemmap(self):
+        dataSet = self.initialise()
+        dataSet.toMemmap(self.directory.name)
+        return dataSet
+
+    def test_toMemmap(self):
+        dataSet = self.initialiseMemmap()
+        expected = self.initialise()
+        for i in dataSet.keys():
+            self.assertIsInstance(dataSet.data[i],np.memmap)
+            self.assertNumpyClose(dataSet.data[i],expected.data[i])
+
+    def test_memmapArithmetic(self):
+        dataSet = self.initialiseMemmap()
+        reference = self.initialise()
+        result = -(dataSet * 2 - reference) / 4
+        expected = -(reference * 2 - reference) / 4
+        for i in dataSet.keys():
+            self.assertIsInstance(result.data[i],np.memmap)
+            self.assertNumpyClose(result.data[i],expected.data[i])
+        component = dataSet.data[0]
+        dataSet += 1
+        self.assertIs(dataSet.data[0],component)
+        self.assertNumpyClose(dataSet.data[0],reference.data[0] + 1)
+
+    def test_memmapSliceAndCopy(self):
+        dataSet = self.initialiseMemmap()
+        window = dataSet[10:50]
+        self.assertIsInstance(window.data[0],np.memmap)
+        window.data[0][0] = -1
+        self.assertEqual(dataSet.data[0][10],-1)
+        copy = dataSet.copy()
+        self.assertIsInstance(copy.data[0],np.memmap)
+        copy.data[0][10] = 5
+        self.assertEqual(dataSet.data[0][10],-1)
+
+    def test_memmapNormaliseAndPaulStretch(self):
+        x = np.sin(np.arange(5000) / 10)
+        ts = generateTimeSeries(datetime(2020,4,2),datetime(2020,4,2,0,0,1),number=5000)
+        inMemory = DataSet_1D(ts,x.copy())
+        memmapped = DataSet_1D(ts,x.copy())
+        memmapped.toMemmap(self.directory.name)
+        for dataSet in (inMemory,memmapped):
+            np.random.seed(0)
+            dataSet.paulStretch(4,window=0.001)
+            dataSet.normalise()
+        self.assertIsInstance(memmapped.x,np.memmap)
+        self.assertNumpyClose(memmapped.x,inMemory.x)
+        self.assertEqual(len(memmapped.timeSeries),len(memmapped.x))
+
+    def test_memmapPaulStretchTimeSeries(self):
+        x = np.sin(np.arange(5000) / 10)
+        dataSets = []
+        for i in range(2):
+            ts = generateTimeSeries(datetime(2020,4,2),datetime(2020,4,2,0,0,1),number=5000)
+            dataSets.append(DataSet_1D(ts,x.copy()))
+        inMemory, memmapped = dataSets
+        memmapped.toMemmap(self.directory.name)
+        for dataSet in dataSets:
+            dataSet.paulStretch(16,window=0.001)
+        # The stretched times are not held in memory
+        self.assertIsInstance(memmapped.timeSeries.times,np.memmap)
+        self.assertEqual(len(memmapped.timeSeries),len(memmapped.x))
+        self.assertTrue(np.allclose(memmapped.timeSeries.times,inMemory.timeSeries.times))
+        self.assertEqual(memmapped.timeSeries.times[-1],inMemory.timeSeries.times[-1])
+
+    def test_memmapVectorMethods(self):
+        dataSet = self.initialiseMemmap()
+        reference = self.initialise()
+        self.assertNumpyClose(dataSet.norm().x,reference.norm().x)
+        self.assertNumpyClose(dataSet.vectors,reference.vectors)
+        dataSet.makeUnitVector()
+        reference.makeUnitVector()
+        for i in (0,1,2):
+            # Normalised in the files, not loaded into memory
+            self.assertIsInstance(dataSet.data[i],np.memmap)
+            self.assertNumpyClose(dataSet.data[i],reference.data[i])
+
+    def test_writeoutAudio(self):
+        audio = np.linspace(-2,2,101)
+        audio[50] = np.nan
+        file = f"{self.directory.name}/test.wav"
+        writeoutAudio(audio,file,blockSize=16)
+        written, sampleRate = soundfile.read(file)
+        expected = np.clip(np.nan_to_num(audio),-1,1)
+        self.assertEqual(sampleRate,44100)
+        self.assertTrue(np.allclose(written,expected,atol=1e-4))
+
+
+class DataSet3DVectorTest(numpyunittest_TestCase):
+    def initialise(self,seed=0):
+        ts = generateTimeSeries(
+            datetime(2020,4,2),
+            datetime(2020,4,2,1),
+            spacing=np.timedelta64(36,'s')
+        )
+        rng = np.random.default_rng(seed)
+        data = dict(enumerate(rng.normal(0,10,(3,len(ts)))))
+        data['radius'] = np.linspace(1,10,len(ts))
+        return DataSet_3D(ts,data)
+
+    def test_vectorsIsView(self):
+        dataSet = self.initialise()
+        vectors = dataSet.vectors
+        vectors[5,1] = 100
+        self.assertNotEqual(dataSet.data[1][5],100)
+        dataSet.stackVectors()
+        vectors = dataSet.vectors
+        self.assertTupleEqual(vectors.shape,(len(dataSet.timeSeries),3))
+        vectors[5,1] = 100
+        self.assertEqual(dataSet.data[1][5],100)
+        self.assertTrue(np.shares_memory(dataSet.vectors,vectors))
+
+    def test_cross(self):
+        a = self.initialise(0)
+        b = self.initialise(1)
+        res = a.cross(b)
+        self.assertNumpyClose(res.vectors,np.cross(a.vectors,b.vectors))
+        self.assertNumpyClose(b.cross(a).vectors,-res.vectors)
+        self.assertNumpyClose(res.dot(a).x,np.zeros(len(a.timeSeries)))
+        self.assertNumpyClose(res.dot(b).x,np.zeros(len(a.timeSeries)))
+
+    def test_crossOfBasisVectors(self):
+        ts = self.initialise().timeSeries
+        n = len(ts)
+        x, y, z = (
+            DataSet_3D(ts,{i: np.full(n,float(i == j)) for i in (0,1,2)}) for j in (0,1,2)
+        )
+        self.assertNumpyClose(x.cross(y).vectors,z.vectors)
+        self.assertNumpyClose(y.cross(z).vectors,x.vectors)
+        self.assertNumpyClose(z.cross(x).vectors,y.vectors)
+
+    def test_dotAndNorm(self):
+        a = self.initialise(0)
+        b = self.initialise(1)
+        self.assertNumpyClose(a.dot(b).x,np.sum(a.vectors * b.vectors,axis=1))
+        self.assertNumpyClose(a.norm().x,np.linalg.norm(a.vectors,axis=1))
+
+    def test_argumentsNotModified(self):
+        a = self.initialise(0)
+        b = self.initialise(1)
+        components = [b.data[i] for i in (0,1,2)]
+        a.cross(b)
+        a.dot(b)
+        a.coordinateTransform(b,b,b)
+        a.meanFieldAlignedTransform(b,b)
+        for i in (0,1,2):
+            self.assertIs(b.data[i],components[i])
+
+    def test_readOnlyMethodsKeepComponents(self):
+        dataSet = self.initialise()
+        n = len(dataSet.timeSeries)
+        components = {i: np.arange(n,dtype=np.int32) + i for i in (0,1,2)}
+        dataSet = DataSet_3D(dataSet.timeSeries,components)
+        other = self.initialise(1)
+        dataSet.vectors
+        dataSet.norm()
+        dataSet.cross(other)
+        dataSet.dot(other)
+        dataSet.coordinateTransform(other,other,other)
+        for i in (0,1,2):
+            self.assertIs(dataSet.data[i],components[i])
+        components[0][3] = -1
+        self.assertEqual(dataSet.data[0][3],-1)
+        # Stacked on request, keeping the dtype
+        dataSet.stackVectors()
+        self.assertEqual(dataSet.data[0].dtype,np.int32)
+        self.assertIs(dataSet.data[0].base,dataSet.data[2].base)
+        self.assertNumpyClose(dataSet.norm().x,np.linalg.norm(dataSet.vectors,axis=1))
+
+    def test_makeUnitVector(self):
+        dataSet = self.initialise()
+        radius = dataSet.data['radius'].copy()
+        direction = dataSet.vectors / np.linalg.norm(dataSet.vectors,axis=1)[:,np.newaxis]
+        dataSet.makeUnitVector()
+        self.assertNumpyClose(dataSet.norm().x,np.ones(len(dataSet.timeSeries)))
+        self.assertNumpyClose(dataSet.vectors,direction)
+        self.assertNumpyClose(dataSet.data['radius'],radius)
+
+    def test_coordinateTransform(self):
+        dataSet = self.initialise()
+        ts = dataSet.timeSeries
+        n = len(ts)
+        # Rotation by 90 degrees about the z axis
+        xBasis = DataSet_3D(ts,{0: np.zeros(n), 1: np.ones(n), 2: np.zeros(n)})
+        yBasis = DataSet_3D(ts,{0: -np.ones(n), 1: np.zeros(n), 2: np.zeros(n)})
+        zBasis = DataSet_3D(ts,{0: np.zeros(n), 1: np.zeros(n), 2: np.ones(n)})
+        res = dataSet.coordinateTransform(xBasis,yBasis,zBasis)
+        self.assertNumpyClose(res.data[0],dataSet.data[1])
+        self.assertNumpyClose(res.data[1],-dataSet.data[0])
+        self.assertNumpyClose(res.data[2],dataSet.data[2])
+        self.assertNumpyClose(res.norm().x,dataSet.norm().x)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import os
+import pickle
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from magSonify.MagnetometerData import THEMISdata
+from magSonify.DataSource import LocalDataSource, MemoryDataSource, simulateTHEMISdataSets
+try:
+    import cdflib
+    from cdflib.cdfwrite import CDF as CDFWriter
+except ImportError:
+    cdflib = None
+
+start = datetime(2007,9,4)
+end = datetime(2007,9,5)
+
+
+class DataSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dataSets = simulateTHEMISdataSets(start,end,"D")
+        self.memory = MemoryDataSource(self.dataSets)
+        self.local = LocalDataSource(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memoryDataSource(self):
+        data = self.memory.get_data(
+            'sp_phys','THD_L2_FGM',datetime(2007,9,4,6),datetime(2007,9,4,7),[]
+        )
+        self.assertEqual(data["UT"][0],np.datetime64(datetime(2007,9,4,6)))
+        self.assertEqual(data["UT"][-1],np.datetime64(datetime(2007,9,4,7)))
+        self.assertIsNone(self.memory.get_data('sp_phys','THA_L2_FGM',start,end,[]))
+        with self.assertRaises(ValueError):
+            self.memory.get_data('sp_phys','THD_L2_FGM',datetime(2008,1,1),datetime(2008,1,2),[])
+        self.assertEqual(len(pickle.loads(pickle.dumps(self.memory)).requests),3)
+
+    def test_mirrorAndImport(self):
+        # Mirrored in two halves, overlapping at midday
+        events = [(start,datetime(2007,9,4,12),"D"),(datetime(2007,9,4,12),end,"D")]
+        self.local.mirror(self.memory,THEMISdata,events)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory.name,"THD_L2_FGM"))),2)
+
+        fromMemory = THEMISdata()
+        fromMemory.dataSource = self.memory
+        fromMemory.importCDAS(datetime(2007,9,4,10),datetime(2007,9,4,14),"D")
+        fromLocal = THEMISdata()
+        fromLocal.dataSource = self.local
+        fromLocal.importCDAS(datetime(2007,9,4,10),datetime(2007,9,4,14),"D")
+        for name in ('magneticField','position','peemIdentifyMagnetosheath'):
+            expected, actual = getattr(fromMemory,name), getattr(fromLocal,name)
+            self.assertEqual(expected.timeSeries,actual.timeSeries)
+            for key in expected.keys():
+                self.assertTrue(np.array_equal(expected.data[key],actual.data[key]))
+
+    def test_onlyOverlappingFilesRead(self):
+        self.local.mirror(self.memory,THEMISdata,[(start,datetime(2007,9,4,12),"D")])
+        # A corrupt file outside the requested range is not read
+        fileName = os.path.join(self.directory.name,"THD_L2_FGM","20070901T000000--20070902T000000.npz")
+        with open(fileName,"w") as file:
+            file.write("Not an npz file")
+        data = self.local.get_data('sp_phys','THD_L2_FGM',start,datetime(2007,9,4,1),[])
+        self.assertEqual(len(data["UT"]),1201)
+        with self.assertRaises(ValueError):
+            self.local.get_data('sp_phys','THD_L2_FGM',datetime(2007,9,6),datetime(2007,9,7),[])
+        self.assertIsNone(self.local.get_data('sp_phys','THA_L2_FGM',start,end,[]))
+
+    def test_writeDatetimeObjects(self):
+        # ai.cdas returns times as datetime objects
+        data = {
+            "UT": np.array([datetime(2007,9,4,0,0,s) for s in range(3)],dtype=object),
+            "BX": np.arange(3.),
+        }
+        fileName = self.local.write("TEST",data)
+        self.assertEqual(os.path.basename(fileName),"20070904T000000--20070904T000002.npz")
+        read = self.local.get_data('sp_phys','TEST',start,end,[])
+        self.assertEqual(read["UT"].dtype.kind,'M')
+        self.assertTrue(np.array_equal(read["BX"],data["BX"]))
+
+
+@unittest.skipIf(cdflib is None,"cdflib is not installed")
+class CdfTest(unittest.TestCase):
+    """Reads a CDF laid out as THEMIS L2 FGM, with times as unix seconds"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.directory.name,"THD_L2_FGM"))
+        unixStart = (np.datetime64(start) - np.datetime64(0,'s')) / np.timedelta64(1,'s')
+        # fgs at 3s for the day, fgl at 1s from 06:00 to 07:00
+        self.fgsTime = unixStart + np.arange(0,86400,3.)
+        self.fglTime = unixStart + 6 * 3600 + np.arange(0,3600,1.)
+        rng = np.random.default_rng(0)
+        self.fgs = rng.normal(0,5,(len(self.fgsTime),3))
+        self.fgl = rng.normal(0,5,(len(self.fglTime),3))
+        writer = CDFWriter(
+            os.path.join(self.directory.name,"THD_L2_FGM","thd_l2_fgm_20070904_v01.cdf"),
+            cdf_spec={'Compressed': False},
+        )
+        for name, values, timeName in (
+            ("thd_fgs_time",self.fgsTime,None),
+            ("thd_fgs_gsm",self.fgs,"thd_fgs_time"),
+            ("thd_fgl_time",self.fglTime,None),
+            ("thd_fgl_gsm",self.fgl,"thd_fgl_time"),
+            ("thd_fgh_gsm",self.fgl,"thd_fgl_time"),
+        ):
+            writer.write_var(
+                {
+                    'Variable': name,
+                    'Data_Type': CDFWriter.CDF_DOUBLE,
+                    'Num_Elements': 1,
+                    'Rec_Vary': True,
+                    'Dim_Sizes': list(values.shape[1:]),
+                },
+                var_attrs={} if timeName is None else {'DEPEND_0': timeName},
+                var_data=values,
+            )
+        writer.close()
+        self.local = LocalDataSource(self.directory.name,{'THD_L2_FGM': {
+            'thd_fgs_time': 'UT', 'thd_fgs_gsm': ('BX_FGS-D','BY_FGS-D','BZ_FGS-D'),
+        }})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_timesSelectedPerVariable(self):
+        data = self.local.get_data(
+            'sp_phys','THD_L2_FGM',datetime(2007,9,4,6,30),datetime(2007,9,4,8),['thd_fgl_gsm']
+        )
+        self.assertSetEqual(
+            set(data),{'UT','BX_FGS-D','BY_FGS-D','BZ_FGS-D','thd_fgl_time','thd_fgl_gsm'}
+        )
+        # Unix seconds converted to datetime64
+        self.assertEqual(data['UT'][0],np.datetime64(datetime(2007,9,4,6,30)))
+        self.assertEqual(data['UT'][-1],np.datetime64(datetime(2007,9,4,8)))
+        self.assertTrue(np.array_equal(data['BY_FGS-D'],self.fgs[7800:9601,1]))
+        self.assertEqual(data['thd_fgl_time'][-1],np.datetime64(datetime(2007,9,4,6,59,59)))
+        self.assertTrue(np.array_equal(data['thd_fgl_gsm'],self.fgl[1800:]))
+
+    def test_variableWithoutDataInRange(self):
+        data = self.local.get_data(
+            'sp_phys','THD_L2_FGM',datetime(2007,9,4,10),datetime(2007,9,4,11),['thd_fgl_gsm']
+        )
+        self.assertNotIn('thd_fgl_gsm',data)
+        self.assertEqual(len(data['UT']),1201)
+        with self.assertRaises(ValueError):
+            self.local.get_data(
+                'sp_phys','THD_L2_FGM',datetime(2007,9,6),datetime(2007,9,7),['thd_fgl_gsm']
+            )
+
+if __name__ == "__main__":
+    unittest.main()
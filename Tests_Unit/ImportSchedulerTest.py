@@ -0,0 +1,92 @@
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+from datetime import datetime
+
+import numpy as np
+from magSonify.MagnetometerData import THEMISdata
+from magSonify.ImportScheduler import ImportScheduler
+from magSonify.DataSource import MemoryDataSource, simulateTHEMISdataSets
+
+start = datetime(2007,9,4)
+end = datetime(2007,9,4,12)
+cdasArgs = ('sp_phys','THD_L2_FGM',start,end,['thd_fgs_gsmQ'])
+
+
+class ImportSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.dataSets = simulateTHEMISdataSets(start,end,"D")
+
+    def test_retry(self):
+        dataSource = MemoryDataSource(self.dataSets,failures=2)
+        scheduler = ImportScheduler(retries=3,backoff=0,dataSource=dataSource)
+        data = scheduler.get(cdasArgs)
+        self.assertEqual(len(data["UT"]),len(self.dataSets["THD_L2_FGM"]["UT"]))
+        self.assertEqual(len(dataSource.requests),3)
+
+    def test_retriesExhausted(self):
+        dataSource = MemoryDataSource(self.dataSets,failures=3)
+        scheduler = ImportScheduler(retries=2,backoff=0,dataSource=dataSource)
+        with self.assertRaises(ConnectionError):
+            scheduler.get(cdasArgs)
+        self.assertEqual(len(dataSource.requests),3)
+        self.assertEqual(scheduler.pending(),0)
+
+    def test_missingDataNotRetried(self):
+        dataSource = MemoryDataSource(self.dataSets)
+        scheduler = ImportScheduler(backoff=0,dataSource=dataSource)
+        with self.assertRaises(ValueError):
+            scheduler.get(('sp_phys','THD_L2_FGM',datetime(2008,1,1),datetime(2008,1,2),[]))
+        self.assertEqual(len(dataSource.requests),1)
+
+    def test_deduplicate(self):
+        dataSource = MemoryDataSource(self.dataSets,delay=0.05)
+        scheduler = ImportScheduler(dataSource=dataSource)
+        first = scheduler.request(cdasArgs)
+        second = scheduler.request(list(cdasArgs))
+        self.assertIs(first,second)
+        scheduler.get(cdasArgs)
+        self.assertEqual(len(dataSource.requests),1)
+        self.assertEqual(scheduler.pending(),0)
+
+    def test_importTHEMISdata(self):
+        dataSource = MemoryDataSource(self.dataSets)
+        mag = THEMISdata()
+        mag.importScheduler = ImportScheduler(dataSource=dataSource)
+        mag.importCDAS(start,end,"D")
+        self.assertEqual(len(dataSource.requests),3)
+        for dataSet in (mag.magneticField, mag.position, mag.peemIdentifyMagnetosheath):
+            self.assertEqual(len(dataSet.timeSeries),len(self.dataSets["THD_L2_FGM"]["UT"]))
+        self.assertTrue(np.array_equal(
+            mag.magneticField.data[0],self.dataSets["THD_L2_FGM"]["BX_FGS-D"]
+        ))
+        mag.defaultProcessing()
+        self.assertEqual(len(mag.magneticFieldMeanFieldCoordinates.keys()),3)
+
+    def test_prefetch(self):
+        events = [(start,datetime(2007,9,4,6),"D"),(datetime(2007,9,4,6),end,"D")]
+        dataSource = MemoryDataSource(self.dataSets)
+        scheduler = ImportScheduler(dataSource=dataSource)
+        scheduler.prefetch(THEMISdata,events)
+        self.assertEqual(scheduler.pending(),6)
+        for event in events:
+            mag = THEMISdata()
+            mag.importScheduler = scheduler
+            mag.importCDAS(*event)
+            self.assertEqual(mag.magneticField.timeSeries.startTime,np.datetime64(event[0]))
+        self.assertEqual(len(dataSource.requests),6)
+        self.assertEqual(scheduler.pending(),0)
+
+    def test_failedImportLeavesNone(self):
+        del self.dataSets["THD_L2_MOM"]
+        dataSource = MemoryDataSource(self.dataSets)
+        mag = THEMISdata()
+        mag.importScheduler = ImportScheduler(dataSource=dataSource)
+        mag.importCDAS(start,end,"D")
+        self.assertIsNone(mag.peemIdentifyMagnetosheath)
+        self.assertIsNotNone(mag.magneticField)
+
+if __name__ == "__main__":
+    unittest.main()
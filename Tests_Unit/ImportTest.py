@@ -0,0 +1,66 @@
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import os
+import subprocess
+import sys
+
+import magSonify
+
+SLOW_MODULES = ("ai.cdas", "audiotsm", "soundfile", "scipy.interpolate", "scipy.signal")
+
+def importedModules(statement: str) -> set:
+    """Returns the names of the modules imported after running ``statement`` in a new 
+    interpreter"""
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", f"{statement}\nimport sys\nprint(' '.join(sys.modules))"],
+        capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": repository},
+    )
+    return set(result.stdout.split())
+
+class LazyImportTest(unittest.TestCase):
+    def test_publicNames(self):
+        from magSonify.MagnetometerData import THEMISdata
+        self.assertIs(magSonify.THEMISdata,THEMISdata)
+        # Importing THEMISdata imports the modules named as classes, eg. TimeSeries and DataSet
+        for name in magSonify.__all__:
+            self.assertTrue(callable(getattr(magSonify,name)))
+            self.assertIn(name,dir(magSonify))
+            if name[0].isupper():
+                self.assertIsInstance(getattr(magSonify,name),type)
+        with self.assertRaises(AttributeError):
+            magSonify.NotAName
+
+    def test_namesNotHiddenBySubmodules(self):
+        # In a new interpreter, as the import of a submodule sets it as an attribute of the package
+        importedModules(
+            "import magSonify.TimeSeries, magSonify.LazyDataSet\n"
+            "from magSonify import THEMISdata, TimeSeries, DataSet, DataSet_3D, LazyDataSet\n"
+            "assert all(isinstance(c,type) for c in (TimeSeries,DataSet,DataSet_3D,LazyDataSet))\n"
+            "from magSonify import *\n"
+            "assert all(isinstance(c,type) for c in (MagnetometerData,SimulateData,DataSet_1D))"
+        )
+
+    def test_slowModulesNotImported(self):
+        for statement in (
+            "import magSonify",
+            "from magSonify import TimeSeries, SimulateData",
+            "from magSonify import THEMISdata, DataSet_1D",
+            "from magSonify.Buffering import startPipeline",
+        ):
+            with self.subTest(statement=statement):
+                modules = importedModules(statement)
+                self.assertIn("magSonify",modules)
+                self.assertSetEqual(modules & set(SLOW_MODULES),set())
+
+    @unittest.skipIf(magSonify.CACHING_ENABLED,"Enabling caching imports the data sources")
+    def test_importOnlyPackage(self):
+        modules = importedModules("import magSonify")
+        self.assertNotIn("numpy",modules)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+from numpyUnitTestCase import numpyunittest_TestCase
+from magSonify.TimeSeries import generateTimeSeries
+from magSonify.DataSet import DataSet_3D
+from magSonify.DataSet_1D import DataSet_1D
+from magSonify.MagnetometerData import THEMISdata
+from magSonify.DataSource import MemoryDataSource, simulateTHEMISdataSets
+
+
+class MagnetometerDataTest(numpyunittest_TestCase):
+    def initialise(self):
+        ts = generateTimeSeries(
+            datetime(2020,4,2),
+            datetime(2020,4,2,1),
+            spacing=np.timedelta64(3,'s')
+        )
+        n = len(ts)
+        mag = THEMISdata()
+        mag.magneticField = DataSet_3D(ts,{i: np.sin(np.arange(n) / (i + 1)) for i in (0,1,2)})
+        mag.position = DataSet_3D(ts,{
+            0: np.full(n,5.), 1: np.ones(n), 2: np.zeros(n), 'radius': np.full(n,5.)
+        })
+        mag.meanField = DataSet_1D(ts,np.arange(n,dtype=np.float64))
+        return mag
+
+    def test_saveLoad(self):
+        mag = self.initialise()
+        with tempfile.TemporaryDirectory() as directory:
+            mag.save(directory)
+            loaded = THEMISdata.load(directory)
+            self.assertIsInstance(loaded,THEMISdata)
+            self.assertIsNone(loaded.magneticFieldMeanFieldCoordinates)
+            self.assertIsNone(loaded.peemIdentifyMagnetosheath)
+            self.assertIsInstance(loaded.meanField,DataSet_1D)
+            for name in ('magneticField','position','meanField'):
+                dataSet = getattr(mag,name)
+                loadedDataSet = getattr(loaded,name)
+                self.assertTrue(loadedDataSet.timeSeries == dataSet.timeSeries)
+                for i in dataSet.keys():
+                    self.assertNumpyClose(loadedDataSet.data[i],dataSet.data[i])
+            # Release the memory mapped files before the directory is removed
+            del loaded, loadedDataSet
+
+
+class BulkImportTest(numpyunittest_TestCase):
+    def setUp(self):
+        self.start = datetime(2007,9,1)
+        self.end = datetime(2007,9,4)
+        self.source = MemoryDataSource(
+            simulateTHEMISdataSets(self.start,self.end,spacingSeconds=60)
+        )
+
+    def importBulk(self,start,end,chunkDuration=timedelta(days=1)) -> THEMISdata:
+        bulk = THEMISdata()
+        bulk.dataSource = self.source
+        bulk.importBulk(start,end,"D",chunkDuration=chunkDuration)
+        return bulk
+
+    def importCDAS(self,start,end) -> THEMISdata:
+        mag = THEMISdata()
+        mag.dataSource = MemoryDataSource(self.source.dataSets)
+        mag.importCDAS(start,end,"D")
+        return mag
+
+    def assertDataSetsEqual(self,first,second):
+        for name in ('magneticField','position','peemIdentifyMagnetosheath'):
+            a, b = getattr(first,name), getattr(second,name)
+            self.assertTrue(a.timeSeries == b.timeSeries)
+            for key in a.keys():
+                self.assertNumpyClose(a.data[key],b.data[key])
+
+    def test_chunksJoined(self):
+        bulk = self.importBulk(self.start,self.end)
+        # Three chunks for each of the three datasets
+        self.assertEqual(len(self.source.requests),9)
+        self.assertDataSetsEqual(bulk,self.importCDAS(self.start,self.end))
+
+    def test_windowIsView(self):
+        bulk = self.importBulk(self.start,self.end)
+        windowStart, windowEnd = datetime(2007,9,1,18), datetime(2007,9,2,6)
+        window = bulk.window(windowStart,windowEnd)
+        self.assertDataSetsEqual(window,self.importCDAS(windowStart,windowEnd))
+        self.assertTrue(np.shares_memory(window.magneticField.data[0],bulk.magneticField.data[0]))
+        # Processing replaces the data of the window, so the bulk data is unchanged
+        field = bulk.magneticField.data[0].copy()
+        window.defaultProcessing()
+        self.assertNumpyClose(bulk.magneticField.data[0],field)
+
+    def test_chunkWithoutDataSkipped(self):
+        bulk = self.importBulk(self.start - timedelta(days=2),self.end)
+        self.assertDataSetsEqual(bulk,self.importCDAS(self.start,self.end))
+
+    def test_numpyChunkDuration(self):
+        bulk = self.importBulk(self.start,self.end,np.timedelta64(36,'h'))
+        self.assertEqual(len(self.source.requests),6)
+        self.assertEqual(len(bulk.position.timeSeries),len(self.source.dataSets['THD_OR_SSC']['EPOCH']))
+
+if __name__ == "__main__":
+    unittest.main()
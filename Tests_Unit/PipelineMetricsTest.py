@@ -0,0 +1,54 @@
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import json
+import os
+import tempfile
+
+from magSonify.PipelineMetrics import PipelineMetrics
+
+
+class PipelineMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = PipelineMetrics()
+        for sequence, duration in enumerate((1.0, 3.0)):
+            self.metrics.record(
+                'item', stage="processing", worker=0, sequence=sequence, wait=0.5,
+                duration=duration, putWait=0, bytes=1024**2, failed=False,
+            )
+        self.metrics.record('worker', stage="processing", worker=0, busy=4.0, total=8.0)
+        self.metrics.record('queue', queue=1, items=2, bytes=3*1024**2)
+        self.metrics.record('audio', sequence=0, headroom=2.5, underruns=1, overruns=0)
+        self.metrics.close()
+
+    def test_stageSummary(self):
+        stats = self.metrics.stageSummary()["processing"]
+        self.assertEqual(stats['items'],2)
+        self.assertAlmostEqual(stats['meanDuration'],2.0)
+        self.assertAlmostEqual(stats['maxDuration'],3.0)
+        self.assertAlmostEqual(stats['meanWait'],0.5)
+        self.assertEqual(stats['bytes'],2*1024**2)
+        self.assertAlmostEqual(stats['utilisation'],0.5)
+
+    def test_summary(self):
+        summary = self.metrics.summary()
+        self.assertIn("processing",summary)
+        self.assertIn("Queue 1: max 2 items, max 3.0 MiB",summary)
+        self.assertIn("Audio: min headroom 2.5 s, 1 underruns, 0 overruns",summary)
+
+    def test_writeJsonLines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fileName = os.path.join(directory,"metrics.jsonl")
+            self.metrics.writeJsonLines(fileName)
+            with open(fileName) as file:
+                records = [json.loads(line) for line in file]
+        self.assertListEqual(records,self.metrics.records)
+        self.assertListEqual(
+            [record['kind'] for record in records],
+            ['item','item','worker','queue','audio']
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+
+if __name__ == "__main__":
+    import context
+    context.get()
+
+import unittest
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from datetime import datetime
+
+import numpy as np
+from numpyUnitTestCase import numpyunittest_TestCase
+from magSonify.TimeSeries import generateTimeSeries
+from magSonify.DataSet_1D import DataSet_1D
+from magSonify.SharedMemoryTransport import SharedMemoryTransport, SharedArray
+
+def generateDataSet(seed=0):
+    rng = np.random.default_rng(seed)
+    ts = generateTimeSeries(datetime(2020,4,2),datetime(2020,4,2,1),number=10000)
+    dataSet = DataSet_1D(ts,rng.normal(0,1,10000))
+    dataSet.coefficients = rng.normal(0,1,(20,10000)) * 1j
+    dataSet.small = np.arange(3)
+    return dataSet
+
+def _produce(transport,number):
+    for i in range(number):
+        transport.put(generateDataSet(i))
+    transport.put(None)
+
+class SharedMemoryTransportTest(numpyunittest_TestCase):
+    def assertDataSetEqual(self,received,expected):
+        self.assertTrue(received.timeSeries == expected.timeSeries)
+        self.assertNumpyClose(received.x,expected.x)
+        self.assertTrue(np.array_equal(received.coefficients,expected.coefficients))
+        self.assertNumpyClose(received.small,expected.small)
+
+    def test_roundTrip(self):
+        transport = SharedMemoryTransport(None)
+        dataSet = generateDataSet()
+        data = transport.dumps(dataSet)
+        self.assertLess(len(data),4096)
+        received = transport.loads(data)
+        self.assertDataSetEqual(received,dataSet)
+        self.assertIsInstance(received.x,SharedArray)
+        self.assertIsInstance(received.coefficients,SharedArray)
+        self.assertNotIsInstance(received.small,SharedArray)
+        # Blocks are unlinked once received
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=received.x._sharedMemory.name)
+
+    def test_derivedArrays(self):
+        transport = SharedMemoryTransport(None)
+        x = transport.loads(transport.dumps(np.arange(10000.)))
+        self.assertIsInstance(x[10:20],SharedArray)
+        self.assertIs(x[10:20]._sharedMemory,x._sharedMemory)
+        self.assertIs(type(x * 2),np.ndarray)
+        self.assertIsInstance(x.sum(),float)
+        x *= 2
+        self.assertIsInstance(x,SharedArray)
+
+    def test_sharedArraysAndViews(self):
+        transport = SharedMemoryTransport(None)
+        x = np.arange(100000.)
+        other = np.arange(20000.)
+        sent = [x, x, x[10000:50000], x[60000:20000:-2], x.reshape(1000,100).T, other, other[100:]]
+        received = transport.loads(transport.dumps(sent))
+        self.assertIs(received[0],received[1])
+        # One block for the views of x and one for other
+        blocks = {id(array._sharedMemory) for array in received}
+        self.assertEqual(len(blocks),2)
+        for i in (2,3,4):
+            self.assertTrue(np.shares_memory(received[0],received[i]))
+        self.assertTrue(np.shares_memory(received[5],received[6]))
+        self.assertFalse(np.shares_memory(received[0],received[5]))
+        for array, expected in zip(received,sent):
+            self.assertTrue(np.array_equal(array,expected))
+        received[0][20000] = -1
+        self.assertEqual(received[2][10000],-1)
+
+    def test_viewSharesOnlyItsSpan(self):
+        transport = SharedMemoryTransport(None)
+        x = np.arange(1000000.)
+        view = x[100000:200000]
+        received = transport.loads(transport.dumps((view,view[10:])))
+        self.assertTrue(np.array_equal(received[0],view))
+        self.assertTrue(np.shares_memory(*received))
+        self.assertLess(received[0]._sharedMemory.size,x.nbytes // 5)
+
+    def test_betweenProcesses(self):
+        transport = SharedMemoryTransport(mp.Queue(maxsize=2))
+        producer = mp.Process(target=_produce,args=(transport,3))
+        producer.start()
+        received = []
+        while True:
+            dataSet = transport.get(timeout=30)
+            if dataSet is None:
+                break
+            received.append(dataSet)
+        producer.join()
+        self.assertEqual(len(received),3)
+        for i, dataSet in enumerate(received):
+            self.assertDataSetEqual(dataSet,generateDataSet(i))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -54,6 +54,51 @@ class TimeSeriesTest(unittest.TestCase):
         series2 = allSeries[2]
         self.assertAlmostEqual(series2.times[3],3/44100)
 
+    def test_equalityOfCopies(self):
+        for series in self.initialise():
+            seriesCopy = series.copy()
+            self.assertTrue(series == seriesCopy)
+            self.assertFalse(series != seriesCopy)
+
+    def test_equalityDifferentUnits(self):
+        series = self.initialise()[0]
+        seriesSeconds = series.copy()
+        seriesSeconds.changeUnit(np.timedelta64(1,'s'))
+        self.assertEqual(series,seriesSeconds)
+
+    def test_inequalityAfterModification(self):
+        series = self.initialise()[0]
+        seriesCopy = series.copy()
+        seriesCopy.times = seriesCopy.times + 1
+        self.assertNotEqual(series,seriesCopy)
+        self.assertNotEqual(series,series[:-1])
+
+    def test_inequalityAfterModificationInPlace(self):
+        series = self.initialise()[0]
+        self.assertEqual(series,series.copy())
+        seriesCopy = series.copy()
+        series.times[0] = 99
+        self.assertNotEqual(series,seriesCopy)
+        # Through a view of the times
+        seriesCopy[:10].times[1] = 99
+        self.assertNotEqual(seriesCopy,self.initialise()[0])
+        self.assertEqual(series[:5],series[:5])
+
+    def test_argFirstAfterAndLastBefore(self):
+        series = self.initialise()[1] # One sample every 36 s
+        self.assertEqual(series.argFirstAfter(datetime(2020,4,2,0,1)),2)
+        self.assertEqual(series.argLastBefore(datetime(2020,4,2,0,1)),1)
+        self.assertEqual(series.argFirstAfter(datetime(2020,4,2,0,0,36)),2)
+        self.assertEqual(series.argLastBefore(datetime(2020,4,2,0,0,36)),0)
+        self.assertEqual(series.argFirstAfter(datetime(2020,4,4)),len(series))
+        self.assertEqual(series.argLastBefore(datetime(2020,4,1)),-1)
+
+    def test_sliceBetween(self):
+        series = self.initialise()[1]
+        s = series.sliceBetween(datetime(2020,4,2,0,0,36),datetime(2020,4,2,0,3))
+        self.assertEqual(s,slice(1,6))
+        self.assertEqual(series.sliceBetween(),slice(None,None))
+
 if __name__ == "__main__":
     os.chdir(os.path.dirname(__file__))
     unittest.main()
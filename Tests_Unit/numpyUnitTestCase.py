@@ -8,10 +8,10 @@ class numpyunittest_TestCase(unittest.TestCase):
         bf = b.flatten()
         for i in range(len(af)):
             try:
-                s.assertTrue(np.isclose(a[i], b[i], equal_nan=equal_nan))
+                s.assertTrue(np.isclose(af[i], bf[i], equal_nan=equal_nan))
             except:
                 print(
-                    f"Not equal: a[{i}] = {a[i]}; b[{i}] = {b[i]} \n"
+                    f"Not equal: a[{i}] = {af[i]}; b[{i}] = {bf[i]} \n"
                     f"- {a} \n"
                     f"+ {b}"
                 )
@@ -0,0 +1,18 @@
+import numpy as np
+from magSonify.TimeSeries import generateTimeSeries
+from magSonify.DataSet import DataSet_3D
+from magSonify.MagnetometerData import THEMISdata
+
+
+class SimulatedTHEMISdata(THEMISdata):
+    """Generates data in place of importing from CDAS. Satellite ``"X"`` raises an exception."""
+    def importCDAS(self,startDatetime,endDatetime,satellite="D"):
+        if satellite == "X":
+            raise ValueError("No data for satellite X")
+        ts = generateTimeSeries(startDatetime,endDatetime,spacing=np.timedelta64(3,'s'))
+        n = len(ts)
+        rng = np.random.default_rng(0)
+        self.magneticField = DataSet_3D(ts,{i: rng.normal(0,5,n) + 20 for i in (0,1,2)})
+        self.position = DataSet_3D(ts,{
+            0: np.full(n,6 * 6371.), 1: np.full(n,6371.), 2: np.zeros(n), 'radius': np.full(n,6.)
+        })
@@ -1,9 +1,14 @@
-import soundfile
 import numpy as np
 
-def writeoutAudio(audio,outputFile,sampleRate=44100):
-        audio = np.nan_to_num(audio)
-        audio[audio>1] = 1
-        audio[audio<-1] = -1
-        
-        soundfile.write(outputFile,audio,sampleRate)
\ No newline at end of file
+def writeoutAudio(audio,outputFile,sampleRate=44100,blockSize=2**18):
+        """Writes ``audio`` to ``outputFile``, replacing ``NaN`` with 0 and clipping to between -1 
+        and 1. ``audio`` is written in blocks of ``blockSize`` samples, so may be a 
+        ``numpy.memmap`` larger than the available memory.
+        """
+        import soundfile
+        channels = 1 if np.ndim(audio) == 1 else np.shape(audio)[1]
+        with soundfile.SoundFile(outputFile,'w',sampleRate,channels) as file:
+                for start in range(0,len(audio),blockSize):
+                        block = np.nan_to_num(np.asarray(audio[start:start+blockSize]))
+                        np.clip(block,-1,1,out=block)
+                        file.write(block)
@@ -0,0 +1,184 @@
+"""Runs the import, processing and sonification of many events in parallel, writing the audio
+directly to files. eg. sonifying every 12 hour interval for several THEMIS satellites::
+
+    events = generateEvents(datetime(2007,9,1),datetime(2007,10,1),satellites="ABCDE")
+    manifest = sonifyEvents(events,"Audio",algorithm="paulStretch",algArgs=(16,))
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Executor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from timeit import default_timer as timer
+from typing import List
+import json
+import os
+import traceback
+import numpy as np
+
+from .MagnetometerData import THEMISdata
+
+def generateEvents(
+    startDatetime,
+    endDatetime,
+    interval: np.timedelta64 = np.timedelta64(12,'h'),
+    satellites = ("D",),
+) -> List[tuple]:
+    """Returns a list of events ``(start, end, satellite)`` covering ``startDatetime`` to
+    ``endDatetime`` in consecutive intervals, for each satellite.
+
+    :param interval: Length of each event as ``np.timedelta64``
+    :param satellites: Iterable of satellite letters, eg. ``"ABCDE"``
+    """
+    start = np.datetime64(startDatetime)
+    end = np.datetime64(endDatetime)
+    events = []
+    for satellite in satellites:
+        eventStart = start
+        while eventStart < end:
+            eventEnd = min(eventStart + interval, end)
+            events.append((eventStart.astype(object), eventEnd.astype(object), satellite))
+            eventStart = eventEnd
+    return events
+
+def _eventFileName(event: tuple, axis, algorithm: str) -> str:
+    start, end = (str(np.datetime64(time,'s')).replace(':','') for time in event[:2])
+    return "_".join(
+        [start, end, *(str(arg) for arg in event[2:]), f"axis{axis}", algorithm]
+    ) + ".wav"
+
+def _sonifyEvent(event: tuple, outputFile: str, config: dict) -> dict:
+    """Imports, processes and sonifies a single event, writing the audio to ``outputFile``. Run
+    in the worker processes, so only returns a small summary rather than the data."""
+    timings = {}
+    try:
+        start = timer()
+        mag = config['dataClass']()
+        mag.importCDAS(*event)
+        mag._raiseIfNotImported()
+        timings['import'] = timer() - start
+
+        start = timer()
+        mag.defaultProcessing(*config['processingArgs'])
+        ax = mag.magneticFieldMeanFieldCoordinates.extractKey(config['axis'])
+        del mag
+        timings['processing'] = timer() - start
+
+        start = timer()
+        getattr(ax,config['algorithm'])(*config['algArgs'])
+        ax.normalise()
+        timings['sonification'] = timer() - start
+
+        start = timer()
+        ax.genMonoAudio(outputFile,sampleRate=config['sampleRate'])
+        timings['write'] = timer() - start
+        return {'status': 'ok', 'numberSamples': len(ax.x), 'timings': timings}
+    except Exception as e:
+        return {
+            'status': 'failed',
+            'error': repr(e),
+            'traceback': traceback.format_exc(),
+            'timings': timings,
+        }
+
+def sonifyEvents(
+    events,
+    outputDirectory: str,
+    dataClass: type = THEMISdata,
+    processingArgs: tuple = (),
+    axis = 1,
+    algorithm: str = "waveletStretch",
+    algArgs: tuple = (16, 0.5, 16),
+    sampleRate = 44100,
+    maxWorkers: int = None,
+    maxInFlight: int = None,
+    executor: Executor = None,
+) -> List[dict]:
+    """Imports, processes and sonifies each event in a separate process, writing the audio for
+    each to a file in ``outputDirectory``. The data for an event never leaves its worker process,
+    only a summary is returned.
+
+    :param events:
+        Iterable of tuples of arguments for ``dataClass.importCDAS``, in the form
+        ``(startDatetime, endDatetime, *args)``, eg. from :func:`generateEvents`.
+    :param dataClass:
+        The high level class for satellite data, subclassed from :class:`MagnetometerData`,
+        implementing ``.importCDAS`` and ``.defaultProcessing``. eg. :class:`THEMISdata`.
+    :param processingArgs:
+        Args for ``dataClass.defaultProcessing``
+    :param axis:
+        The key of the component of :attr:`MagnetometerData.magneticFieldMeanFieldCoordinates`
+        to sonify.
+    :param algorithm:
+        Name of the time stretching method of :class:`DataSet_1D` to use, eg.
+        ``'waveletStretch'``, ``'paulStretch'``, ``'phaseVocoderStretch'`` or ``'wsolaStretch'``.
+    :param algArgs:
+        The arguments to be passed to the time stretching method.
+    :param sampleRate:
+        The sample rate of the output audio.
+    :param maxWorkers:
+        Number of worker processes, defaults to the number of processors.
+    :param maxInFlight:
+        Maximum number of events submitted but not yet completed, which bounds the memory used.
+        Defaults to the number of workers.
+    :param executor:
+        Executor to run the events with. If ``None``, a ``ProcessPoolExecutor`` with
+        ``maxWorkers`` processes is created and shut down once all events are complete.
+    :return:
+        The manifest, a list with an entry for each event in order. Each entry is a dictionary
+        with the ``'event'``, output ``'file'``, ``'status'`` (``'ok'`` or ``'failed'``),
+        ``'timings'`` of each stage in seconds and the total ``'duration'``. Failed events also
+        have the ``'error'`` and ``'traceback'``. The manifest is also written to
+        ``manifest.json`` in ``outputDirectory``.
+    """
+    os.makedirs(outputDirectory,exist_ok=True)
+    events = [tuple(event) for event in events]
+    config = {
+        'dataClass': dataClass,
+        'processingArgs': tuple(processingArgs),
+        'axis': axis,
+        'algorithm': algorithm,
+        'algArgs': tuple(algArgs),
+        'sampleRate': sampleRate,
+    }
+
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ProcessPoolExecutor(maxWorkers)
+    if maxInFlight is None:
+        maxInFlight = maxWorkers if maxWorkers is not None else (os.cpu_count() or 1)
+
+    manifest = [None] * len(events)
+    pending = {}
+    try:
+        nextEvent = 0
+        while nextEvent < len(events) or pending:
+            while nextEvent < len(events) and len(pending) < maxInFlight:
+                event = events[nextEvent]
+                outputFile = os.path.join(
+                    outputDirectory,
+                    _eventFileName(event,axis,algorithm)
+                )
+                future = executor.submit(_sonifyEvent,event,outputFile,config)
+                pending[future] = (nextEvent, outputFile, timer())
+                nextEvent += 1
+            done, _ = wait(pending,return_when=FIRST_COMPLETED)
+            for future in done:
+                index, outputFile, submitted = pending.pop(future)
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    # The worker process itself failed, eg. it ran out of memory
+                    entry = {'status': 'failed', 'error': repr(e), 'timings': {}}
+                entry['duration'] = timer() - submitted
+                manifest[index] = {
+                    'event': [str(arg) for arg in events[index]],
+                    'file': outputFile if entry['status'] == 'ok' else None,
+                    **entry,
+                }
+    finally:
+        if ownExecutor:
+            executor.shutdown(cancel_futures=True)
+
+    with open(os.path.join(outputDirectory,"manifest.json"),"w") as file:
+        json.dump(manifest,file,indent=4)
+    return manifest
@@ -1,15 +1,18 @@
 
-from threading import local
-
-from numpy.lib.shape_base import apply_along_axis
 from magSonify.DataSet_1D import DataSet_1D
 from magSonify.MagnetometerData import MagnetometerData, THEMISdata
+from magSonify.SharedMemoryTransport import SharedMemoryTransport
+from magSonify.PipelineMetrics import PipelineMetrics
+from magSonify.ImportScheduler import ImportScheduler
+from magSonify.DataSource import DataSource
 import multiprocessing as mp
-import sounddevice
+from threading import Thread, Event
 from timeit import default_timer as timer
 import sys, os
+from types import ModuleType
 import numpy as np
 from time import sleep
+from typing import List
 
 class STOPVALUE:
     """
@@ -26,10 +29,245 @@ class STOPVALUE:
     """
     pass
 
+def createTransports(queues) -> list:
+    """Wraps each queue in a :class:`SharedMemoryTransport`, unless it is one already. For a 
+    :class:`BudgetedQueue`, the queue it wraps is replaced by a transport. Should be called in 
+    the parent process before starting the stages."""
+    return [_createTransport(queue) for queue in queues]
+
+def _createTransport(queue):
+    if isinstance(queue,SharedMemoryTransport):
+        return queue
+    if isinstance(queue,BudgetedQueue):
+        return BudgetedQueue(_createTransport(queue.queue),queue.budget,queue.queueIndex)
+    return SharedMemoryTransport(queue)
+
+def itemBytes(obj) -> int:
+    """Returns the total size in bytes of the numpy arrays held by ``obj``, eg. a data set or 
+    :class:`MagnetometerData`, found through its attributes and any dictionaries, lists and 
+    tuples. Arrays referenced more than once, eg. a time series shared by several data sets, 
+    are counted once."""
+    total = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj,np.ndarray):
+            if not obj.dtype.hasobject:
+                total += obj.nbytes
+                continue
+            stack.extend(obj.ravel())
+        elif isinstance(obj,dict):
+            stack.extend(obj.values())
+        elif isinstance(obj,(list,tuple)):
+            stack.extend(obj)
+        elif hasattr(obj,'__dict__') and not callable(obj) and not isinstance(obj,ModuleType):
+            stack.extend(vars(obj).values())
+    return total
+
+class MemoryBudget():
+    """Limits the memory held in the queues between the stages of the pipeline, shared by all 
+    of the processes.
+
+    Each queue has a budget in bytes. Putting an item waits until the bytes queued plus the size
+    of the item are within the budget of the queue, so a stage which is ahead of the next 
+    blocks rather than filling memory. An item is always accepted by an empty queue, so an item 
+    larger than the budget does not stall the pipeline.
+
+    In addition, :meth:`waitToImport` waits while the total bytes queued in all of the queues 
+    is above ``maxTotalBytes``, so that the importers pause while the later stages are behind.
+
+    Waiting blocks on a ``multiprocessing.Condition``, which is notified whenever an item is 
+    taken from a queue. Should be created in the parent process and passed to the stages, 
+    usually through :class:`BudgetedQueue`.
+
+    :param queueBudgets:
+        Maximum bytes queued for each queue
+    :param maxTotalBytes:
+        Total bytes queued above which imports are paused. Defaults to the sum of 
+        ``queueBudgets``.
+    """
+    def __init__(self, queueBudgets, maxTotalBytes: int = None):
+        self.queueBudgets = tuple(queueBudgets)
+        if maxTotalBytes is None:
+            maxTotalBytes = sum(self.queueBudgets)
+        self.maxTotalBytes = maxTotalBytes
+        self._condition = mp.Condition()
+        self._used = mp.RawArray('q',len(self.queueBudgets))
+        self._items = mp.RawArray('q',len(self.queueBudgets))
+
+    def used(self, queueIndex: int = None) -> int:
+        """Returns the bytes queued in queue ``queueIndex``, or in all queues if ``None``"""
+        with self._condition:
+            if queueIndex is None:
+                return sum(self._used)
+            return self._used[queueIndex]
+
+    def queued(self, queueIndex: int) -> tuple:
+        """Returns the number of items and bytes queued in queue ``queueIndex``"""
+        with self._condition:
+            return self._items[queueIndex], self._used[queueIndex]
+
+    def reserve(self, queueIndex: int, nbytes: int, timeout=None) -> bool:
+        """Waits until ``nbytes`` fit within the budget of queue ``queueIndex``, then adds them
+        to the bytes queued. Returns ``False`` if ``timeout`` seconds passed first."""
+        with self._condition:
+            fits = self._condition.wait_for(
+                lambda: (
+                    self._used[queueIndex] == 0 
+                    or self._used[queueIndex] + nbytes <= self.queueBudgets[queueIndex]
+                ),
+                timeout
+            )
+            if fits:
+                self._used[queueIndex] += nbytes
+                self._items[queueIndex] += 1
+            return fits
+
+    def release(self, queueIndex: int, nbytes: int) -> None:
+        """Removes ``nbytes`` from the bytes queued in queue ``queueIndex``, waking any waiting 
+        processes"""
+        with self._condition:
+            self._used[queueIndex] -= nbytes
+            self._items[queueIndex] -= 1
+            self._condition.notify_all()
+
+    def waitToImport(self, timeout=None) -> bool:
+        """Waits until the total bytes queued are below ``maxTotalBytes``. Returns ``False`` if
+        ``timeout`` seconds passed first."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: sum(self._used) < self.maxTotalBytes, timeout
+            )
+
+class BudgetedQueue():
+    """Wraps a queue, or a :class:`SharedMemoryTransport`, counting the bytes of each item 
+    against the budget of the queue in a :class:`MemoryBudget`. :meth:`put` blocks while the 
+    queue is over budget. Items are sent with their size, which is released by :meth:`get`.
+
+    :param queue: Queue to wrap, should not have a ``maxsize``
+    :param budget: Budget shared by all queues of the pipeline
+    :param queueIndex: Index of this queue in ``budget.queueBudgets``
+    """
+    def __init__(self, queue, budget: MemoryBudget, queueIndex: int):
+        self.queue = queue
+        self.budget = budget
+        self.queueIndex = queueIndex
+
+    def put(self, item) -> None:
+        nbytes = itemBytes(item)
+        self.budget.reserve(self.queueIndex,nbytes)
+        self.queue.put((nbytes, item))
+
+    def get(self, block=True, timeout=None):
+        nbytes, item = self.queue.get(block,timeout)
+        self.budget.release(self.queueIndex,nbytes)
+        return item
+
+def _importEvent(
+    event: tuple, dataClass = THEMISdata, scheduler: ImportScheduler = None
+) -> MagnetometerData:
+    mag = dataClass()
+    mag.importScheduler = scheduler
+    try:
+        mag.importCDAS(*event)
+        mag._raiseIfNotImported()
+    finally:
+        # The scheduler stays in this process, it is not sent to the next stage
+        mag.importScheduler = None
+    return mag
+
+def _processEvent(mag: MagnetometerData, processingArgs: tuple = ()) -> MagnetometerData:
+    mag.defaultProcessing(*processingArgs)
+    return mag
+
+def _sonifyEvent(
+    mag: MagnetometerData, 
+    axis: int = 1, 
+    algorithm: str = "waveletStretch", 
+    algArgs: tuple = (16, 0.5, 16)
+) -> DataSet_1D:
+    ax = mag.magneticFieldMeanFieldCoordinates.extractKey(axis)
+    getattr(ax,algorithm)(*algArgs)
+    ax.normalise()
+    # Playback only requires the audio, so the wavelet coefficients are not sent
+    for attribute in ('coefficients','coefficients_shifted'):
+        ax.__dict__.pop(attribute,None)
+    return ax
+
+class ReorderBuffer():
+    """Restores the order of items which are completed out of order by multiple workers. Each 
+    item is added with its sequence number, and is returned by :meth:`add` once all items with 
+    lower sequence numbers have been returned. Sequence numbers must be consecutive from 0.
+    ::
+
+        reorderBuffer = ReorderBuffer()
+        reorderBuffer.add(1,"b")    # Returns []
+        reorderBuffer.add(0,"a")    # Returns ["a", "b"]
+    """
+    def __init__(self):
+        self.pending = {}
+        self.nextSequence = 0
+
+    def add(self, sequence: int, item) -> list:
+        """Adds ``item``, returning the items which are now ready in order"""
+        self.pending[sequence] = item
+        ready = []
+        while self.nextSequence in self.pending:
+            ready.append(self.pending.pop(self.nextSequence))
+            self.nextSequence += 1
+        return ready
+
+    def __len__(self):
+        return len(self.pending)
+
 class BaseProcess(mp.Process):
-    """Base process for multiprocessing"""
+    """Base process for multiprocessing. Usually created by :func:`startPipeline`.
+
+    Items are passed between the stages as tuples ``(sequence, item)``, where ``sequence`` is the
+    index of the event. If an event fails in a stage, ``item`` is passed on as ``None``, so that
+    the playback stage does not wait for it. Each stage may have multiple workers. Each worker 
+    puts a :class:`STOPVALUE` for each worker of the next stage after its own items, and a 
+    worker finishes once it has received a :class:`STOPVALUE` from every worker of the previous 
+    stage, so it cannot finish before the items of another worker have arrived.
+
+    :param queues:
+        Tuple of the three queues between the stages, ``(imported, processed, sonified)``. 
+        Either ``multiprocessing`` queues, which are wrapped in a :class:`SharedMemoryTransport`
+        if ``useSharedMemory``, or transports created with :func:`createTransports`.
+    :param useSharedMemory:
+        Whether to send the arrays in data sets between processes through shared memory, rather 
+        than pickling them through the queues.
+    :param workerIndex:
+        Index of this worker within its stage.
+    :param numberWorkers:
+        Number of workers in this stage.
+    :param numberConsumers:
+        Number of workers in the next stage, ie. the number of :class:`STOPVALUE` to put when 
+        this worker is finished.
+    :param numberProducers:
+        Number of workers in the previous stage, ie. the number of :class:`STOPVALUE` to 
+        receive before this worker is finished.
+    :param metrics:
+        :class:`PipelineMetrics` to record the timings of this worker to, or ``None``.
+    """
 
-    def __init__(self, task, taskArgs, queues, name=None):
+    def __init__(
+        self, 
+        task, 
+        taskArgs, 
+        queues, 
+        name=None, 
+        useSharedMemory=True,
+        workerIndex=0,
+        numberWorkers=1,
+        numberConsumers=1,
+        numberProducers=1,
+        metrics: PipelineMetrics = None,
+    ):
         if name is None:
             name = task
         super().__init__(
@@ -37,13 +275,102 @@ class BaseProcess(mp.Process):
             args = taskArgs,
             name = name,
         )
+        if useSharedMemory:
+            queues = createTransports(queues)
         self.importedQueue = queues[0]
         self.processedQueue = queues[1]
         self.sonifiedQueue = queues[2]
+        self.workerIndex = workerIndex
+        self.numberWorkers = numberWorkers
+        self.numberConsumers = numberConsumers
+        self.numberProducers = numberProducers
+        self.task = task
+        self.metrics = metrics
         self.startTime = timer()
+        self.busyTime = 0
+        """Time spent working on items, excluding waiting for the queues"""
 
-    def importer(self, events: tuple, dataClass = THEMISdata):
-        """ Multiprocessing wrapper of CDAS import.
+    def _recordItem(self, sequence, item, outputQueue, wait, duration, putWait) -> None:
+        """Records the timings of an item and the state of the queue it was put in"""
+        if self.metrics is None:
+            return
+        self.busyTime += duration
+        self.metrics.record(
+            'item',
+            stage=self.task,
+            worker=self.workerIndex,
+            sequence=sequence,
+            wait=wait,
+            duration=duration,
+            putWait=putWait,
+            bytes=itemBytes(item),
+            failed=item is None,
+        )
+        budget = getattr(outputQueue,'budget',None)
+        if budget is not None:
+            items, nbytes = budget.queued(outputQueue.queueIndex)
+            self.metrics.record('queue', queue=outputQueue.queueIndex, items=items, bytes=nbytes)
+
+    def _receive(self, inputQueue):
+        """Yields ``(received, wait)`` for each item from ``inputQueue``, until a 
+        :class:`STOPVALUE` has been received from each worker of the previous stage. ``wait`` is 
+        the time spent waiting for the item."""
+        stops = 0
+        while stops < self.numberProducers:
+            start = timer()
+            received = inputQueue.get()
+            wait = timer() - start
+            if isinstance(received, STOPVALUE):
+                stops += 1
+                continue
+            yield received, wait
+
+    def _finishStage(self, outputQueue) -> None:
+        """Records that this worker has finished and puts a :class:`STOPVALUE` for each worker 
+        of the next stage. As they are put after the items of this worker, they are received 
+        after them."""
+        if self.metrics is not None:
+            self.metrics.record(
+                'worker',
+                stage=self.task,
+                worker=self.workerIndex,
+                busy=self.busyTime,
+                total=timer() - self.startTime,
+            )
+        for i in range(self.numberConsumers):
+            outputQueue.put(STOPVALUE())
+
+    def _runStage(self, inputQueue, outputQueue, func, description, *args) -> None:
+        """Applies ``func(item, *args)`` to each item from ``inputQueue``, until a 
+        :class:`STOPVALUE` is received from each worker of the previous stage."""
+        for received, wait in self._receive(inputQueue):
+            sequence, item = received
+            start = timer()
+            if item is not None:
+                try:
+                    item = func(item, *args)
+                except Exception as e:
+                    print(f"Exception {description} event {sequence}, skipping")
+                    print(e)
+                    item = None
+            duration = timer() - start
+            start = timer()
+            outputQueue.put((sequence, item))
+            self._recordItem(sequence, item, outputQueue, wait, duration, timer() - start)
+        self._finishStage(outputQueue)
+
+    def importer(
+        self, 
+        events: tuple, 
+        dataClass = THEMISdata, 
+        prefetch: int = 2, 
+        maxConcurrent: int = 6, 
+        dataSource: DataSource = None,
+        bulk: MagnetometerData = None,
+    ):
+        """ Multiprocessing wrapper of CDAS import. Each worker imports every 
+        ``numberWorkers``-th event. The downloads for the next ``prefetch`` events of the worker
+        are started while the current event is imported, using an :class:`ImportScheduler`.
 
         :param dataClass:
             The high level class for satellite data, subclassed from 
@@ -53,19 +380,48 @@ class BaseProcess(mp.Process):
         :param events: 
             Tuple, each value contain a tuple with args for importCDAS in the form
             (startDatetime,endDatetime,*args)
-        """
+        :param prefetch:
+            Number of events to download ahead of the event being imported.
+        :param maxConcurrent:
+            Maximum number of concurrent downloads by this worker.
+        :param dataSource:
+            :class:`DataSource` to import from, default is CDAS.
+        :param bulk:
+            Data imported with :meth:`MagnetometerData.importBulk` covering the events, eg. for 
+            a year. If given, each event is taken from it with :meth:`MagnetometerData.window`
+            rather than imported.
 
-        for event in events:
+        If the queues are :class:`BudgetedQueue`, each import waits until the bytes queued in 
+        the pipeline are below the budget, see :meth:`MemoryBudget.waitToImport`.
+        """
+        budget = getattr(self.importedQueue,'budget',None)
+        scheduler = ImportScheduler(maxConcurrent, dataSource=dataSource)
+        sequences = range(self.workerIndex, len(events), self.numberWorkers)
+        for i, sequence in enumerate(sequences):
+            event = events[sequence]
+            start = timer()
+            if budget is not None:
+                budget.waitToImport()
+            wait = timer() - start
+            start = timer()
             try:
-                mag: THEMISdata = dataClass()
-                mag.importCDAS(*event)
-                self.importedQueue.put(mag)
+                if bulk is not None:
+                    mag = bulk.window(*event[:2])
+                else:
+                    # Events already prefetched are not requested again, as the requests are 
+                    # deduplicated
+                    scheduler.prefetch(dataClass, [events[j] for j in sequences[i:i+prefetch+1]])
+                    mag = _importEvent(event, dataClass, scheduler)
             except Exception as e:
                 print(f"Exception importing interval starting on {event[0]}, skipping")
                 print(e)
-                pass
-            #print(f"Imported {event[0]} @ {timer() - self.startTime} s")
-        self.importedQueue.put(STOPVALUE())
+                mag = None
+            duration = timer() - start
+            start = timer()
+            self.importedQueue.put((sequence, mag))
+            self._recordItem(sequence, mag, self.importedQueue, wait, duration, timer() - start)
+        scheduler.shutdown()
+        self._finishStage(self.importedQueue)
 
     def processing(self, processingArgs: tuple = ()):
         """Multiprocessing wrapper of default processing.
@@ -74,19 +430,9 @@ class BaseProcess(mp.Process):
             Args for ``dataClass.defaultProcessing``
             (See for example: :meth:`THEMISdata.defaultProcessing`)
         """
-        try:
-            while True:
-                mag: THEMISdata = self.importedQueue.get()
-                if isinstance(mag, STOPVALUE):
-                    break
-                mag.defaultProcessing(*processingArgs)
-                self.processedQueue.put(mag)
-                #print(f"Processed {mag.magneticField.timeSeries.getStart()} @ {timer() - self.startTime} s")
-            self.processedQueue.put(STOPVALUE())
-        except Exception:
-            self.processedQueue.put(STOPVALUE())
-            print("Exception processing interval starting at:",mag.position.timeSeries.getStart())
-            raise
+        self._runStage(
+            self.importedQueue, self.processedQueue, _processEvent, "processing", processingArgs
+        )
 
     def sonification(self,axis: int = 1, algorithm: str = "waveletStretch", algArgs: tuple = (16, 0.5, 16)):
         """Multiprocessing wrapper of time stretching signal for sonification.
@@ -99,72 +445,354 @@ class BaseProcess(mp.Process):
         :param Tuple algArgs:
             The arguments to be passed to time stretching function.
         """
-        try:
-            while True:
-                mag: THEMISdata = self.processedQueue.get()
-                if isinstance(mag, STOPVALUE):
-                    break
-                ax = mag.magneticFieldMeanFieldCoordinates.extractKey(axis)
-                getattr(ax,algorithm)(*algArgs)
-                ax.normalise()
-                self.sonifiedQueue.put(ax)
-                #print(f"Sonified {mag.magneticField.timeSeries.getStart()} @ {timer() - self.startTime} s")
-            self.sonifiedQueue.put(STOPVALUE())
-        except Exception:
-            self.processedQueue.put(STOPVALUE())
-            print("Exception sonifying interval starting at:",ax.timeSeries.getStart())
-            raise
-
-    def playback(self,sampleRate=44100//2):
-        """Multiprocessing method for playing audio as a continous output stream"""
-
-        availableAudio = np.zeros(1,dtype=np.float64)
-        audioLock = mp.Lock()
+        self._runStage(
+            self.processedQueue, 
+            self.sonifiedQueue, 
+            _sonifyEvent, 
+            "sonifying", 
+            axis, 
+            algorithm, 
+            algArgs
+        )
+
+    def playback(self,sampleRate=44100//2,bufferSize=44100*30,soundDevice=None):
+        """Multiprocessing method for playing audio as a continous output stream. Audio is played 
+        in the order of the events, using a :class:`ReorderBuffer`. Must be a single worker.
+
+        :param bufferSize:
+            Capacity of the :class:`AudioRingBuffer` holding audio waiting to be played, in 
+            samples. Receiving further audio blocks while the buffer is full, so audio waiting 
+            for the buffer is held back in the queue, within its :class:`MemoryBudget`.
+        :param soundDevice:
+            Module used to output audio, default is ``sounddevice``. Can be a 
+            :class:`FakeSoundDevice` to run without a sound device.
+
+        With :class:`PipelineMetrics`, records the seconds of audio waiting to be played as each
+        event is received.
+        """
+        if soundDevice is None:
+            import sounddevice as soundDevice
+
+        ringBuffer = AudioRingBuffer(bufferSize)
+        streamRate = sampleRate//2
+        blockSize = 44100//10
         finishAudioProcessingEvent = mp.Event()
         donePlayingEvent = mp.Event()
-        i = 0
 
         def audioCallback(outdata,frames,time,status):
-            nonlocal availableAudio
-            nonlocal i
             if status:
                 print(status)
-            with audioLock:
-                if len(availableAudio) < frames:
-                    outdata[:len(availableAudio),0] = availableAudio[:]
-                    outdata[len(availableAudio):].fill(0)
-                    availableAudio = np.zeros(2,dtype=np.float64)
-                    if finishAudioProcessingEvent.is_set():
-                        raise sounddevice.CallbackStop
-                    print("    Waiting on audio...")
-                else:
-                    outdata[:,0] = availableAudio[0:frames]
-                    availableAudio = availableAudio[frames:]
-                print("Audio left: ", round(len(availableAudio)/44100,1),"s       ",end='\r',flush=True)
-            i += 1
-
-        myStream = sounddevice.OutputStream(
-            samplerate=sampleRate//2,
-            blocksize=44100//10,
+            ringBuffer.read(outdata[:,0])
+            if finishAudioProcessingEvent.is_set() and ringBuffer.available() == 0:
+                raise soundDevice.CallbackStop
+
+        myStream = soundDevice.OutputStream(
+            samplerate=streamRate,
+            blocksize=blockSize,
             callback=audioCallback,
             finished_callback=donePlayingEvent.set,
             channels = 1,
+            dtype = ringBuffer.buffer.dtype.name,
+        )
+
+        reorderBuffer = ReorderBuffer()
+        for received, wait in self._receive(self.sonifiedQueue):
+            if self.metrics is not None:
+                self.metrics.record(
+                    'audio',
+                    sequence=received[0],
+                    headroom=ringBuffer.available() / streamRate,
+                    underruns=ringBuffer.underruns,
+                    overruns=ringBuffer.overruns,
+                )
+
+            for ax in reorderBuffer.add(*received):
+                if ax is None:
+                    continue
+                written = 0
+                while True:
+                    written += ringBuffer.write(ax.x[written:])
+                    if myStream.stopped and ringBuffer.available() > 0:
+                        myStream.start()
+                    if written == len(ax.x):
+                        break
+                    ringBuffer.waitForSpace()
+
+        ringBuffer.finished = True
+        finishAudioProcessingEvent.set()
+        if not myStream.stopped:
+            donePlayingEvent.wait()
+
+class AudioRingBuffer():
+    """Fixed capacity ring buffer of audio samples, for a single producer and a single consumer 
+    in different threads, eg. the playback loop and the audio callback.
+
+    The samples are held in a preallocated array. :attr:`writeIndex` and :attr:`readIndex` 
+    count the total samples written and read, and are each only modified by one side, so no lock
+    is required. Neither :meth:`write` nor :meth:`read` allocate arrays or block. The producer 
+    can block in :meth:`waitForSpace` until the consumer has read samples.
+
+    :param capacity: Maximum number of samples held
+    """
+    def __init__(self, capacity: int, dtype=np.float32):
+        self.buffer = np.zeros(capacity, dtype)
+        self.capacity = capacity
+        self.writeIndex = 0
+        """Total number of samples written, only modified by the producer"""
+        self.readIndex = 0
+        """Total number of samples read, only modified by the consumer"""
+        self.overruns = 0
+        """Number of calls to :meth:`write` where the samples did not all fit"""
+        self.underruns = 0
+        """Number of calls to :meth:`read` where too few samples were available, before 
+        :attr:`finished` is set"""
+        self.finished = False
+        """Set by the producer once all samples have been written"""
+        self._spaceAvailable = Event()
+
+    def available(self) -> int:
+        """Returns the number of samples waiting to be read"""
+        return self.writeIndex - self.readIndex
+
+    def space(self) -> int:
+        """Returns the number of samples which can be written"""
+        return self.capacity - self.available()
+
+    def waitForSpace(self, timeout=None) -> bool:
+        """Blocks until samples can be written, or ``timeout`` seconds have passed. Returns 
+        whether samples can be written."""
+        self._spaceAvailable.clear()
+        # Checked after clearing, so that a read between the check and the wait is not missed
+        if self.space() == 0:
+            self._spaceAvailable.wait(timeout)
+        return self.space() > 0
+
+    def write(self, samples: np.array) -> int:
+        """Copies as many of ``samples`` as fit into the buffer, returning the number written"""
+        number = min(len(samples), self.space())
+        if number < len(samples):
+            self.overruns += 1
+        start = self.writeIndex % self.capacity
+        first = min(number, self.capacity - start)
+        self.buffer[start:start+first] = samples[:first]
+        self.buffer[:number-first] = samples[first:number]
+        # Only publish the samples once they have been copied
+        self.writeIndex += number
+        return number
+
+    def read(self, out: np.array) -> int:
+        """Fills ``out`` with samples from the buffer, filling with zeros if there are not enough.
+        Returns the number of samples read."""
+        number = min(len(out), self.available())
+        start = self.readIndex % self.capacity
+        first = min(number, self.capacity - start)
+        out[:first] = self.buffer[start:start+first]
+        out[first:number] = self.buffer[:number-first]
+        out[number:] = 0
+        if number < len(out) and not self.finished:
+            self.underruns += 1
+        self.readIndex += number
+        if number > 0:
+            self._spaceAvailable.set()
+        return number
+
+class FakeSoundDevice():
+    """Stand in for the ``sounddevice`` module in :meth:`BaseProcess.playback`, to run the 
+    pipeline without a sound device, eg. in tests. The output stream calls the callback for each
+    block from a separate thread as a sound device would, either in real time or as fast as 
+    possible, and records the output in :attr:`blocks`.
+    """
+    class CallbackStop(Exception):
+        pass
+
+    def __init__(self, realTime=False):
+        self.realTime = realTime
+        self.blocks = []
+        """List of the blocks of audio output"""
+
+    def OutputStream(
+        self, samplerate, blocksize, callback, finished_callback=None, channels=1, dtype='float32'
+    ):
+        return _FakeOutputStream(
+            self, samplerate, blocksize, callback, finished_callback, channels, dtype
         )
 
+    @property
+    def played(self) -> np.array:
+        """All audio output, as an array of shape ``(samples, channels)``"""
+        if not self.blocks:
+            return np.zeros((0,1), np.float32)
+        return np.concatenate(self.blocks)
+
+class _FakeOutputStream():
+    def __init__(
+        self, soundDevice, samplerate, blocksize, callback, finished_callback, channels, dtype
+    ):
+        self.soundDevice = soundDevice
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.finished_callback = finished_callback
+        self.channels = channels
+        self.dtype = dtype
+        self.stopped = True
+
+    def start(self):
+        self.stopped = False
+        Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        outdata = np.zeros((self.blocksize, self.channels), self.dtype)
         while True:
-            if len(availableAudio) > 44100 * 30:
-                sleep(0.01)
-                continue
-            ax: DataSet_1D = self.sonifiedQueue.get()
-            if isinstance(ax, STOPVALUE):
-                finishAudioProcessingEvent.set()
+            try:
+                self.callback(outdata, self.blocksize, None, None)
+            except self.soundDevice.CallbackStop:
+                self.soundDevice.blocks.append(outdata.copy())
                 break
-            #print(f"Playing {ax.timeSeries.getStart()} @ {timer() - self.startTime})")
-            
-            with audioLock:
-                availableAudio = np.concatenate((availableAudio,ax.x))
+            self.soundDevice.blocks.append(outdata.copy())
+            sleep(self.blocksize / self.samplerate if self.soundDevice.realTime else 0)
+        self.stopped = True
+        if self.finished_callback is not None:
+            self.finished_callback()
+
+STAGES = ("importer", "processing", "sonification", "playback")
 
-            if myStream.stopped:
-                myStream.start()
-        donePlayingEvent.wait()
+def startPipeline(
+    events,
+    workers: dict = None,
+    dataClass = THEMISdata,
+    processingArgs: tuple = (),
+    sonificationArgs: tuple = (1, "waveletStretch", (16, 0.5, 16)),
+    sampleRate = 44100//2,
+    queueBudgets: tuple = (2**28, 2**28, 2**28),
+    maxTotalBytes: int = 2**29,
+    useSharedMemory = True,
+    metrics: PipelineMetrics = None,
+    dataSource: DataSource = None,
+    prefetch: int = 2,
+    maxConcurrent: int = 6,
+    bulk: MagnetometerData = None,
+) -> List[BaseProcess]:
+    """Starts the import, processing, sonification and playback stages, returning the processes.
+    ::
+
+        workers = allocateWorkers(measureStageTimes(events[0]))
+        for process in startPipeline(events, workers):
+            process.join()
+
+    :param events:
+        Sequence of tuples of args for ``dataClass.importCDAS``, see :meth:`BaseProcess.importer`
+    :param workers:
+        Dictionary of the number of workers for each stage in :data:`STAGES`, default is one each.
+        Playback must have a single worker.
+    :param sonificationArgs:
+        Args for :meth:`BaseProcess.sonification`, ``(axis, algorithm, algArgs)``
+    :param queueBudgets:
+        Maximum bytes of data queued in each of the three queues between the stages, see 
+        :class:`MemoryBudget`. The size of the items varies greatly between events and stages,
+        so the queues are limited by bytes rather than by number of items.
+    :param maxTotalBytes:
+        Total bytes queued in the pipeline above which the importers pause
+    :param metrics:
+        :class:`PipelineMetrics` to record the timings of each stage and the state of the 
+        queues and audio buffer to. Call :meth:`PipelineMetrics.close` once the processes have
+        been joined.
+    :param dataSource:
+        :class:`DataSource` to import from, eg. a :class:`LocalDataSource`. Default is CDAS.
+    :param prefetch:
+        Number of events each importer downloads ahead, see :meth:`BaseProcess.importer`
+    :param maxConcurrent:
+        Maximum number of concurrent downloads by each importer
+    :param bulk:
+        Data covering the events, imported with :meth:`MagnetometerData.importBulk`, to take 
+        the events from rather than importing each
+    """
+    events = list(events)
+    workers = {**{stage: 1 for stage in STAGES}, **(workers or {})}
+    if workers["playback"] != 1:
+        raise ValueError("Playback must have a single worker")
+
+    queues = [mp.Queue() for i in range(3)]
+    if useSharedMemory:
+        queues = createTransports(queues)
+    budget = MemoryBudget(queueBudgets, maxTotalBytes)
+    queues = [BudgetedQueue(queue, budget, i) for i, queue in enumerate(queues)]
+    stageArgs = {
+        "importer": (events, dataClass, prefetch, maxConcurrent, dataSource, bulk),
+        "processing": (processingArgs,),
+        "sonification": tuple(sonificationArgs),
+        "playback": (sampleRate,),
+    }
+
+    processes = _createProcesses(queues, stageArgs, workers, useSharedMemory, metrics)
+    for process in processes:
+        process.start()
+    return processes
+
+def _createProcesses(
+    queues, stageArgs: dict, workers: dict, useSharedMemory=True, metrics=None
+) -> list:
+    """Creates the workers for each stage in ``stageArgs``, which should be in the order of 
+    :data:`STAGES`. Stages before or after those in ``stageArgs`` which are not included, eg. 
+    run in the calling process, are assumed to have a single worker."""
+    processes = []
+    for previousStage, stage, nextStage in zip((None,) + STAGES, STAGES, STAGES[1:] + (None,)):
+        if stage not in stageArgs:
+            continue
+        for workerIndex in range(workers[stage]):
+            processes.append(BaseProcess(
+                task=stage,
+                taskArgs=stageArgs[stage],
+                queues=queues,
+                name=f"{stage}-{workerIndex}",
+                useSharedMemory=useSharedMemory,
+                workerIndex=workerIndex,
+                numberWorkers=workers[stage],
+                numberConsumers=workers.get(nextStage, 1) if nextStage is not None else 0,
+                numberProducers=workers.get(previousStage, 1) if previousStage is not None else 0,
+                metrics=metrics,
+            ))
+    return processes
+
+def measureStageTimes(
+    event: tuple,
+    dataClass = THEMISdata,
+    processingArgs: tuple = (),
+    sonificationArgs: tuple = (1, "waveletStretch", (16, 0.5, 16)),
+) -> dict:
+    """Runs the import, processing and sonification stages for a single event in this process,
+    returning the time taken by each stage in seconds, for use with :func:`allocateWorkers`."""
+    stageTimes = {}
+    start = timer()
+    mag = _importEvent(event, dataClass)
+    stageTimes["importer"] = timer() - start
+    start = timer()
+    mag = _processEvent(mag, processingArgs)
+    stageTimes["processing"] = timer() - start
+    start = timer()
+    _sonifyEvent(mag, *sonificationArgs)
+    stageTimes["sonification"] = timer() - start
+    return stageTimes
+
+def allocateWorkers(stageTimes: dict, totalWorkers: int = None) -> dict:
+    """Returns the number of workers for each stage, for use with :func:`startPipeline`. Starting
+    from one worker per stage, workers are added to the stage with the lowest throughput, ie. the 
+    longest time per event per worker, until there are ``totalWorkers``. Playback always has a 
+    single worker, in addition to ``totalWorkers``.
+
+    :param stageTimes:
+        The time per event of the ``'importer'``, ``'processing'`` and ``'sonification'`` 
+        stages, eg. from :func:`measureStageTimes`.
+    :param totalWorkers:
+        Total number of workers for these stages. Defaults to the number of processors less one
+        for playback.
+    """
+    if totalWorkers is None:
+        totalWorkers = (os.cpu_count() or 1) - 1
+    workers = {stage: 1 for stage in stageTimes}
+    while sum(workers.values()) < totalWorkers:
+        slowest = max(workers, key=lambda stage: stageTimes[stage] / workers[stage])
+        workers[slowest] += 1
+    workers["playback"] = 1
+    return workers
             
@@ -0,0 +1,433 @@
+"""Local caching of imported data, so that repeated imports of the same data do not download it
+again. Enabled for all imports with::
+
+    from magSonify.Caching import CachedDataSource
+    from magSonify.DataSource import setDefaultDataSource
+    setDefaultDataSource(CachedDataSource(maxBytes=2*1024**3))
+
+:class:`CachedDataSource` serves repeated identical requests. :class:`IntervalCache` also serves
+requests for overlapping time ranges, eg. sliding windows, fetching only the parts not cached.
+The caches are stored in :func:`defaultCacheDirectory`, unless another directory is given.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+import numpy as np
+
+from .DataSource import DataSource, CdasDataSource, _asStoredArray, _mergeResponses, _selectTimes
+
+def defaultCacheDirectory() -> str:
+    """Returns the directory used for caching. This is the environment variable
+    ``MAGSONIFY_CACHE_DIR`` if set. Otherwise it is ``magSonify`` in the user cache directory of
+    the platform: ``%LOCALAPPDATA%`` on Windows, ``~/Library/Caches`` on macOS, or
+    ``$XDG_CACHE_HOME``, defaulting to ``~/.cache``, elsewhere."""
+    override = os.getenv("MAGSONIFY_CACHE_DIR")
+    if override:
+        return override
+    if sys.platform == "win32" and os.getenv("LOCALAPPDATA"):
+        base = os.getenv("LOCALAPPDATA")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"),"Library","Caches")
+    else:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"),".cache")
+    return os.path.join(base,"magSonify")
+
+def _directorySize(directory: str) -> tuple:
+    """Returns the total size in bytes and the number of files in ``directory`` and its
+    subdirectories"""
+    totalSize = 0
+    numberFiles = 0
+    for root, directories, files in os.walk(directory):
+        for name in files:
+            try:
+                totalSize += os.path.getsize(os.path.join(root,name))
+                numberFiles += 1
+            except OSError:
+                # Removed by another process
+                pass
+    return totalSize, numberFiles
+
+def _writeNpzAtomic(fileName: str, data: dict) -> int:
+    """Writes ``data`` to ``fileName`` as NPZ, so that other processes never see a partially
+    written file. Returns the size of the file."""
+    directory = os.path.dirname(fileName)
+    os.makedirs(directory,exist_ok=True)
+    handle, temporaryName = tempfile.mkstemp(suffix=".tmp",dir=directory)
+    try:
+        with os.fdopen(handle,"wb") as file:
+            np.savez(file,**data)
+        size = os.path.getsize(temporaryName)
+        os.replace(temporaryName,fileName)
+    except BaseException:
+        try:
+            os.remove(temporaryName)
+        except OSError:
+            pass
+        raise
+    return size
+
+def _evictLeastRecentlyUsed(directory: str, maxBytes: int, keep=()) -> int:
+    """Deletes the files in ``directory`` with the oldest modification times until the total 
+    size is within ``maxBytes``, other than the files named in ``keep``, eg. those being read. 
+    Returns the number of files deleted."""
+    files = []
+    evictions = 0
+    for root, directories, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".tmp"):
+                # Being written by another process
+                continue
+            fileName = os.path.join(root,name)
+            try:
+                stat = os.stat(fileName)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, fileName))
+    totalSize = sum(size for mtime, size, fileName in files)
+    for mtime, size, fileName in sorted(files):
+        if totalSize <= maxBytes:
+            break
+        if fileName in keep:
+            continue
+        try:
+            os.remove(fileName)
+            evictions += 1
+        except OSError:
+            # Removed by another process, or open for reading on Windows
+            pass
+        totalSize -= size
+    return evictions
+
+class CachedDataSource(DataSource):
+    """Wraps a :class:`DataSource`, storing the response to each request in a local directory.
+    Repeated identical requests, for the same dataset, variables and time range, are then read
+    from disk.
+
+    Each response is an NPZ file in a subdirectory for its dataset, named by a hash of the
+    request. Accessing a file updates its modification time, and when the cache exceeds
+    ``maxBytes`` the least recently used files are deleted.
+
+    Several processes may use the same directory at once. Files are written to a temporary file
+    which is then renamed, so are never read partially written, and files deleted by another
+    process while being read are treated as a miss.
+
+    :param source: The data source to cache, defaults to :class:`CdasDataSource`
+    :param directory: 
+        The cache directory, defaults to ``responses`` in :func:`defaultCacheDirectory`
+    :param maxBytes: Maximum size of the cache on disk
+    """
+    _defaultSubdirectory = "responses"
+
+    def __init__(self, source: DataSource = None, directory: str = None, maxBytes: int = 2**30):
+        if source is None:
+            source = CdasDataSource()
+        if directory is None:
+            directory = os.path.join(defaultCacheDirectory(),self._defaultSubdirectory)
+        self.source = source
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        """Number of requests read from the cache"""
+        self.misses = 0
+        """Number of requests passed on to :attr:`source`"""
+        self.bytesRead = 0
+        """Bytes of files read from the cache"""
+        self.bytesWritten = 0
+        """Bytes of files written to the cache"""
+        self.evictions = 0
+        """Number of files deleted by this instance to keep within ``maxBytes``"""
+
+    def _fileName(self, dataset, startTime, stopTime, variables) -> str:
+        key = repr((
+            dataset,
+            tuple(variables),
+            str(np.datetime64(startTime,'us')),
+            str(np.datetime64(stopTime,'us')),
+        ))
+        return os.path.join(
+            self.directory,dataset,hashlib.sha256(key.encode()).hexdigest()[:32] + ".npz"
+        )
+
+    def get_data(
+        self, dataview, dataset, startTime, stopTime, variables, cdf=False, progress=True
+    ) -> dict:
+        fileName = self._fileName(dataset,startTime,stopTime,variables)
+        try:
+            with np.load(fileName) as file:
+                data = {key: file[key] for key in file.files}
+            self.bytesRead += os.path.getsize(fileName)
+            os.utime(fileName)
+            self.hits += 1
+            return data
+        except (FileNotFoundError, PermissionError):
+            pass
+        except (zipfile.BadZipFile, ValueError, EOFError):
+            # Damaged, eg. by a full disk, so is replaced
+            pass
+
+        self.misses += 1
+        data = self.source.get_data(
+            dataview,dataset,startTime,stopTime,variables,cdf=cdf,progress=progress
+        )
+        if data is None:
+            return None
+        data = {key: _asStoredArray(d) for key, d in data.items()}
+        self.bytesWritten += _writeNpzAtomic(fileName,data)
+        self.evict()
+        return data
+
+    def evict(self, keep=()) -> None:
+        """Deletes the least recently used files until the cache is within ``maxBytes``, other 
+        than the files named in ``keep``"""
+        self.evictions += _evictLeastRecentlyUsed(self.directory,self.maxBytes,keep)
+
+    def statistics(self) -> dict:
+        """Returns the ``'hits'``, ``'misses'``, ``'bytesRead'``, ``'bytesWritten'`` and
+        ``'evictions'`` of this instance, and the ``'size'`` in bytes and number of ``'files'``
+        of the cache on disk"""
+        size, numberFiles = _directorySize(self.directory)
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytesRead': self.bytesRead,
+            'bytesWritten': self.bytesWritten,
+            'evictions': self.evictions,
+            'size': size,
+            'files': numberFiles,
+        }
+
+    def clear(self) -> None:
+        """Deletes all files in the cache"""
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+def _chunkName(startTime: np.datetime64, endTime: np.datetime64) -> str:
+    """Returns the file name of a chunk covering ``startTime`` to ``endTime``, as microseconds
+    since 1970, so that names are exact and order as the times"""
+    start, end = (np.datetime64(time,'us').astype(np.int64) for time in (startTime, endTime))
+    return f"{start}--{end}.npz"
+
+class IntervalCache(CachedDataSource):
+    """Wraps a :class:`DataSource`, storing the data of each dataset by time. A request is served
+    from the stored data where it covers the requested range, and only the gaps are requested
+    from ``source``. Overlapping requests, eg. from sliding windows, or a request for part of a
+    range already imported, therefore download each sample once::
+
+        cache = IntervalCache(maxBytes=2*1024**3)
+        setDefaultDataSource(cache)
+
+    The data of each dataset and set of variables is stored as chunks, NPZ files named by the
+    time range they cover. Samples in more than one chunk, eg. at the boundary of two requests,
+    are returned once, as :meth:`DataSet.removeDuplicateTimes`. After new data is stored,
+    chunks which overlap or touch are merged by :meth:`compact`, up to ``maxChunkBytes``. The 
+    least recently used chunks are deleted when the cache exceeds ``maxBytes``, as for 
+    :class:`CachedDataSource`, and are requested again if needed. The chunks of the current 
+    request are kept, so the cache may exceed ``maxBytes`` by the size of one request.
+
+    Ranges with no data are stored as empty chunks, so are not requested again.
+
+    :param source: The data source to cache, defaults to :class:`CdasDataSource`
+    :param directory: 
+        The cache directory, defaults to ``intervals`` in :func:`defaultCacheDirectory`
+    :param maxBytes: Maximum size of the cache on disk
+    :param maxChunkBytes: 
+        Chunks are not merged beyond this size, as each merge rewrites the merged chunk
+    """
+    _defaultSubdirectory = "intervals"
+
+    def __init__(
+        self, 
+        source: DataSource = None, 
+        directory: str = None, 
+        maxBytes: int = 2**30,
+        maxChunkBytes: int = 2**24,
+    ):
+        super().__init__(source,directory,maxBytes)
+        self.maxChunkBytes = maxChunkBytes
+        self.partialHits = 0
+        """Number of requests partly read from the cache, with the gaps passed on to 
+        :attr:`source`"""
+        self.gapsFetched = 0
+        """Number of requests made to :attr:`source`"""
+
+    def _chunkDirectory(self, dataset: str, variables) -> str:
+        key = repr(tuple(sorted(variables)))
+        return os.path.join(
+            self.directory,dataset,hashlib.sha256(key.encode()).hexdigest()[:16]
+        )
+
+    @staticmethod
+    def _chunks(directory: str) -> list:
+        """Returns the ``(startTime, endTime, fileName)`` of the chunks in ``directory``, sorted
+        by time"""
+        chunks = []
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return chunks
+        for name in names:
+            if not name.endswith(".npz"):
+                continue
+            try:
+                start, end = (
+                    np.datetime64(int(part),'us') for part in name[:-len(".npz")].split("--")
+                )
+            except ValueError:
+                continue
+            chunks.append((start, end, os.path.join(directory,name)))
+        return sorted(chunks)
+
+    @staticmethod
+    def _gaps(chunks: list, startTime: np.datetime64, stopTime: np.datetime64) -> list:
+        """Returns the ``(startTime, stopTime)`` of each part of the range not covered by 
+        ``chunks``"""
+        gaps = []
+        covered = startTime
+        for chunkStart, chunkEnd, fileName in chunks:
+            if chunkEnd < covered:
+                continue
+            if chunkStart > stopTime:
+                break
+            if chunkStart > covered:
+                gaps.append((covered, chunkStart))
+            covered = max(covered,chunkEnd)
+        if covered < stopTime:
+            gaps.append((covered, stopTime))
+        return gaps
+
+    def get_data(
+        self, dataview, dataset, startTime, stopTime, variables, cdf=False, progress=True
+    ) -> dict:
+        startTime = np.datetime64(startTime,'us')
+        stopTime = np.datetime64(stopTime,'us')
+        directory = self._chunkDirectory(dataset,variables)
+        for attempt in range(3):
+            gaps = self._gaps(self._chunks(directory),startTime,stopTime)
+            if attempt == 0:
+                if not gaps:
+                    self.hits += 1
+                elif gaps == [(startTime, stopTime)]:
+                    self.misses += 1
+                else:
+                    self.partialHits += 1
+            for gapStart, gapStop in gaps:
+                self.gapsFetched += 1
+                try:
+                    data = self.source.get_data(
+                        dataview,dataset,gapStart.astype(object),gapStop.astype(object),
+                        variables,cdf=cdf,progress=progress
+                    )
+                except ValueError:
+                    # No data in the gap
+                    data = {}
+                if data is None:
+                    return None
+                data = {key: _asStoredArray(d) for key, d in data.items()}
+                self.bytesWritten += _writeNpzAtomic(
+                    os.path.join(directory,_chunkName(gapStart,gapStop)),data
+                )
+            if gaps:
+                self.compact(dataset,variables)
+                self.evict(keep={
+                    fileName for chunkStart, chunkEnd, fileName in self._chunks(directory)
+                    if chunkStart <= stopTime and chunkEnd >= startTime
+                })
+            try:
+                parts = self._read(directory,startTime,stopTime)
+                break
+            except FileNotFoundError:
+                # Merged or evicted by another process, so list the chunks again
+                continue
+        else:
+            raise FileNotFoundError(f"Chunks of {dataset} removed while being read")
+        parts = [part for part in parts if part]
+        if not parts:
+            raise ValueError("No data in the requested range")
+        return _selectTimes(_mergeResponses(parts),startTime,stopTime)
+
+    def _read(self, directory: str, startTime: np.datetime64, stopTime: np.datetime64) -> list:
+        """Returns the data of the chunks overlapping the range. Raises ``FileNotFoundError`` if 
+        any are removed before being read, or the chunks no longer cover the range."""
+        chunks = [
+            chunk for chunk in self._chunks(directory)
+            if chunk[0] <= stopTime and chunk[1] >= startTime
+        ]
+        if self._gaps(chunks,startTime,stopTime):
+            # Evicted by another process
+            raise FileNotFoundError(directory)
+        parts = []
+        for chunkStart, chunkEnd, fileName in chunks:
+            try:
+                with np.load(fileName) as file:
+                    parts.append({key: file[key] for key in file.files})
+                self.bytesRead += os.path.getsize(fileName)
+                os.utime(fileName)
+            except (zipfile.BadZipFile, ValueError, EOFError):
+                # Damaged, so is removed and requested again
+                try:
+                    os.remove(fileName)
+                except OSError:
+                    pass
+                raise FileNotFoundError(fileName)
+        return parts
+
+    def compact(self, dataset: str, variables) -> None:
+        """Merges chunks of ``dataset`` and ``variables`` which overlap or touch, whilst the 
+        merged chunk is within ``maxChunkBytes``"""
+        directory = self._chunkDirectory(dataset,variables)
+        groups = []
+        groupBytes = 0
+        for chunk in self._chunks(directory):
+            try:
+                size = os.path.getsize(chunk[2])
+            except OSError:
+                # Removed by another process
+                continue
+            if (
+                groups 
+                and chunk[0] <= max(chunkEnd for chunkStart, chunkEnd, fileName in groups[-1])
+                and groupBytes + size <= self.maxChunkBytes
+            ):
+                groups[-1].append(chunk)
+                groupBytes += size
+            else:
+                groups.append([chunk])
+                groupBytes = size
+        for group in groups:
+            if len(group) == 1:
+                continue
+            parts = []
+            try:
+                for chunkStart, chunkEnd, fileName in group:
+                    with np.load(fileName) as file:
+                        parts.append({key: file[key] for key in file.files})
+            except (FileNotFoundError, zipfile.BadZipFile, ValueError, EOFError):
+                # Being compacted by another process
+                continue
+            groupStart = group[0][0]
+            groupEnd = max(chunkEnd for chunkStart, chunkEnd, fileName in group)
+            parts = [part for part in parts if part]
+            fileName = os.path.join(directory,_chunkName(groupStart,groupEnd))
+            self.bytesWritten += _writeNpzAtomic(
+                fileName,_mergeResponses(parts) if parts else {}
+            )
+            for chunkStart, chunkEnd, chunkName in group:
+                if chunkName != fileName:
+                    try:
+                        os.remove(chunkName)
+                    except OSError:
+                        pass
+
+    def statistics(self) -> dict:
+        """Returns the statistics of :meth:`CachedDataSource.statistics`, with the number of
+        ``'partialHits'`` and ``'gapsFetched'``"""
+        return {
+            **super().statistics(),
+            'partialHits': self.partialHits,
+            'gapsFetched': self.gapsFetched,
+        }
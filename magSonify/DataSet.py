@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-from operator import add, neg, sub
 from typing import List, Tuple
+import json
+import os
+import tempfile
 from .Audio import writeoutAudio
 import numpy as np
-from scipy.interpolate.interpolate import interp1d
-from scipy.ndimage.filters import uniform_filter1d
 from .TimeSeries import TimeSeries
-from copy import deepcopy
 
 class DataSet():
     """Represents a data set with multiple data series sampled at common time points.
@@ -19,6 +18,12 @@ class DataSet():
         to be represented under the keys ``int`` ``0``, ``1`` and ``2`` respectively if they are 
         present. Array should be 1D.
     """
+    # Ensures numpy defers to the DataSet operators, eg. ``np.float64(2) * myDataSet``
+    __array_ufunc__ = None
+
+    memmapBlockSize = 2**18
+    """Number of samples processed at a time for memory mapped components, see :meth:`toMemmap`"""
+
     def __init__(self,timeSeries: TimeSeries,data):
         # We use a copy of the time series here in order to prevent issues occuring due to multiple
         # data sets sharing the same time series.
@@ -29,6 +34,27 @@ class DataSet():
         self.data: dict = data
         """Dictionary of numpy arrays containing the data."""
 
+    @classmethod
+    def _fromParts(cls,timeSeries: TimeSeries,data: dict) -> DataSet:
+        """Constructs a data set which references ``timeSeries`` and ``data`` directly, without 
+        copying or validating them. ``timeSeries`` must not be shared with another data set.
+        """
+        dataSet = cls.__new__(cls)
+        dataSet.timeSeries = timeSeries
+        dataSet.data = data
+        return dataSet
+
+    def _newWithData(self,data: dict,cls: type = None) -> DataSet:
+        """Returns a new data set containing ``data``, sampled at the same times as this one. The
+        new data set gets its own time series object, which shares the times array with 
+        :attr:`timeSeries` rather than copying it.
+
+        :param cls: Class of the new data set, defaults to the type of this data set.
+        """
+        if cls is None:
+            cls = type(self)
+        return cls._fromParts(self.timeSeries._shallowCopy(),data)
+
     def _convertToDictIfArray(self,data):
         try:
             data.items()
@@ -48,18 +74,145 @@ class DataSet():
         """
         return self.data.keys()
 
-    def fillNaN(self,const=0) -> None:
-        """Fills ``NaN`` values in the data with the constant ``const``"""
+    def toMemmap(self,directory: str = None) -> None:
+        """Moves each component into a ``numpy.memmap`` backed by a temporary file in 
+        ``directory``, or the default temporary directory if ``None``. The files are deleted once 
+        the arrays are no longer referenced.
+
+        Operations which produce new components, such as the arithmetic operators, 
+        :meth:`_iterate` and :meth:`copy`, then allocate their output as memory mapped arrays in 
+        the same directory, and process the data in blocks of :attr:`memmapBlockSize` samples. 
+        This allows data sets larger than the available memory, eg. long time stretched audio, 
+        to be processed and written out with :meth:`genMonoAudio`. Slicing returns views of the
+        memory mapped arrays.
+
+        Components may also be memory mapped arrays opened elsewhere, eg. by :meth:`load`, in 
+        which case outputs are placed in the default temporary directory.
+        """
+        for i, d in self.items():
+            memmap = _temporaryMemmap(len(d),d.dtype,directory)
+            memmap[:] = d
+            self.data[i] = memmap
+
+    def save(self,directory: str) -> None:
+        """Saves the data set to ``directory``, which is created if it does not exist. The times and
+        each component are written as uncompressed ``.npy`` files, with the keys, time unit and 
+        start time in ``metadata.json``. Load the data set with :meth:`DataSet.load`. Keys of 
+        :attr:`data` must be ``int`` or ``str``.
+        """
+        os.makedirs(directory,exist_ok=True)
+        components = []
+        for index, (key, d) in enumerate(self.items()):
+            if isinstance(key,np.integer):
+                key = int(key)
+            if not isinstance(key,(int,str)):
+                raise TypeError(f"Cannot save component with key {key!r}, keys must be int or str")
+            fileName = f"component{index}.npy"
+            _saveArray(os.path.join(directory,fileName),d)
+            components.append([key,fileName])
+        _saveArray(os.path.join(directory,"times.npy"),self.timeSeries.times)
+        _writeMetadata(directory,{
+            'class': type(self).__name__,
+            'components': components,
+            'timeSeries': self.timeSeries._getMetadata(),
+        })
+
+    @staticmethod
+    def load(directory: str,mmapMode: str = 'c') -> DataSet:
+        """Loads a data set saved with :meth:`save`, as an instance of the class it was saved from.
+        ::
+
+            magneticField = DataSet.load("processed/magneticField")
+
+        :param mmapMode:
+            Mode used to memory map the arrays, as for ``numpy.load``. The default ``'c'`` (copy on
+            write) only reads data from disk as it is accessed, and allows the data set to be 
+            modified without changing the saved files. If ``None``, the arrays are loaded into 
+            memory.
+        """
+        from .DataSet_1D import DataSet_1D
+        metadata = _readMetadata(directory)
+        classes = {cls.__name__: cls for cls in (DataSet,DataSet_1D,DataSet_3D)}
+        try:
+            returnClassType = classes[metadata['class']]
+        except KeyError:
+            raise ValueError(f"Unknown data set class {metadata['class']!r} in {directory}")
+
+        def loadArray(fileName):
+            return np.load(os.path.join(directory,fileName),mmap_mode=mmapMode,allow_pickle=False)
+        timeSeries = TimeSeries._fromMetadata(loadArray("times.npy"),metadata['timeSeries'])
+        data = {key: loadArray(fileName) for key, fileName in metadata['components']}
+        return returnClassType._fromParts(timeSeries,data)
+
+    def fillNaN(self,const=0,inPlace=False) -> None:
+        """Fills ``NaN`` values in the data with the constant ``const``
+
+        :param inPlace:
+            If ``True``, the arrays in :attr:`data` are modified rather than replaced, which 
+            avoids a copy. Arrays shared with other data sets are then also modified, eg. by a 
+            data set from :meth:`sliceTime` or :meth:`MagnetometerData.window`, so this should 
+            only be used where the data set owns its arrays.
+        """
         for i, d in self.items():
-            self.data[i] = np.nan_to_num(d,nan=const)
+            self.data[i] = np.nan_to_num(d,copy=not inPlace,nan=const)
 
     def constrainAbsoluteValue(self,max) -> None:
         """Limits the data to within bounds of ``-max`` to ``+max``, values outside 
         are set to ``-max`` or ``+max`` respectively.
         """
         for i, d in self.items():
-            d[d>max] = max
-            d[d<-max] = -max
+            np.clip(d,-max,max,out=d)
+
+    def clean(
+        self,
+        maxAbsoluteValue=None,
+        fillNaNValue=None,
+        flags: np.array = None,
+        flagFillValue=0,
+        blockSize=2**16,
+    ) -> dict:
+        """Cleans the data in place, combining :meth:`fillNaN`, :meth:`constrainAbsoluteValue` and
+        :meth:`fillFlagged`. Each rule is only applied if its parameter is specified, in the order
+        listed below. The rules are applied block by block, so each component is read from memory 
+        once rather than once per rule.
+        ::
+
+            counts = myDataSet.clean(maxAbsoluteValue=400,fillNaNValue=0)
+
+        :param fillNaNValue:
+            Value to replace ``NaN`` with. Unlike :meth:`fillNaN`, infinite values are not replaced.
+        :param maxAbsoluteValue:
+            Values are limited to within the bounds ``-maxAbsoluteValue`` to ``+maxAbsoluteValue``.
+        :param flags:
+            Boolean array of same length as the data set, identifying the indicies to fill 
+            with ``flagFillValue``.
+        :param int blockSize:
+            Number of samples processed at a time.
+        :return:
+            Dictionary with the number of values changed by each rule, summed over all components, 
+            under the keys ``'nan'``, ``'clipped'`` and ``'flagged'``.
+        """
+        counts = {'nan': 0, 'clipped': 0, 'flagged': 0}
+        if flags is not None:
+            flags = np.asarray(flags,dtype=bool)
+        for i, d in self.items():
+            for start in range(0,len(d),blockSize):
+                block = d[start:start+blockSize]
+                if fillNaNValue is not None:
+                    nanMask = np.isnan(block)
+                    counts['nan'] += np.count_nonzero(nanMask)
+                    np.copyto(block,fillNaNValue,where=nanMask)
+                if maxAbsoluteValue is not None:
+                    counts['clipped'] += (
+                        np.count_nonzero(block > maxAbsoluteValue)
+                        + np.count_nonzero(block < -maxAbsoluteValue)
+                    )
+                    np.clip(block,-maxAbsoluteValue,maxAbsoluteValue,out=block)
+                if flags is not None:
+                    blockFlags = flags[start:start+blockSize]
+                    counts['flagged'] += np.count_nonzero(blockFlags)
+                    block[blockFlags] = flagFillValue
+        return counts
 
     def interpolateFactor(self,factor: float) -> None:
         """Interpolates the data set, increasing the sample time resolution by 
@@ -81,9 +234,11 @@ class DataSet():
         """
 
         self._setupTimeSeriesForInterpolation(ref)
-        self._interpolate(ref)
+        self._interpolate(ref._shallowCopy())
 
     def _interpolate(self, newTimes: TimeSeries):
+        # Imported when used, as scipy.interpolate is slow to import
+        from scipy.interpolate import interp1d
         for i, d in self.items():
             fd = interp1d(self.timeSeries.asFloat(),d,kind="cubic",fill_value="extrapolate")
             self.data[i] = fd(newTimes.asFloat())
@@ -94,40 +249,59 @@ class DataSet():
         """Sets up :attr:`timeSeries` for interpolation by matching the units and 
         start time of ``ref``"""
         if ref.startTime is not None:
-            self.timeSeries = TimeSeries(
-                self.timeSeries.asDatetime(),
-                ref.timeUnit,
-                ref.startTime
-            )
+            self.timeSeries._raiseIfNoStartTime()
+            offset = (self.timeSeries.startTime - ref.startTime) / ref.timeUnit
+            times = self.timeSeries.times * (self.timeSeries.timeUnit / ref.timeUnit) + offset
+            self.timeSeries = TimeSeries._fromFloat(times,ref.timeUnit,ref.startTime)
         else:
             self.timeSeries.changeUnit(ref.timeUnit)
 
 
-    def runningAverage(self,samples=None,timeWindow=None) -> DataSet:
+    def runningAverage(
+        self,
+        samples=None,
+        timeWindow=None,
+        shrinkEdges=False,
+        returnCounts=False
+    ) -> DataSet:
         """Returns a running average of the data with window size ``samples`` or period ``timeWindow``.
         Pass only ``samples`` OR ``timeWindow`` exculsively.
-        """
-        if timeWindow is not None:
-            samples = int(timeWindow / self.timeSeries.getMeanInterval())
 
-        if samples == 0:
-            raise ValueError("Cannot generate a running average for an interval of 0 samples.")
+        ``NaN`` values are excluded from the average, so a gap in the data only affects the 
+        samples within it rather than every window which overlaps it. Windows containing no valid 
+        samples give ``NaN``. The average is computed from cumulative sums, in a single pass over 
+        all components.
+
+        :param int samples:
+            Number of samples in the window.
+        :param np.timedelta64 timeWindow:
+            Duration of the window. The window for each sample covers the times within 
+            ``timeWindow / 2`` of it, so this is also suitable for non-uniformly sampled data.
+        :param shrinkEdges:
+            If ``True``, windows which extend beyond the ends of the data are truncated to the 
+            available samples. Otherwise the average is set to ``NaN`` for these samples.
+        :param returnCounts:
+            If ``True``, returns a tuple ``(meanDataSet, countDataSet)`` where ``countDataSet`` 
+            contains the number of valid samples in the window for each point.
+        """
+        halfWindow = _runningAverageHalfWindow(self.timeSeries,samples,timeWindow)
+        times = self.timeSeries.asFloat()
+        lower, upper, complete = _runningAverageWindows(times,0,len(times),samples,halfWindow)
 
-        def _runningAverage(d):
-            mean_d = uniform_filter1d(
-                d,samples,mode='constant',cval=0, origin=0
-            )
-            # First samples/2 values are distorted by edge effects, so we set them to np.nan
-            mean_d[0:samples//2] = np.nan
-            mean_d[-samples//2+1:] = np.nan
-            return mean_d
+        keys = list(self.keys())
+        means, counts = _windowMeans(np.stack([self.data[key] for key in keys]),lower,upper)
+        if not shrinkEdges:
+            means[:,~complete] = np.nan
 
-        meanData = self._iterate(_runningAverage)
-        return type(self)(self.timeSeries,meanData)
+        meanDataSet = self._newWithData(dict(zip(keys,means)))
+        if returnCounts:
+            return meanDataSet, self._newWithData(dict(zip(keys,counts)))
+        return meanDataSet
 
     def extractKey(self,key) -> DataSet_1D:
         """Extract element from ``self.data[key]`` in new data set"""
-        return DataSet_1D(self.timeSeries,deepcopy(self.data[key]))
+        from .DataSet_1D import DataSet_1D
+        return self._newWithData({0: self.data[key].copy()},DataSet_1D)
 
     def genMonoAudio(self,key,file,sampleRate=44100) -> None:
         """Generate a mono audio file from data in the series ``self.data[key]``
@@ -138,8 +312,9 @@ class DataSet():
         writeoutAudio(self.data[key],file,sampleRate)
 
     def copy(self) -> DataSet:
-        """Returns a copy of the data set"""
-        return type(self)(self.timeSeries,deepcopy(self.data))
+        """Returns a copy of the data set. Memory mapped components are copied to new memory 
+        mapped arrays."""
+        return self._fromParts(self.timeSeries.copy(),self._iterate(np.copy))
 
     def fillFlagged(self,flags: np.array,const=0) -> None:
         """Fill values according to an array of flags, across all components
@@ -156,50 +331,127 @@ class DataSet():
 
     def removeDuplicateTimes(self) -> None:
         """Removes duplicate values in the time series by deleting all but the first occurence.
-        Removes correspoinding points in each component.
+        Removes correspoinding points in each component. Also sorts the data set by time, if it is 
+        not already sorted.
+
+        If the times are already sorted and unique, returns without copying any data.
         """
-        unique, index = np.unique(self.timeSeries.times, return_index=True)
-        self.timeSeries.times = unique
+        times = self.timeSeries.times
+        if len(times) < 2:
+            return
+        steps = np.diff(times)
+        minStep = steps.min()
+        if minStep > 0:
+            return
+
+        if minStep == 0:
+            # Sorted with duplicates, keep the first of each run of equal times
+            keep = np.empty(len(times),dtype=bool)
+            keep[0] = True
+            np.not_equal(steps,0,out=keep[1:])
+            index = np.flatnonzero(keep)
+        else:
+            # Timsort is used for stable sorting of floats, which is close to linear time for 
+            # nearly sorted data
+            order = np.argsort(times,kind='stable')
+            keep = np.empty(len(times),dtype=bool)
+            keep[0] = True
+            np.not_equal(np.diff(times[order]),0,out=keep[1:])
+            index = order[keep]
+
+        self.timeSeries.times = times[index]
         for i,d in self.items():
             self.data[i] = d[index]
 
-    def _iterate(self,lamb: function,replace=False) -> dict:
+    def _iterate(self,lamb: function,replace=False,out: dict = None) -> dict:
         """Execute function ``lamb`` on each component in :attr:`data`
         
         :param lamb:
             Function to perform on each component, should accept a single parameter which is a 
             1D numpy array and return an array of the same shape as output.
         :type lamb: function
+        :param out:
+            Dictionary of numpy arrays, with the same keys as in :attr:`data`, in which to place 
+            the output. ``lamb`` is then called as ``lamb(d, out=out[key])``, so must accept the 
+            ``out`` keyword in the manner of numpy ufuncs, eg. ``np.negative``.
         :return: 
             A dictionary of numpy arrays with the same keys as in :attr:`data`, unless 
-            ``replace=True``, in which case returns ``None``.
+            ``replace=True``, in which case returns ``None``. If ``out`` is specified, returns 
+            ``out``.
         :rtype: ``dict`` | ``None``
+
+        Memory mapped components are processed in blocks, see :meth:`_applyBlockwise`.
         """
+        if out is not None:
+            for i,d in self.items():
+                self._applyBlockwise(lamb,d,out=out[i])
+            return out
         newData = {}
         for i,d in self.items():
             if replace:
-                self.data[i] = lamb(d)
+                self.data[i] = self._applyBlockwise(lamb,d)
             else:
-                newData[i] = lamb(d)
+                newData[i] = self._applyBlockwise(lamb,d)
         if replace:
             return None
         return newData
 
-    def _iteratePair(self,other: DataSet,lamb: function) -> DataSet:
+    def _iteratePair(self,other,lamb: function,out: DataSet = None) -> DataSet:
         """Execute function ``lamb`` on each component pair in ``self.data`` and ``other.data`` 
         with the same keys. ``self`` and ``other`` must have the same time series and same keys in 
         :attr:`data`.
 
+        :param other:
+            A :class:`DataSet`, or a scalar or numpy array which is passed to ``lamb`` 
+            with each component of ``self``.
         :param lamb:
             Performed on each component, should accept two parameters which are 
             1D numpy arrays of the same shape and return an array of the same shape as output.
         :type lamb: function
+        :param out:
+            Data set in which to place the output, eg. ``self`` for an in place operation. 
+            ``lamb`` is then called as ``lamb(d, o, out=out.data[key])``, so must accept the 
+            ``out`` keyword in the manner of numpy ufuncs, eg. ``np.add``. Returns ``out``.
         """
-        self._raiseIfTimeSeriesNotEqual(other)
+        isDataSet = isinstance(other,DataSet)
+        if isDataSet:
+            self._raiseIfTimeSeriesNotEqual(other)
+        if out is not None:
+            for i, d in self.items():
+                self._applyBlockwise(lamb,d,other.data[i] if isDataSet else other,out=out.data[i])
+            return out
         res = {}
         for i, d in self.items():
-            res[i] = lamb(d,other.data[i])
-        return type(self)(self.timeSeries,res)
+            res[i] = self._applyBlockwise(lamb,d,other.data[i] if isDataSet else other)
+        return self._newWithData(res)
+
+    def _applyBlockwise(self,lamb: function,d: np.array,*args,out: np.array = None) -> np.array:
+        """Returns ``lamb(d, *args)``, or calls ``lamb(d, *args, out=out)`` if ``out`` is 
+        specified. ``args`` may contain arrays of the same length as ``d`` or scalars.
+
+        If ``d`` or any of ``args`` are a ``numpy.memmap``, ``lamb`` is instead called on 
+        consecutive blocks of :attr:`memmapBlockSize` samples, so the arrays are never fully 
+        loaded into memory, and the output is allocated as a memory mapped array. ``lamb`` must 
+        then operate on each sample independently.
+        """
+        memmaps = [a for a in (d,*args) if isinstance(a,np.memmap)]
+        result = out
+        if memmaps:
+            for start in range(0,len(d),self.memmapBlockSize):
+                block = slice(start,start + self.memmapBlockSize)
+                blockArgs = [a[block] if np.ndim(a) > 0 else a for a in (d,*args)]
+                if out is not None:
+                    lamb(*blockArgs,out=out[block])
+                    continue
+                resultBlock = lamb(*blockArgs)
+                if result is None:
+                    result = _emptyLike(memmaps[0],len(d),resultBlock.dtype)
+                result[block] = resultBlock
+        if result is None or not memmaps:
+            if out is not None:
+                return lamb(d,*args,out=out)
+            return lamb(d,*args)
+        return result
 
     def _raiseIfTimeSeriesNotEqual(self, other):
         if (self.timeSeries != other.timeSeries):
@@ -211,32 +463,208 @@ class DataSet():
 
             myNewDataSet   = myDataSet[100:200]
             myOtherDataSet = myDataSet[200:None:3]
+
+        The time series and components of the new data set are views of those in the parent, so 
+        no data is copied. Use :meth:`copy` on the result if an independent data set is required.
         """
         if isinstance(subscript,slice):
-            res = self._iterate(
-                lambda series: series[subscript]
-            )
-            return type(self)(self.timeSeries[subscript],res)
+            res = {i: d[subscript] for i, d in self.items()}
+            return self._fromParts(self.timeSeries[subscript],res)
     
+    def lazy(self) -> LazyDataSet:
+        """Returns a :class:`LazyDataSet` referencing this data set, for building a chain of 
+        operations which are evaluated together in chunks. See :class:`LazyDataSet`."""
+        from .LazyDataSet import LazyDataSet
+        return LazyDataSet._fromDataSet(self)
+
+    def sliceTime(self,start=None,end=None) -> DataSet:
+        """Returns the subsection of the data set with sample times between ``start`` and ``end``
+        inclusive. The components of the returned data set are views of those in :attr:`data`.
+        ::
+
+            myWindow = myDataSet.sliceTime(datetime(2007,9,4,6),datetime(2007,9,4,18))
+
+        :param start:
+            Start of the range as ``datetime.datetime`` or ``numpy.datetime64``. If ``None``, 
+            starts from the first sample.
+        :param end:
+            End of the range as ``datetime.datetime`` or ``numpy.datetime64``. If ``None``,
+            continues to the last sample.
+        """
+        return self[self.timeSeries.sliceBetween(start,end)]
+
     def __add__(self,other) -> DataSet:
         """
         Supports addition: ``sumDataSet = firstDataSet + secondDataSet``
 
         Requires: ``firstDataSet.timeSeries == secondDataSet.timeSeries``
+
+        ``secondDataSet`` may also be a scalar or a numpy array of the same length as the data set,
+        which is added to every component. This applies to all arithmetic operators.
         """
-        return self._iteratePair(other,add)
+        return self._iteratePair(other,np.add)
+
+    def __radd__(self,other) -> DataSet:
+        """Supports addition of a scalar: ``sumDataSet = 1 + myDataSet``"""
+        return self._iteratePair(other,np.add)
 
     def __sub__(self,other) -> DataSet:
         """Supports subtraction: ``diffDataSet = firstDataSet - secondDataSet```"""
-        return self._iteratePair(other,sub)
+        return self._iteratePair(other,np.subtract)
+
+    def __rsub__(self,other) -> DataSet:
+        """Supports subtraction from a scalar: ``diffDataSet = 1 - myDataSet``"""
+        return self._iteratePair(other,lambda d, o, **kwargs: np.subtract(o,d,**kwargs))
+
+    def __mul__(self,other) -> DataSet:
+        """Supports multiplication: ``productDataSet = firstDataSet * secondDataSet``"""
+        return self._iteratePair(other,np.multiply)
+
+    def __rmul__(self,other) -> DataSet:
+        """Supports multiplication by a scalar: ``productDataSet = 2 * myDataSet``"""
+        return self._iteratePair(other,np.multiply)
+
+    def __truediv__(self,other) -> DataSet:
+        """Supports division: ``quotientDataSet = firstDataSet / secondDataSet``"""
+        return self._iteratePair(other,np.true_divide)
 
     def __neg__(self) -> DataSet:
         """Supports negation: ``negDataSet = - DateSet``"""
-        res = self._iterate(neg)
-        return type(self)(self.timeSeries,res)
+        res = self._iterate(np.negative)
+        return self._newWithData(res)
 
-from .DataSet_1D import DataSet_1D
+    def __iadd__(self,other) -> DataSet:
+        """Supports in place addition: ``myDataSet += otherDataSet``
         
+        The result is written into the existing arrays in :attr:`data`, so any views of them, 
+        eg. from slicing, are also modified. This applies to all in place operators.
+        """
+        return self._iteratePair(other,np.add,out=self)
+
+    def __isub__(self,other) -> DataSet:
+        """Supports in place subtraction: ``myDataSet -= otherDataSet``"""
+        return self._iteratePair(other,np.subtract,out=self)
+
+    def __imul__(self,other) -> DataSet:
+        """Supports in place multiplication: ``myDataSet *= otherDataSet``"""
+        return self._iteratePair(other,np.multiply,out=self)
+
+    def __itruediv__(self,other) -> DataSet:
+        """Supports in place division: ``myDataSet /= otherDataSet``"""
+        return self._iteratePair(other,np.true_divide,out=self)
+
+def _temporaryMemmap(length: int,dtype,directory: str = None) -> np.array:
+    """Returns an uninitialised 1D ``numpy.memmap`` backed by a temporary file in ``directory``. 
+    The file is removed when closed, the mapping keeps the data available until the array and
+    any views of it are garbage collected."""
+    if length == 0:
+        # Empty files cannot be memory mapped
+        return np.empty(0,dtype)
+    with tempfile.NamedTemporaryFile(dir=directory,prefix="magSonify-",suffix=".dat") as file:
+        return np.memmap(file,dtype=dtype,mode='w+',shape=(length,))
+
+def _emptyLike(d: np.array,length: int = None,dtype=None) -> np.array:
+    """Returns an uninitialised 1D array with the length and type of ``d`` unless specified. If 
+    ``d`` is a ``numpy.memmap``, the new array is a temporary memory mapped array. This is placed 
+    in the same directory as ``d`` if ``d`` is also temporary, otherwise in the default temporary
+    directory."""
+    if length is None:
+        length = len(d)
+    if dtype is None:
+        dtype = d.dtype
+    if not isinstance(d,np.memmap):
+        return np.empty(length,dtype)
+    directory = None
+    if d.filename is not None and d.mode == 'w+':
+        directory = os.path.dirname(d.filename)
+    return _temporaryMemmap(length,dtype,directory)
+
+def _saveArray(path: str,d: np.array) -> None:
+    """Saves ``d`` as a ``.npy`` file. The file is written under a temporary name and then 
+    renamed, so an existing file which is memory mapped is replaced rather than overwritten."""
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath,"wb") as file:
+        np.save(file,d,allow_pickle=False)
+    os.replace(temporaryPath,path)
+
+_persistenceFormatVersion = 1
+
+def _writeMetadata(directory: str,metadata: dict) -> None:
+    """Writes ``metadata.json`` in ``directory``, adding the format version"""
+    metadata = {'formatVersion': _persistenceFormatVersion, **metadata}
+    with open(os.path.join(directory,"metadata.json"),"w") as file:
+        json.dump(metadata,file,indent=4)
+
+def _readMetadata(directory: str) -> dict:
+    """Reads ``metadata.json`` in ``directory``, checking the format version"""
+    with open(os.path.join(directory,"metadata.json")) as file:
+        metadata = json.load(file)
+    if metadata.get('formatVersion') != _persistenceFormatVersion:
+        raise ValueError(
+            f"Unsupported format version {metadata.get('formatVersion')!r} in {directory}"
+        )
+    return metadata
+
+def _runningAverageHalfWindow(timeSeries: TimeSeries,samples=None,timeWindow=None) -> float:
+    """Validates the running average window, returning half of ``timeWindow`` in the units of 
+    ``timeSeries``, or ``None`` if ``samples`` is used instead."""
+    if timeWindow is not None:
+        halfWindow = timeWindow / timeSeries.timeUnit / 2
+        if halfWindow <= 0:
+            raise ValueError("Cannot generate a running average for an interval of 0 samples.")
+        return halfWindow
+    if not samples:
+        raise ValueError("Cannot generate a running average for an interval of 0 samples.")
+    return None
+
+def _runningAverageWindows(
+    times: np.array,
+    start: int,
+    stop: int,
+    samples: int = None,
+    halfWindow: float = None,
+) -> Tuple[np.array,np.array,np.array]:
+    """Returns the bounds of the running average windows for the samples ``start`` to ``stop``, 
+    as indicies into ``times``. Uses ``halfWindow`` in units of ``times`` if it is specified, 
+    otherwise windows of ``samples`` samples.
+
+    :return:
+        Tuple of arrays ``(lower, upper, complete)``, where each window covers 
+        ``lower <= index < upper`` and ``complete`` flags windows which do not extend beyond the 
+        ends of ``times``.
+    """
+    numberSamples = len(times)
+    if halfWindow is not None:
+        windowTimes = times[start:stop]
+        lower = np.searchsorted(times,windowTimes - halfWindow,side='left')
+        upper = np.searchsorted(times,windowTimes + halfWindow,side='left')
+        complete = (windowTimes - halfWindow >= times[0]) & (windowTimes + halfWindow <= times[-1])
+    else:
+        lower = np.arange(start,stop) - samples//2
+        upper = lower + samples
+        complete = (lower >= 0) & (upper <= numberSamples)
+        np.clip(lower,0,numberSamples,out=lower)
+        np.clip(upper,0,numberSamples,out=upper)
+    return lower, upper, complete
+
+def _windowMeans(stacked: np.array, lower: np.array, upper: np.array) -> Tuple[np.array,np.array]:
+    """Returns the means and number of valid samples in each window of the rows of ``stacked``, 
+    ignoring ``NaN``. Windows cover ``lower <= index < upper``. ``stacked`` is modified.
+    """
+    numberRows, numberSamples = stacked.shape
+    valid = ~np.isnan(stacked)
+    stacked[~valid] = 0
+
+    cumulativeSum = np.zeros((numberRows,numberSamples+1))
+    np.cumsum(stacked,axis=1,out=cumulativeSum[:,1:])
+    cumulativeCount = np.zeros((numberRows,numberSamples+1),dtype=np.int64)
+    np.cumsum(valid,axis=1,out=cumulativeCount[:,1:])
+
+    counts = cumulativeCount[:,upper] - cumulativeCount[:,lower]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        means = (cumulativeSum[:,upper] - cumulativeSum[:,lower]) / counts
+    return means, counts
+
 class DataSet_3D(DataSet):
     """Represents a data set with multiple data series sampled at common time points.
     
@@ -265,32 +693,111 @@ class DataSet_3D(DataSet):
         ])
         writeoutAudio(audio.T,file,sampleRate)
 
+    @property
+    def vectors(self) -> np.array:
+        """The components ``0``, ``1`` and ``2`` as an array of shape ``(n, 3)``.
+
+        After :meth:`stackVectors` this is a view, so modifying it modifies the components in 
+        :attr:`data`, until a component is replaced. Otherwise it is a copy.
+        """
+        if self._componentsAreRowsOf(self._vectorBuffer):
+            return self._vectorBuffer.T
+        return np.stack((self.data[0],self.data[1],self.data[2]),axis=1)
+
+    def stackVectors(self) -> None:
+        """Moves the components ``0``, ``1`` and ``2`` into a single buffer of shape ``(3, n)``,
+        replacing the arrays in :attr:`data` by its rows. The components keep their dtype if 
+        they share one. Afterwards :attr:`vectors` is a view, and :meth:`cross`, :meth:`dot`,
+        :meth:`norm` and :meth:`coordinateTransform` do not copy the components to stack them.
+
+        Arrays which the components were shared with, eg. by :meth:`sliceTime`, are no longer 
+        shared. Does nothing if a component is a ``numpy.memmap``, so memory mapped components
+        are not loaded into memory and detached from their files.
+        """
+        if self._componentsAreRowsOf(self._vectorBuffer) or self._hasMemmapComponents():
+            return
+        self._setVectorBuffer(np.stack((self.data[0],self.data[1],self.data[2])))
+
+    def _vectorArray(self) -> np.array:
+        """Returns the components ``0``, ``1`` and ``2`` as the rows of a ``np.float64`` array of
+        shape ``(3, n)``: the buffer of :meth:`stackVectors` if the components are its rows and 
+        it is ``np.float64``, otherwise a new array. The components are not modified."""
+        if self._componentsAreRowsOf(self._vectorBuffer):
+            return self._vectorBuffer.astype(np.float64,copy=False)
+        return np.stack((self.data[0],self.data[1],self.data[2])).astype(np.float64,copy=False)
+
+    def _hasMemmapComponents(self) -> bool:
+        return any(isinstance(self.data[i],np.memmap) for i in (0,1,2))
+
+    _vectorBuffer = None
+
+    def _setVectorBuffer(self,buffer: np.array) -> None:
+        """Sets the components ``0``, ``1`` and ``2`` to be the rows of ``buffer``"""
+        self._vectorBuffer = buffer
+        for i in (0,1,2):
+            self.data[i] = buffer[i]
+
+    def _componentsAreRowsOf(self,buffer: np.array) -> bool:
+        if buffer is None:
+            return False
+        for i in (0,1,2):
+            component = self.data[i]
+            row = buffer[i]
+            if (
+                not isinstance(component,np.ndarray) 
+                or component.ctypes.data != row.ctypes.data
+                or component.shape != row.shape
+                or component.strides != row.strides
+            ):
+                return False
+        return True
+
+    def _newWithVectors(self,vectors: np.array) -> DataSet_3D:
+        """Returns a new 3D data set sampled at the same times as this one, with the components 
+        ``0``, ``1`` and ``2`` being the rows of ``vectors``, an array of shape ``(3, n)``."""
+        dataSet = self._newWithData({},DataSet_3D)
+        dataSet._setVectorBuffer(vectors)
+        return dataSet
+
     def cross(self,other) -> DataSet_3D:
         """Computes the cross product of 3D datasets"""
         self._raiseIfTimeSeriesNotEqual(other)
-        res = {}
-        sd = self.data
-        od = other.data
-        res[0] = sd[1] * od[2] - sd[2] * od[1]
-        res[1] = sd[2] * od[0] - sd[0] * od[2]
-        res[2] = sd[0] * od[1] - od[1] * sd[0]
-        return DataSet_3D(self.timeSeries,res)
-
-    def dot(self,other) -> DataSet_3D:
+        return self._newWithVectors(
+            _crossVectors(self._vectorArray(),other._vectorArray())
+        )
+
+    def dot(self,other) -> DataSet_1D:
         """Computes the dot product of 3D datasets"""
+        from .DataSet_1D import DataSet_1D
         self._raiseIfTimeSeriesNotEqual(other)
-        res = {}
-        for i in (0,1,2):
-            res[i] = self.data[i] * other.data[i]
-        return DataSet_3D(self.timeSeries,res)
+        return self._newWithData(
+            {0: np.einsum('ij,ij->j',self._vectorArray(),other._vectorArray())},
+            DataSet_1D
+        )
+
+    def norm(self) -> DataSet_1D:
+        """Computes the magnitude of the 3D vector"""
+        from .DataSet_1D import DataSet_1D
+        return self._newWithData({0: _vectorNorms(self._vectorArray())},DataSet_1D)
 
     def makeUnitVector(self) -> None:
-        """Normalises the 3D vector to length 1, giving the unit vector"""
-        sd = self.data
-        vectorMagnitude = sd[0] ** 2 + sd[1] ** 2 + sd[2]**2
-        vectorMagnitude = vectorMagnitude**(1/2)
-        divideByMagnitude = lambda series: series / vectorMagnitude
-        self._iterate(divideByMagnitude,replace=True)
+        """Normalises the 3D vector to length 1, giving the unit vector. The components are 
+        replaced, unless they are the rows of a ``np.float64`` buffer from :meth:`stackVectors`,
+        which is normalised in place. Memory mapped components are normalised in blocks of 
+        :attr:`memmapBlockSize` samples, in their files."""
+        if not self._hasMemmapComponents():
+            vectors = self._vectorArray()
+            _normaliseVectors(vectors)
+            if vectors is not self._vectorBuffer:
+                self._setVectorBuffer(vectors)
+            return
+        for start in range(0,len(self.data[0]),self.memmapBlockSize):
+            block = slice(start,start + self.memmapBlockSize)
+            vectors = _normaliseVectors(
+                np.stack([self.data[i][block] for i in (0,1,2)]).astype(np.float64)
+            )
+            for i in (0,1,2):
+                self.data[i][block] = vectors[i]
 
     def coordinateTransform(self,xBasis,yBasis,zBasis) -> DataSet_3D:
         """Performs a coordinate transform to a system with the specified basis vectors.
@@ -300,10 +807,78 @@ class DataSet_3D(DataSet):
             in the original coordinate system.
         :type '_Basis': :class:`DataSet_3D`
         """
-        bases = [xBasis,yBasis,zBasis]
-        res = {}
-        sd = self.data
-        for i, basis in enumerate(bases):
+        bases = (xBasis,yBasis,zBasis)
+        for basis in bases:
             self._raiseIfTimeSeriesNotEqual(basis)
-            res[i] = sd[0] * basis.data[0] + sd[1] * basis.data[1] + sd[2] * basis.data[2]
-        return DataSet_3D(self.timeSeries,res)
\ No newline at end of file
+        vectors = self._vectorArray()
+        res = np.empty_like(vectors)
+        for i, basis in enumerate(bases):
+            np.einsum('ij,ij->j',vectors,basis._vectorArray(),out=res[i])
+        return self._newWithVectors(res)
+
+    def meanFieldAlignedTransform(
+        self,
+        meanField: DataSet_3D,
+        position: DataSet_3D,
+        out: DataSet_3D = None
+    ) -> DataSet_3D:
+        """Transforms the vector field to mean field aligned coordinates, where the axes are:
+
+        - 0: Compressional, along the mean field.
+        - 1: Poloidal, along the mean field crossed with the direction towards the Earth.
+        - 2: Toroidal, along the mean field crossed with the poloidal direction.
+
+        Equivalent to constructing the unit vectors with :meth:`makeUnitVector` and :meth:`cross`, 
+        then calling :meth:`coordinateTransform`, but computes the basis vectors and 
+        projections on stacked arrays in a single pass, without creating intermediate data sets.
+
+        :param meanField: The mean magnetic field.
+        :param position: The position of the satellite relative to the Earth.
+        :param out: 
+            Data set in which to place the output, eg. ``self`` to transform in place. If 
+            ``None``, a new data set is returned.
+        """
+        self._raiseIfTimeSeriesNotEqual(meanField)
+        self._raiseIfTimeSeriesNotEqual(position)
+
+        field = self._vectorArray()
+        if out is not None and any(np.may_share_memory(field,out.data[i]) for i in (0,1,2)):
+            field = field.copy()
+        fieldUnitVector = meanField._vectorArray()
+        if fieldUnitVector is meanField._vectorBuffer:
+            fieldUnitVector = fieldUnitVector.copy()
+        fieldUnitVector = _normaliseVectors(fieldUnitVector)
+        earthUnitVector = _normaliseVectors(np.negative(position._vectorArray()))
+        polUnitVector = _normaliseVectors(_crossVectors(fieldUnitVector,earthUnitVector))
+        # The earth unit vector is no longer needed, so its array is reused
+        torUnitVector = _normaliseVectors(
+            _crossVectors(fieldUnitVector,polUnitVector,out=earthUnitVector)
+        )
+
+        if out is None:
+            out = self._newWithVectors(np.empty_like(field))
+        for i, basis in enumerate((fieldUnitVector,polUnitVector,torUnitVector)):
+            np.einsum('ij,ij->j',field,basis,out=out.data[i])
+        return out
+
+def _crossVectors(a: np.array, b: np.array, out: np.array = None) -> np.array:
+    """Cross product of arrays of vectors with shape ``(3, n)``. Faster than ``np.cross`` for 
+    this layout, as each row is contiguous. ``out`` must not be ``a`` or ``b``."""
+    if out is None:
+        out = np.empty_like(a)
+    np.multiply(a[1],b[2],out=out[0])
+    out[0] -= a[2] * b[1]
+    np.multiply(a[2],b[0],out=out[1])
+    out[1] -= a[0] * b[2]
+    np.multiply(a[0],b[1],out=out[2])
+    out[2] -= a[1] * b[0]
+    return out
+
+def _vectorNorms(vectors: np.array) -> np.array:
+    """Magnitudes of an array of vectors with shape ``(3, n)``"""
+    return np.sqrt(np.einsum('ij,ij->j',vectors,vectors))
+
+def _normaliseVectors(vectors: np.array) -> np.array:
+    """Normalises an array of vectors with shape ``(3, n)`` to unit length, in place"""
+    vectors /= _vectorNorms(vectors)
+    return vectors
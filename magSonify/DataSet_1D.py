@@ -1,10 +1,7 @@
-from .sonificationMethods.paulstretch_mono import paulstretch
+from .sonificationMethods.paulstretch_mono import paulstretch, paulstretchMaxOutputLength
 from .TimeSeries import TimeSeries
-from .DataSet import DataSet
+from .DataSet import DataSet, _emptyLike
 import numpy as np
-from .sonificationMethods import wavelets
-import audiotsm
-from audiotsm.io.array import ArrayReader, ArrayWriter
 from copy import deepcopy
 
 class DataSet_1D(DataSet):
@@ -53,7 +50,11 @@ class DataSet_1D(DataSet):
         """Normalises the data set to within a maximum amplitude. Should be used before
         attempting to output audio.
         """
-        self.x = self.x / np.max(np.abs(self.x)) * maxAmplitude
+        maxValue = max(
+            np.max(np.abs(self.x[start:start + self.memmapBlockSize]))
+            for start in range(0,len(self.x),self.memmapBlockSize)
+        )
+        self.x = self._applyBlockwise(lambda d: d / maxValue * maxAmplitude,self.x)
 
     def waveletPitchShift(
             self,
@@ -61,7 +62,7 @@ class DataSet_1D(DataSet):
             scaleLogSpacing=0.125,
             interpolateFactor = None,
             maxNumberSamples = 1200,
-            wavelet=wavelets.Morlet(),
+            wavelet=None,
             preserveScaling=False
         ) -> None:
         """Pitch shifts the data on specified axes by ``shift`` times using 
@@ -87,6 +88,10 @@ class DataSet_1D(DataSet):
         :param preserveScaling:
             Whether to preserve the scaling of the data when outputing.
         """
+        # Imported when used, as scipy.signal is slow to import
+        from .sonificationMethods import wavelets
+        if wavelet is None:
+            wavelet = wavelets.Morlet()
 
         sampleSeperation = self.timeSeries.getMeanIntervalFloat()
         self.fillNaN()
@@ -134,7 +139,12 @@ class DataSet_1D(DataSet):
         self.x = np.real(rx)
     
     def _stretchTimeseries(self, stretch):
-        self.timeSeries.interpolate(stretch)
+        """Interpolates the time series by ``stretch``. If :attr:`x` is a ``numpy.memmap`` the 
+        stretched times are written to a memory mapped array, as the audio is."""
+        out = None
+        if isinstance(self.x,np.memmap):
+            out = _emptyLike(self.x,int(len(self.timeSeries) * stretch),np.float64)
+        self.timeSeries.interpolate(stretch,out,self.memmapBlockSize)
     
     def _correctTimeseries(self):
         self.timeSeries = self.timeSeries[:len(self.x)]
@@ -173,9 +183,15 @@ class DataSet_1D(DataSet):
         .. note::
 
             Some samples may be clipped at the end of the data set.
+
+        If :attr:`x` is a ``numpy.memmap`` (see :meth:`DataSet.toMemmap`), the output and its 
+        time series are written to memory mapped arrays as they are generated.
         """
+        out = None
+        if isinstance(self.x,np.memmap):
+            out = _emptyLike(self.x,paulstretchMaxOutputLength(len(self.x),stretch,window))
         self._stretchTimeseries(stretch)
-        self.x = paulstretch(self.x,stretch,window)
+        self.x = paulstretch(self.x,stretch,window,out=out)
         self._correctTimeseries()
 
     def phaseVocoderStretch(self,stretch,frameLength=512,synthesisHop=None) -> None:
@@ -193,6 +209,8 @@ class DataSet_1D(DataSet):
 
             Some samples may be clipped at the end of the data set.
         """
+        import audiotsm
+        from audiotsm.io.array import ArrayReader, ArrayWriter
         if synthesisHop is None:
             synthesisHop = frameLength//16
         reader = ArrayReader(np.array((self.x,)))
@@ -223,6 +241,8 @@ class DataSet_1D(DataSet):
 
             Some samples may be clipped at the end of the data set.
         """
+        import audiotsm
+        from audiotsm.io.array import ArrayReader, ArrayWriter
         if synthesisHop is None:
             synthesisHop = frameLength//8
         reader = ArrayReader(np.array((self.x,)))
@@ -0,0 +1,317 @@
+"""Sources of the data imported by :meth:`MagnetometerData.importCDAS`. The requests made by
+each satellite class name the CDAS dataset and variables, eg. ``'THD_L2_FGM'`` and
+``'BX_FGS-D'``, and are served by any data source::
+
+    mag = THEMISdata()
+    mag.dataSource = LocalDataSource("/data/themisMirror")
+    mag.importCDAS(datetime(2007,9,4),datetime(2007,9,5),"D")
+
+Each data source implements ``get_data`` with the signature of ``ai.cdas.get_data``, returning a
+dictionary of arrays keyed by the variable names used by CDAS. Imports which do not specify a 
+data source use :func:`defaultDataSource`.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from threading import Lock
+from time import sleep
+from typing import List
+import glob
+import os
+import numpy as np
+
+_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+def _timesOf(data: dict) -> np.array:
+    """Returns the first array of ``datetime64`` in ``data``, the sampling times"""
+    for d in data.values():
+        d = np.asarray(d)
+        if np.issubdtype(d.dtype,np.datetime64):
+            return d
+    raise ValueError("No array of datetime64 in data")
+
+def _selectTimes(data: dict, startTime, stopTime) -> dict:
+    """Returns the samples of ``data`` with ``startTime <= time <= stopTime``. Raises
+    ``ValueError`` if there are none, as ``ai.cdas.get_data`` does."""
+    times = _timesOf(data)
+    select = (times >= np.datetime64(startTime)) & (times <= np.datetime64(stopTime))
+    if not select.any():
+        raise ValueError("No data in the requested range")
+    return {key: np.asarray(d)[select] for key, d in data.items()}
+
+def _mergeResponses(parts: list) -> dict:
+    """Concatenates responses, sorting by time. Samples at the same time in more than one 
+    response are kept once, from the first response, as :meth:`DataSet.removeDuplicateTimes`."""
+    data = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    times, unique = np.unique(_timesOf(data),return_index=True)
+    return {key: d[unique] for key, d in data.items()}
+
+class DataSource():
+    """Base class of data sources. Subclasses implement :meth:`get_data`."""
+    def get_data(
+        self, dataview, dataset, startTime, stopTime, variables, cdf=False, progress=True
+    ) -> dict:
+        """Returns the data for ``dataset`` between ``startTime`` and ``stopTime`` as a
+        dictionary of arrays, or ``None`` if the dataset is not available. Raises ``ValueError``
+        if there is no data in the range. Arguments as for ``ai.cdas.get_data``."""
+        raise NotImplementedError
+
+class CdasDataSource(DataSource):
+    """Downloads data from CDAS using ``ai.cdas``. The default data source."""
+    def get_data(
+        self, dataview, dataset, startTime, stopTime, variables, cdf=False, progress=True
+    ) -> dict:
+        # Imported when used, as ai.cdas is slow to import and not needed for local data
+        from ai import cdas
+        return cdas.get_data(dataview,dataset,startTime,stopTime,variables,cdf,progress)
+
+_defaultDataSource = None
+
+def defaultDataSource() -> DataSource:
+    """Returns the data source used by imports which do not specify one, set by 
+    :func:`setDefaultDataSource`. Initially a :class:`CdasDataSource`."""
+    if _defaultDataSource is None:
+        return CdasDataSource()
+    return _defaultDataSource
+
+def setDefaultDataSource(dataSource: DataSource) -> None:
+    """Sets the data source used by imports which do not specify one, eg. a 
+    :class:`magSonify.Caching.CachedDataSource`. ``None`` restores the default. Applies to this
+    process, and to processes started with ``fork``."""
+    global _defaultDataSource
+    _defaultDataSource = dataSource
+
+class LocalDataSource(DataSource):
+    """Reads data from a local directory, with a subdirectory of files for each CDAS dataset,
+    eg. ``directory/THD_L2_FGM/*.npz``. Files may be:
+
+    NPZ
+        Written by :meth:`write` or :meth:`mirror`, holding an array for each CDAS variable.
+        Named by the time range of the data, so only files overlapping a request are read.
+    CDF
+        Read with ``cdflib``, which must be installed, eg. ``pip install magSonify[cdf]``. Only
+        the requested variables, and those named in ``variableMap``, are read, with the time 
+        variable each depends on (its ``DEPEND_0``). Times are converted to ``datetime64``, from
+        CDF epochs or, eg. for THEMIS ``thd_fgs_time``, from ``CDF_DOUBLE`` unix seconds. 
+        Variables depending on different times, eg. ``thd_fgs_time`` and ``thd_fgl_time``, are 
+        each selected by their own times. Variables are returned under their CDF names, or 
+        renamed with ``variableMap``.
+
+    :param directory: The directory containing a subdirectory for each dataset
+    :param variableMap:
+        Optional dictionary for each dataset of the CDAS variable name for each CDF variable,
+        eg. ``{'THD_L2_FGM': {'thd_fgs_time': 'UT'}}``. A CDF variable with several components
+        maps to a tuple of names, one per component, eg.
+        ``{'thd_fgs_gsm': ('BX_FGS-D', 'BY_FGS-D', 'BZ_FGS-D')}``.
+    """
+    def __init__(self, directory: str, variableMap: dict = None):
+        self.directory = directory
+        self.variableMap = variableMap or {}
+
+    def _files(self, dataset: str, startTime, stopTime) -> List[str]:
+        """Returns the files for ``dataset`` which may contain data in the range"""
+        files = []
+        for fileName in sorted(glob.glob(os.path.join(self.directory,dataset,"*"))):
+            name, extension = os.path.splitext(os.path.basename(fileName))
+            if extension.lower() not in (".npz",".cdf"):
+                continue
+            try:
+                fileStart, fileEnd = (
+                    np.datetime64(datetime.strptime(part,_TIME_FORMAT))
+                    for part in name.split("--")
+                )
+            except ValueError:
+                # Not named by time range, so always read
+                files.append(fileName)
+                continue
+            if fileStart <= np.datetime64(stopTime) and fileEnd >= np.datetime64(startTime):
+                files.append(fileName)
+        return files
+
+    def get_data(
+        self, dataview, dataset, startTime, stopTime, variables, cdf=False, progress=True
+    ) -> dict:
+        if not os.path.isdir(os.path.join(self.directory,dataset)):
+            return None
+        # Parts with the same variables share times, and are merged and selected together
+        groups = {}
+        for fileName in self._files(dataset,startTime,stopTime):
+            if fileName.lower().endswith(".npz"):
+                with np.load(fileName) as file:
+                    parts = [{key: file[key] for key in file.files}]
+            else:
+                parts = self._readCdf(fileName,self.variableMap.get(dataset,{}),variables)
+            for part in parts:
+                groups.setdefault(frozenset(part),[]).append(part)
+        data = {}
+        for parts in groups.values():
+            try:
+                data.update(_selectTimes(_mergeResponses(parts),startTime,stopTime))
+            except ValueError:
+                continue
+        if not data:
+            raise ValueError("No data in the requested range")
+        return data
+
+    @staticmethod
+    def _readCdf(fileName: str, variableMap: dict, variables) -> List[dict]:
+        """Returns the variables of a CDF file named in ``variables`` or ``variableMap``, as a 
+        dictionary for each time variable holding it and the variables which depend on it"""
+        import cdflib
+        file = cdflib.CDF(fileName)
+        names = [
+            name for name in file.cdf_info().zVariables 
+            if name in (variables or ()) or name in variableMap
+        ]
+        groups = {}
+        for name in names:
+            timeName = file.varattsget(name).get('DEPEND_0',name)
+            groups.setdefault(timeName,[])
+            if name != timeName:
+                groups[timeName].append(name)
+
+        parts = []
+        for timeName, dependents in groups.items():
+            times = np.asarray(file.varget(timeName))
+            dataType = file.varinq(timeName).Data_Type_Description
+            if dataType in ("CDF_EPOCH","CDF_EPOCH16","CDF_TIME_TT2000"):
+                times = np.asarray(cdflib.cdfepoch.to_datetime(times),dtype='datetime64[ns]')
+            elif dataType in ("CDF_DOUBLE","CDF_REAL8") and dependents:
+                # Unix seconds, eg. thd_fgs_time
+                times = np.round(times * 1e9).astype(np.int64).astype('datetime64[ns]')
+            else:
+                # Not a time, and no time given by DEPEND_0
+                continue
+            data = {variableMap.get(timeName,timeName): times}
+            for name in dependents:
+                values = np.asarray(file.varget(name))
+                keys = variableMap.get(name,name)
+                if isinstance(keys,tuple):
+                    for i, key in enumerate(keys):
+                        data[key] = values[:,i]
+                else:
+                    data[keys] = values
+            parts.append(data)
+        return parts
+
+    def write(self, dataset: str, data: dict) -> str:
+        """Writes ``data``, as returned by ``get_data`` of any data source, to a new NPZ file for
+        ``dataset``. Returns the file name."""
+        data = {key: _asStoredArray(d) for key, d in data.items()}
+        times = _timesOf(data)
+        directory = os.path.join(self.directory,dataset)
+        os.makedirs(directory,exist_ok=True)
+        fileName = os.path.join(
+            directory,
+            f"{_nameFromDatetime(times.min())}--{_nameFromDatetime(times.max(),roundUp=True)}.npz"
+        )
+        np.savez(fileName,**data)
+        return fileName
+
+    def mirror(self, source: DataSource, dataClass: type, events) -> None:
+        """Copies the data required to import each of ``events`` with ``dataClass`` from
+        ``source``, eg. a :class:`CdasDataSource`, to this directory. Datasets which are not
+        available for an event are skipped.
+
+        :param events: Iterable of tuples of the arguments of ``dataClass.importCDAS``
+        """
+        for event in events:
+            for cdasArgs, *conversion in dataClass()._cdasRequests(*event).values():
+                try:
+                    data = source.get_data(*cdasArgs,progress=False)
+                except ValueError:
+                    continue
+                if data is not None:
+                    self.write(cdasArgs[1],data)
+
+def _asStoredArray(d) -> np.array:
+    """Returns ``d`` as an array which can be saved without pickling, converting an array of
+    ``datetime`` objects to ``datetime64``"""
+    d = np.asarray(d)
+    if d.dtype == object:
+        d = d.astype('datetime64[ns]')
+    return d
+
+def _nameFromDatetime(time, roundUp=False) -> str:
+    seconds = np.datetime64(time,'s')
+    if roundUp and seconds < time:
+        seconds += np.timedelta64(1,'s')
+    return seconds.astype(object).strftime(_TIME_FORMAT)
+
+class MemoryDataSource(DataSource):
+    """Serves data held in memory, to import without a connection, eg. in tests.
+
+    :param dataSets:
+        Dictionary of the data for each CDAS dataset name, eg. ``'THD_L2_FGM'``, as returned by
+        ``ai.cdas.get_data``, see :func:`simulateTHEMISdataSets`. Arrays of ``datetime64`` are
+        used to select the samples in the requested range. Requests for other datasets return
+        ``None``.
+    :param failures:
+        Number of requests which raise ``ConnectionError`` before requests succeed
+    :param delay:
+        Seconds each request takes
+    """
+    def __init__(self, dataSets: dict, failures: int = 0, delay: float = 0):
+        self.dataSets = dataSets
+        self.failures = failures
+        self.delay = delay
+        self.requests = []
+        """The arguments of each request made"""
+        self._lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def get_data(
+        self, dataview, dataset, startTime, stopTime, variables, cdf=False, progress=True
+    ) -> dict:
+        with self._lock:
+            self.requests.append((dataview,dataset,startTime,stopTime,variables))
+            fail = self.failures > 0
+            self.failures -= fail
+        sleep(self.delay)
+        if fail:
+            raise ConnectionError(f"Simulated failure requesting {dataset}")
+        if dataset not in self.dataSets:
+            return None
+        return _selectTimes(self.dataSets[dataset],startTime,stopTime)
+
+def simulateTHEMISdataSets(startDatetime, endDatetime, satellite="D", spacingSeconds=3) -> dict:
+    """Returns simulated data for the CDAS datasets imported by :meth:`THEMISdata.importCDAS`,
+    for use with :class:`MemoryDataSource` or :meth:`LocalDataSource.write`. The data is noise
+    around a constant field, with the satellite at a constant position."""
+    rng = np.random.default_rng(0)
+    sat = satellite.upper()
+    times = np.arange(
+        np.datetime64(startDatetime,'ms'),
+        np.datetime64(endDatetime,'ms') + np.timedelta64(1,'ms'),
+        np.timedelta64(int(spacingSeconds*1e3),'ms'),
+    )
+    n = len(times)
+    return {
+        f"TH{sat}_L2_FGM": {
+            "UT": times,
+            **{f"B{axis}_FGS-{sat}": rng.normal(0,5,n) + 20 for axis in "XYZ"},
+        },
+        f"TH{sat}_OR_SSC": {
+            "EPOCH": times,
+            "X": np.full(n,6*6371.),
+            "Y": np.full(n,6371.),
+            "Z": np.zeros(n),
+            "RADIUS": np.full(n,6.),
+        },
+        f"TH{sat}_L2_MOM": {
+            "UT": times,
+            f"N_ELEC_MOM_ESA-{sat}": np.full(n,1.),
+            f"VX_ELEC_GSM_MOM_ESA-{sat}": np.full(n,-50.),
+            f"FX_ELEC_MOM_ESA-{sat}": np.full(n,1e6),
+            f"FY_ELEC_MOM_ESA-{sat}": np.full(n,1e6),
+        },
+    }
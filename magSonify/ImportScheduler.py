@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+from time import sleep
+
+from .DataSource import DataSource, defaultDataSource
+
+def _requestKey(cdasArgs: tuple) -> tuple:
+    """Returns a hashable key identifying the request ``cdasArgs``"""
+    return tuple(tuple(arg) if isinstance(arg,list) else arg for arg in cdasArgs)
+
+class ImportScheduler():
+    """Runs CDAS requests on a bounded pool of threads, so that the data for several events can
+    be downloaded concurrently and ahead of when it is needed::
+
+        scheduler = ImportScheduler(maxConcurrent=6)
+        scheduler.prefetch(THEMISdata, events[1:3])
+        mag = THEMISdata()
+        mag.importScheduler = scheduler
+        mag.importCDAS(*events[0])
+
+    Identical requests made while one is in progress, or completed but not yet collected with
+    :meth:`get`, share a single download. Requests failing with one of ``retryExceptions``, eg.
+    a dropped connection, are retried after waiting ``backoff``, doubling for each attempt.
+    Other exceptions, and ``ValueError`` raised by CDAS when there is no data, are not retried.
+
+    :param maxConcurrent:
+        Maximum number of requests downloading at once
+    :param retries:
+        Number of times a failed request is retried
+    :param backoff:
+        Seconds to wait before the first retry
+    :param retryExceptions:
+        Tuple of the exception types which are retried. The ``requests`` exceptions raised by
+        ``ai.cdas`` for network errors are subclasses of ``OSError``.
+    :param dataSource:
+        :class:`DataSource` to make the requests to, default is :func:`defaultDataSource`. eg. a
+        :class:`LocalDataSource` to read from a local mirror, or a :class:`MemoryDataSource` to 
+        run without a connection.
+    """
+    def __init__(
+        self,
+        maxConcurrent: int = 6,
+        retries: int = 3,
+        backoff: float = 1.,
+        retryExceptions: tuple = (OSError,),
+        dataSource: DataSource = None,
+    ):
+        self.maxConcurrent = maxConcurrent
+        self.retries = retries
+        self.backoff = backoff
+        self.retryExceptions = retryExceptions
+        if dataSource is None:
+            dataSource = defaultDataSource()
+        self.dataSource = dataSource
+        self._executor = ThreadPoolExecutor(maxConcurrent,thread_name_prefix="ImportScheduler")
+        self._futures = {}
+        self._lock = Lock()
+
+    def _getWithRetry(self,cdasArgs: tuple):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.dataSource.get_data(*cdasArgs,progress=False)
+            except self.retryExceptions:
+                if attempt == self.retries:
+                    raise
+                sleep(self.backoff * 2**attempt)
+
+    def request(self,cdasArgs: tuple) -> Future:
+        """Starts the request ``cdasArgs``, the arguments of ``ai.cdas.get_data``, unless an
+        identical request is already pending. Returns the ``Future`` of the data."""
+        key = _requestKey(cdasArgs)
+        with self._lock:
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(self._getWithRetry,cdasArgs)
+            return self._futures[key]
+
+    def get(self,cdasArgs: tuple):
+        """Returns the data for the request ``cdasArgs``, waiting for a pending request or
+        starting a new one. The completed request is then removed from the scheduler, so a
+        later identical request downloads the data again."""
+        key = _requestKey(cdasArgs)
+        future = self.request(cdasArgs)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+
+    def prefetch(self,dataClass: type,events) -> None:
+        """Starts the requests required to import each of ``events`` with ``dataClass``, eg.
+        :class:`THEMISdata`. Each event is a tuple of the arguments of ``dataClass.importCDAS``.
+        The data is collected when the events are imported using this scheduler."""
+        for event in events:
+            for cdasArgs, *conversion in dataClass()._cdasRequests(*event).values():
+                self.request(cdasArgs)
+
+    def pending(self) -> int:
+        """Returns the number of requests which have not been collected"""
+        with self._lock:
+            return len(self._futures)
+
+    def shutdown(self) -> None:
+        """Stops the threads, once the running requests are complete. Requests not yet started
+        are cancelled."""
+        self._executor.shutdown(wait=True,cancel_futures=True)
+        with self._lock:
+            self._futures = {}
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+from typing import List
+import numpy as np
+from .TimeSeries import TimeSeries
+from .DataSet import (
+    DataSet, DataSet_3D, _runningAverageHalfWindow, _runningAverageWindows, _windowMeans
+)
+from .DataSet_1D import DataSet_1D
+
+class LazyDataSet():
+    """Represents a data set which is computed on demand from a graph of operations on other data
+    sets. Created using :meth:`DataSet.lazy`::
+
+        field = mag.magneticField.lazy().constrainAbsoluteValue(400)
+        meanField = field.runningAverage(timeWindow=np.timedelta64(35,"m"))
+        fieldMinusMean = (field - meanField).evaluate()
+
+    Operations return a new :class:`LazyDataSet` rather than modifying the data set. Nothing is
+    computed until :meth:`evaluate` is called, which evaluates the graph in chunks along the time
+    axis. Only the output is allocated at full length, intermediate results are at most
+    ``chunkSize`` samples long.
+
+    :param timeSeries:
+        Time series representing the sampling times.
+    :param keys:
+        Keys of the components in the evaluated data set.
+    :param compute:
+        Function ``compute(start, stop, cache) -> dict`` returning the components for the
+        samples ``start`` to ``stop``. Should use :meth:`_evaluateRange` to evaluate inputs.
+    :param returnClassType:
+        Class used to construct the evaluated data set, eg. :class:`DataSet`, :class:`DataSet_3D`
+    """
+    def __init__(self,timeSeries: TimeSeries,keys,compute,returnClassType: type = DataSet):
+        self.timeSeries: TimeSeries = timeSeries
+        """:class:`TimeSeries` represeting the sampling times for the dataset"""
+        self._keys = tuple(keys)
+        self._compute = compute
+        self._returnClassType = returnClassType
+
+    @classmethod
+    def _fromDataSet(cls,dataSet: DataSet) -> LazyDataSet:
+        """Wraps an evaluated data set. Its components are referenced, not copied."""
+        def compute(start,stop,cache):
+            return {i: d[start:stop] for i, d in dataSet.items()}
+        return cls(dataSet.timeSeries,dataSet.keys(),compute,type(dataSet))
+
+    def keys(self) -> tuple:
+        """Returns the keys of the components"""
+        return self._keys
+
+    def __len__(self) -> int:
+        return len(self.timeSeries)
+
+    def _evaluateRange(self,start: int,stop: int,cache: dict) -> dict:
+        """Returns the components for the samples ``start`` to ``stop``, using the result in
+        ``cache`` if this range has already been computed. The returned arrays must not be
+        modified."""
+        cacheKey = (id(self),start,stop)
+        if cacheKey not in cache:
+            cache[cacheKey] = self._compute(start,stop,cache)
+        return cache[cacheKey]
+
+    def _new(self,compute,keys=None,returnClassType: type = None) -> LazyDataSet:
+        if keys is None:
+            keys = self._keys
+        if returnClassType is None:
+            returnClassType = self._returnClassType
+        return LazyDataSet(self.timeSeries,keys,compute,returnClassType)
+
+    def _map(self,func) -> LazyDataSet:
+        """Returns a lazy data set applying ``func`` to each component. ``func`` should accept
+        a 1D numpy array and return a new array of the same shape, without modifying the input."""
+        def compute(start,stop,cache):
+            chunk = self._evaluateRange(start,stop,cache)
+            return {i: func(d) for i, d in chunk.items()}
+        return self._new(compute)
+
+    def _asLazyInput(self,other):
+        """Returns ``other`` as a lazy data set if it is a data set, checking the time series"""
+        if isinstance(other,DataSet):
+            other = other.lazy()
+        if isinstance(other,LazyDataSet):
+            if other.timeSeries != self.timeSeries:
+                raise ValueError("Datasets do not have the same time series")
+        return other
+
+    def _mapPair(self,other,ufunc) -> LazyDataSet:
+        """Returns a lazy data set applying ``ufunc`` to each component pair. ``other`` may be a
+        data set, a scalar or an array of the same length as the data set."""
+        other = self._asLazyInput(other)
+        def compute(start,stop,cache):
+            chunk = self._evaluateRange(start,stop,cache)
+            if isinstance(other,LazyDataSet):
+                otherChunk = other._evaluateRange(start,stop,cache)
+                return {i: ufunc(d,otherChunk[i]) for i, d in chunk.items()}
+            if np.ndim(other) > 0:
+                otherChunk = other[start:stop]
+                return {i: ufunc(d,otherChunk) for i, d in chunk.items()}
+            return {i: ufunc(d,other) for i, d in chunk.items()}
+        return self._new(compute)
+
+    def __add__(self,other) -> LazyDataSet:
+        return self._mapPair(other,np.add)
+
+    def __radd__(self,other) -> LazyDataSet:
+        return self._mapPair(other,np.add)
+
+    def __sub__(self,other) -> LazyDataSet:
+        return self._mapPair(other,np.subtract)
+
+    def __rsub__(self,other) -> LazyDataSet:
+        return self._mapPair(other,lambda d, o: np.subtract(o,d))
+
+    def __mul__(self,other) -> LazyDataSet:
+        return self._mapPair(other,np.multiply)
+
+    def __rmul__(self,other) -> LazyDataSet:
+        return self._mapPair(other,np.multiply)
+
+    def __truediv__(self,other) -> LazyDataSet:
+        return self._mapPair(other,np.true_divide)
+
+    def __neg__(self) -> LazyDataSet:
+        return self._map(np.negative)
+
+    def constrainAbsoluteValue(self,max) -> LazyDataSet:
+        """Lazy equivalent of :meth:`DataSet.constrainAbsoluteValue`"""
+        return self._map(lambda d: np.clip(d,-max,max))
+
+    def fillNaN(self,const=0) -> LazyDataSet:
+        """Lazy equivalent of :meth:`DataSet.fillNaN`"""
+        return self._map(lambda d: np.nan_to_num(d,nan=const))
+
+    def fillFlagged(self,flags: np.array,const=0) -> LazyDataSet:
+        """Lazy equivalent of :meth:`DataSet.fillFlagged`"""
+        flags = np.asarray(flags,dtype=bool)
+        def compute(start,stop,cache):
+            chunk = self._evaluateRange(start,stop,cache)
+            chunkFlags = flags[start:stop]
+            return {i: np.where(chunkFlags,const,d) for i, d in chunk.items()}
+        return self._new(compute)
+
+    def extractKey(self,key) -> LazyDataSet:
+        """Lazy equivalent of :meth:`DataSet.extractKey`"""
+        def compute(start,stop,cache):
+            return {0: self._evaluateRange(start,stop,cache)[key]}
+        return self._new(compute,(0,),DataSet_1D)
+
+    def runningAverage(self,samples=None,timeWindow=None,shrinkEdges=False) -> LazyDataSet:
+        """Lazy equivalent of :meth:`DataSet.runningAverage`. Each chunk evaluates its input over
+        the chunk extended by half a window on either side."""
+        halfWindow = _runningAverageHalfWindow(self.timeSeries,samples,timeWindow)
+        times = self.timeSeries.asFloat()
+        def compute(start,stop,cache):
+            lower, upper, complete = _runningAverageWindows(times,start,stop,samples,halfWindow)
+            if stop <= start:
+                return {i: np.empty(0) for i in self._keys}
+            inputStart = int(lower.min())
+            inputStop = int(upper.max())
+            chunk = self._evaluateRange(inputStart,inputStop,cache)
+            means, counts = _windowMeans(
+                np.stack([chunk[i] for i in self._keys]),
+                lower - inputStart,
+                upper - inputStart
+            )
+            if not shrinkEdges:
+                means[:,~complete] = np.nan
+            return dict(zip(self._keys,means))
+        return self._new(compute)
+
+    def _chunkDataSet(self,chunk: dict,timeSeries: TimeSeries,returnClassType: type = None):
+        if returnClassType is None:
+            returnClassType = self._returnClassType
+        return returnClassType._fromParts(timeSeries._shallowCopy(),dict(chunk))
+
+    def meanFieldAlignedTransform(self,meanField,position) -> LazyDataSet:
+        """Lazy equivalent of :meth:`DataSet_3D.meanFieldAlignedTransform`"""
+        meanField = self._asLazyInput(meanField)
+        position = self._asLazyInput(position)
+        def compute(start,stop,cache):
+            timeSeries = self.timeSeries[start:stop]
+            field, meanFieldChunk, positionChunk = (
+                self._chunkDataSet(x._evaluateRange(start,stop,cache),timeSeries,DataSet_3D)
+                for x in (self,meanField,position)
+            )
+            return field.meanFieldAlignedTransform(meanFieldChunk,positionChunk).data
+        return self._new(compute,(0,1,2),DataSet_3D)
+
+    def evaluate(self,chunkSize=2**16) -> DataSet:
+        """Computes the data set, in chunks of ``chunkSize`` samples"""
+        return LazyDataSet.evaluateMany((self,),chunkSize)[0]
+
+    @staticmethod
+    def evaluateMany(lazyDataSets,chunkSize=2**16) -> List[DataSet]:
+        """Computes several lazy data sets with the same time series together, so that any
+        operations they have in common are computed once per chunk.
+
+        :return: List of the evaluated data sets, in the same order as ``lazyDataSets``
+        """
+        timeSeries = lazyDataSets[0].timeSeries
+        for lazyDataSet in lazyDataSets:
+            if lazyDataSet.timeSeries != timeSeries:
+                raise ValueError("Datasets do not have the same time series")
+        numberSamples = len(timeSeries)
+
+        outputs = [{} for lazyDataSet in lazyDataSets]
+        for start in range(0,max(numberSamples,1),chunkSize):
+            stop = min(start + chunkSize,numberSamples)
+            cache = {}
+            for lazyDataSet, output in zip(lazyDataSets,outputs):
+                chunk = lazyDataSet._evaluateRange(start,stop,cache)
+                for i, d in chunk.items():
+                    if i not in output:
+                        output[i] = np.empty(numberSamples,dtype=d.dtype)
+                    output[i][start:stop] = d
+
+        return [
+            lazyDataSet._returnClassType._fromParts(lazyDataSet.timeSeries.copy(),output)
+            for lazyDataSet, output in zip(lazyDataSets,outputs)
+        ]
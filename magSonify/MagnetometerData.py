@@ -1,12 +1,34 @@
 
+from __future__ import annotations
+import os
+from datetime import timedelta
 from .TimeSeries import TimeSeries, generateTimeSeries
-from .DataSet import DataSet, DataSet_3D
+from .DataSet import DataSet, DataSet_3D, _writeMetadata, _readMetadata
 from .DataSet_1D import DataSet_1D
-from threading import Thread
+from .LazyDataSet import LazyDataSet
+from .ImportScheduler import ImportScheduler
+from .DataSource import DataSource, defaultDataSource, _asStoredArray, _mergeResponses
 import numpy as np
 from numpy import logical_or, logical_and
 
-from ai import cdas 
+def _chunkRequest(cdasArgs: tuple, chunkDuration) -> list:
+    """Returns the requests for consecutive chunks of at most ``chunkDuration`` covering the 
+    range of ``cdasArgs``, or ``[cdasArgs]`` if ``chunkDuration`` is ``None``. Adjacent chunks 
+    share their boundary time."""
+    if chunkDuration is None:
+        return [cdasArgs]
+    if isinstance(chunkDuration,np.timedelta64):
+        chunkDuration = chunkDuration.astype('timedelta64[us]').astype(object)
+    dataview, dataset, startTime, stopTime, *rest = cdasArgs
+    chunks = []
+    chunkStart = startTime
+    while True:
+        chunkStop = min(chunkStart + chunkDuration, stopTime)
+        chunks.append((dataview, dataset, chunkStart, chunkStop, *rest))
+        if chunkStop >= stopTime:
+            return chunks
+        chunkStart = chunkStop
+
 
 class MagnetometerData():
     """Class providing a high level api for data import and processing"""
@@ -25,42 +47,146 @@ class MagnetometerData():
 
         ``keys: 'density','velocity_x','flux_x',flux_y'`` """
 
-    def _importAsync(self,funcs,startDatetime,endDatetime,*args) -> None:
-        """ Runs the CDAS imports defined in ``funcs`` asyncronously.
-
-        eg.
-        ::
-            
-            # User defines each of these methods for data from a particular satellite
-            funcs = (self._importCdasMagneticField,self._importCdasPosition,self._importCdasPeem)
-            self._importAsync(funcs,startDatetime,endDatetime,*args)
-
-        :param funcs:
-            Tuple of functions to execute. Each function should be of the form
-            ``func(startDatetime,endDatetime,*args) -> None``. Any imported data
-            should be written to a class attribute.
-
-            .. Warning::
-
-                These functions should not read data from the class or modify the same attributes
-                as there is no prevention of a race condition. The functions are run simulataneously
-                using ``threading`` library.
-
-        :param startDatetime:
-            Start of data range as ``datetime.datetime`` or ``numpy.datetime64``
-        :param endDatetime:
-            End of data range as ``datetime.datetime`` or ``numpy.datetime64``
-        :param \*args:
-            Arbitrary arguments to be passed to the functions.
+        self.dataSource: DataSource = None
+        """The :class:`DataSource` imported from, eg. a :class:`LocalDataSource`. If ``None``, 
+        the :func:`defaultDataSource` is used, which downloads from CDAS unless changed."""
+        self.importScheduler: ImportScheduler = None
+        """The :class:`ImportScheduler` used to make the import requests. If ``None``, a new 
+        scheduler for :attr:`dataSource` is created for each import. A scheduler which is set 
+        makes requests to its own data source."""
+        self.importErrors: dict = {}
+        """The exception raised importing each attribute left as ``None`` by the last import"""
+
+    _savedAttributes = (
+        'magneticField',
+        'position',
+        'meanField',
+        'magneticFieldMeanFieldCoordinates',
+        'peemIdentifyMagnetosheath',
+    )
+
+    def save(self,directory: str) -> None:
+        """Saves the data sets to ``directory``, each in a subdirectory named after its attribute 
+        as described in :meth:`DataSet.save`. Data sets which are ``None`` are not saved.
+        Load with :meth:`load`::
+
+            mag.save("processed")
+            mag = THEMISdata.load("processed")
+        """
+        os.makedirs(directory,exist_ok=True)
+        saved = []
+        for name in self._savedAttributes:
+            dataSet = getattr(self,name)
+            if dataSet is not None:
+                dataSet.save(os.path.join(directory,name))
+                saved.append(name)
+        _writeMetadata(directory,{'class': type(self).__name__, 'dataSets': saved})
+
+    @classmethod
+    def load(cls,directory: str,mmapMode: str = 'c') -> MagnetometerData:
+        """Loads data sets saved with :meth:`save` into a new instance. The arrays are memory 
+        mapped, so are only read from disk when accessed, see :meth:`DataSet.load`.
         """
-        arguments = (startDatetime,endDatetime,*args)
-        fetchers = []
-        for func in funcs:
-            fetch = Thread(target=func,args=arguments)
-            fetch.start()
-            fetchers.append(fetch)
-        for fetch in fetchers:
-            fetch.join()
+        metadata = _readMetadata(directory)
+        magnetometerData = cls()
+        for name in metadata['dataSets']:
+            if name not in cls._savedAttributes:
+                raise ValueError(f"Unknown data set {name!r} in {directory}")
+            setattr(magnetometerData,name,DataSet.load(os.path.join(directory,name),mmapMode))
+        return magnetometerData
+
+    def _cdasRequests(self,startDatetime,endDatetime,*args) -> dict:
+        """Returns the CDAS requests made by ``importCDAS``, as a dictionary of the attribute to
+        import to and a tuple of the arguments of :meth:`_importCdasItemWithExceptions`, 
+        ``(cdasArgs, timeSeriesKey, targetKeys, returnClassType)``. Implemented by subclasses 
+        for each satellite. Used by :meth:`ImportScheduler.prefetch` to start the requests 
+        before the import."""
+        return {}
+
+    def _importRequests(self,requests: dict,chunkDuration=None) -> None:
+        """Imports the data sets for ``requests``, from :meth:`_cdasRequests`. All requests are
+        started together on the :attr:`importScheduler`. If a request fails, the exception is 
+        printed and the attribute is left as ``None``.
+
+        :param chunkDuration:
+            If not ``None``, each request is split into chunks of this duration, see 
+            :meth:`importBulk`.
+        """
+        scheduler = self.importScheduler
+        if scheduler is None:
+            scheduler = ImportScheduler(
+                maxConcurrent=max(len(requests),1),dataSource=self.dataSource
+            )
+        for cdasArgs, *conversion in requests.values():
+            for chunkArgs in _chunkRequest(cdasArgs,chunkDuration):
+                scheduler.request(chunkArgs)
+        self.importErrors = {}
+        try:
+            for attribute, request in requests.items():
+                try:
+                    dataSet = self._importCdasItemWithExceptions(
+                        *request,scheduler=scheduler,chunkDuration=chunkDuration
+                    )
+                except Exception as e:
+                    print(f"Exception importing {attribute} from {request[0][1]}")
+                    print(repr(e))
+                    self.importErrors[attribute] = e
+                    dataSet = None
+                setattr(self,attribute,dataSet)
+        finally:
+            if self.importScheduler is None:
+                scheduler.shutdown()
+
+    def _raiseIfNotImported(self,attributes=('magneticField','position')) -> None:
+        """Raises the exception which prevented each of ``attributes`` being imported, if it is
+        ``None``. Used where the data is required, as ``importCDAS`` only prints the exception."""
+        for attribute in attributes:
+            if getattr(self,attribute) is None:
+                error = self.importErrors.get(attribute)
+                if error is not None:
+                    raise error
+                raise CdasImportError.CdasNoDataReturnedError(f"{attribute} was not imported")
+
+    def importBulk(self,startDatetime,endDatetime,*args,chunkDuration=timedelta(days=7)) -> None:
+        """Imports a long range, eg. a year, to be divided into events with :meth:`window`. 
+        Importing many events this way makes a few large requests rather than several for each 
+        event::
+
+            bulk = THEMISdata()
+            bulk.importBulk(datetime(2008,1,1),datetime(2009,1,1),"D")
+            for event in generateEvents(datetime(2008,1,1),datetime(2009,1,1)):
+                mag = bulk.window(*event[:2])
+                mag.defaultProcessing()
+
+        Each dataset is requested in chunks of ``chunkDuration``, which are downloaded 
+        concurrently by the :attr:`importScheduler` and joined into a single data set. Samples 
+        at the boundary of two chunks are kept once. Chunks with no data, eg. a gap in the
+        mission, are skipped.
+
+        :param args: Further arguments as for ``importCDAS``, eg. the satellite
+        :param chunkDuration: 
+            Maximum duration of each request, as ``datetime.timedelta`` or ``np.timedelta64``
+        """
+        self._importRequests(self._cdasRequests(startDatetime,endDatetime,*args),chunkDuration)
+
+    def window(self,startDatetime,endDatetime) -> MagnetometerData:
+        """Returns a new instance holding the samples of each data set between ``startDatetime``
+        and ``endDatetime`` inclusive, eg. an event within data imported with :meth:`importBulk`.
+
+        The data sets of the window are views of those in this instance, see 
+        :meth:`DataSet.sliceTime`, so no data is copied. Processing which replaces the data, 
+        such as the interpolation at the start of :meth:`THEMISdata.defaultProcessing`, does not
+        affect this instance, but changes made in place to the window, eg. 
+        :meth:`DataSet.fillFlagged`, are also made to this instance. Use :meth:`DataSet.copy` 
+        on the data sets of the window if required.
+        """
+        window = type(self)()
+        window.dataSource = self.dataSource
+        for name in self._savedAttributes:
+            dataSet = getattr(self,name)
+            if dataSet is not None:
+                setattr(window,name,dataSet.sliceTime(startDatetime,endDatetime))
+        return window
 
     def fillLessThanRadius(self,radiusInEarthRadii,const=0) -> None:
         """Fills all values in the magnetic field with ``const`` when the radius is below the 
@@ -84,20 +210,9 @@ class MagnetometerData():
         assert(self.position.timeSeries == self.magneticField.timeSeries)
         assert(self.magneticField.timeSeries == self.meanField.timeSeries)
 
-        fieldUnitVector = self.meanField.copy()
-        fieldUnitVector.makeUnitVector()
-        earthUnitVector = -(self.position.copy())
-        earthUnitVector.makeUnitVector()
-
-        polUnitVector = fieldUnitVector.cross(earthUnitVector)
-        polUnitVector.makeUnitVector()
-        torUnitVector = fieldUnitVector.cross(polUnitVector)
-        torUnitVector.makeUnitVector()
-
-        self.magneticFieldMeanFieldCoordinates = self.magneticField.coordinateTransform(
-            fieldUnitVector,
-            polUnitVector,
-            torUnitVector
+        self.magneticFieldMeanFieldCoordinates = self.magneticField.meanFieldAlignedTransform(
+            self.meanField,
+            self.position
         )
 
     def removeMagnetosheath(self) -> None:
@@ -105,6 +220,14 @@ class MagnetometerData():
 
         :attr:`peemIdentifyMagnetosheath` must be specified, otherwise no action is taken.
         """
+        removeSheathFlags = self._magnetosheathFlags()
+        if removeSheathFlags is None:
+            return None
+        self.magneticField.fillFlagged(removeSheathFlags)
+
+    def _magnetosheathFlags(self) -> np.array:
+        """Returns a boolean array flagging the samples where the satellite is in the 
+        magnetosheath, or ``None`` if :attr:`peemIdentifyMagnetosheath` is not specified."""
         if self.peemIdentifyMagnetosheath is None:
             return None
         
@@ -123,7 +246,7 @@ class MagnetometerData():
                 )
             )
         )
-        self.magneticField.fillFlagged(removeSheathFlags)
+        return removeSheathFlags
 
     def _interpolateReference(self, refTimeSeries: TimeSeries) -> None:
         """Removes duplicate times, then interpolates data sets :attr:`magneticField`, 
@@ -143,6 +266,8 @@ class MagnetometerData():
         timeSeriesKey: str,
         targetKeys: dict,
         returnClassType: type = DataSet,
+        scheduler: ImportScheduler = None,
+        chunkDuration = None,
     ):
         """Imports cdas data for the given ``cdasArgs``, extracting a dataset.
 
@@ -155,13 +280,39 @@ class MagnetometerData():
             its keys are the keys that should be used to reference these within the data set.
         :param type returnClassType: 
             Class used to construct the returned data set, eg. :class:`DataSet`, :class:`DataSet_3D`
+        :param scheduler:
+            :class:`ImportScheduler` to make the request with. Defaults to 
+            :attr:`importScheduler`, or if that is ``None`` the request is made directly to 
+            :attr:`dataSource`.
+        :param chunkDuration:
+            If not ``None``, the data is requested in chunks of this duration, which are joined.
         """
-        try:
-            data = cdas.get_data(*cdasArgs,progress=False)
-        except ValueError:
+        if scheduler is None:
+            scheduler = self.importScheduler
+        parts = []
+        for chunkArgs in _chunkRequest(cdasArgs,chunkDuration):
+            try:
+                if scheduler is not None:
+                    data = scheduler.get(chunkArgs)
+                else:
+                    dataSource = (
+                        self.dataSource if self.dataSource is not None else defaultDataSource()
+                    )
+                    data = dataSource.get_data(*chunkArgs,progress=False)
+            except ValueError:
+                # No data in this chunk
+                continue
+            if data is None:
+                raise CdasImportError.CdasNoDataReturnedError
+            parts.append(data)
+        if not parts:
             raise CdasImportError.CdasUnspecifedMissingDataError
-        if data is None:
-            raise CdasImportError.CdasNoDataReturnedError
+        if len(parts) == 1:
+            data = parts[0]
+        else:
+            data = _mergeResponses(
+                [{key: _asStoredArray(d) for key, d in part.items()} for part in parts]
+            )
         timeSeries = TimeSeries(data[timeSeriesKey])
         selecetedData = {}
 
@@ -194,12 +345,20 @@ class THEMISdata(MagnetometerData):
         """ Imports magnetic field, position, radial distance and peem data for the designated 
             THEMIS satellite and datetime range.
             The possible satellite letters are: "A", "B", "C", "D" or "E".
-            See also: :meth:`MagnetometerData._importAsync`
+            The requests are made concurrently by the :attr:`importScheduler`.
         """
-        funcs = (self._importCdasMagneticField,self._importCdasPosition,self._importCdasPeem)
-        self._importAsync(funcs,startDatetime,endDatetime,satellite)
+        self._importRequests(self._cdasRequests(startDatetime,endDatetime,satellite))
+
+    def _cdasRequests(self,startDatetime,endDatetime,satellite="D") -> dict:
+        return {
+            'magneticField': self._cdasMagneticFieldRequest(startDatetime,endDatetime,satellite),
+            'position': self._cdasPositionRequest(startDatetime,endDatetime,satellite),
+            'peemIdentifyMagnetosheath': self._cdasPeemRequest(
+                startDatetime,endDatetime,satellite
+            ),
+        }
 
-    def _importCdasPosition(self, startDatetime, endDatetime, satellite) -> None:
+    def _cdasPositionRequest(self, startDatetime, endDatetime, satellite) -> tuple:
         cdasArgs = (
             'sp_phys',
             f'TH{satellite.upper()}_OR_SSC',
@@ -211,11 +370,9 @@ class THEMISdata(MagnetometerData):
         targetKeys = {
             0: 'X', 1: 'Y', 2: 'Z', 'radius': "RADIUS"
         }
-        self.position = self._importCdasItemWithExceptions(
-            cdasArgs,timeSeriesKey,targetKeys,DataSet_3D
-        )
+        return cdasArgs, timeSeriesKey, targetKeys, DataSet_3D
 
-    def _importCdasMagneticField(self, startDatetime, endDatetime, satellite) -> None:
+    def _cdasMagneticFieldRequest(self, startDatetime, endDatetime, satellite) -> tuple:
         cdasArgs = (
             'sp_phys',
             f'TH{satellite.upper()}_L2_FGM',
@@ -229,11 +386,9 @@ class THEMISdata(MagnetometerData):
             1: f"BY_FGS-{satellite.upper()}",
             2: f"BZ_FGS-{satellite.upper()}"
         }
-        self.magneticField = self._importCdasItemWithExceptions(
-            cdasArgs,timeSeriesKey,targetKeys,DataSet_3D
-        )
+        return cdasArgs, timeSeriesKey, targetKeys, DataSet_3D
     
-    def _importCdasPeem(self,startDatetime,endDatetime,satellite) -> None:
+    def _cdasPeemRequest(self,startDatetime,endDatetime,satellite) -> tuple:
         cdasArgs = (
             'sp_phys',
             f'TH{satellite.upper()}_L2_MOM',
@@ -252,9 +407,7 @@ class THEMISdata(MagnetometerData):
             'flux_x': f'FX_ELEC_MOM_ESA-{satellite.upper()}',
             'flux_y': f'FY_ELEC_MOM_ESA-{satellite.upper()}',
         }
-        self.peemIdentifyMagnetosheath = self._importCdasItemWithExceptions(
-            cdasArgs,timeSeriesKey,targetKeys,DataSet
-        )
+        return cdasArgs, timeSeriesKey, targetKeys, DataSet
     
     def defaultProcessing(self,
         removeMagnetosheath=False,
@@ -269,12 +422,46 @@ class THEMISdata(MagnetometerData):
         self.interpolate()
         self.magneticField.constrainAbsoluteValue(400)
         self.meanField = self.magneticField.runningAverage(timeWindow=np.timedelta64(35,"m"))
-        self.magneticField = self.magneticField - self.meanField
+        self.magneticField -= self.meanField
         self.fillLessThanRadius(minRadius)
         if removeMagnetosheath:
             self.removeMagnetosheath()
         self.convertToMeanFieldCoordinates()
-        self.magneticFieldMeanFieldCoordinates.fillNaN()
+        # Created by the transform, so no other data set shares its arrays
+        self.magneticFieldMeanFieldCoordinates.fillNaN(inPlace=True)
+
+    def defaultProcessingChunked(self,
+        removeMagnetosheath=False,
+        minRadius=4,
+        chunkSize=2**16,
+    ) -> None:
+        """Performs the same procedure as :meth:`defaultProcessing`, but evaluates the steps 
+        after interpolation together in chunks of ``chunkSize`` samples using 
+        :class:`LazyDataSet`. Intermediate data sets are not created at full length, which reduces 
+        the memory required to process long intervals.
+
+        :param removeMagnetosheath: Whether to remove data while in the magnetosheath
+        :param minRadius: Radius in earth radii below which to remove magnetic field data
+        :param chunkSize: Number of samples to process at a time
+        """
+        self.interpolate()
+        field = self.magneticField.lazy().constrainAbsoluteValue(400)
+        meanField = field.runningAverage(timeWindow=np.timedelta64(35,"m"))
+        field = (field - meanField).fillFlagged(self.position.data["radius"] < minRadius)
+        if removeMagnetosheath:
+            removeSheathFlags = self._magnetosheathFlags()
+            if removeSheathFlags is not None:
+                field = field.fillFlagged(removeSheathFlags)
+        fieldMeanFieldCoordinates = field.meanFieldAlignedTransform(
+            meanField,
+            self.position
+        ).fillNaN()
+
+        (
+            self.meanField, 
+            self.magneticField, 
+            self.magneticFieldMeanFieldCoordinates
+        ) = LazyDataSet.evaluateMany((meanField,field,fieldMeanFieldCoordinates),chunkSize)
 
 class CdasImportError(Exception):
     class CdasNoDataReturnedError(Exception):
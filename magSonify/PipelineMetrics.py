@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+from threading import Thread
+from time import time
+from typing import List
+import numpy as np
+
+class PipelineMetrics():
+    """Collects measurements from the stages of the pipeline in :mod:`magSonify.Buffering`, to
+    find the stage which limits the throughput and to tune the number of workers. Pass to
+    :func:`magSonify.Buffering.startPipeline`, then call :meth:`close` once the processes have
+    been joined::
+
+        metrics = PipelineMetrics()
+        for process in startPipeline(events, workers, metrics=metrics):
+            process.join()
+        metrics.close()
+        print(metrics.summary())
+        metrics.writeJsonLines("metrics.jsonl")
+
+    Each record is a dictionary with the ``'kind'`` of record and the ``'time'`` in seconds since
+    the metrics were created. The kinds of record are:
+
+    ``'item'``
+        An item completed by a worker: the ``'stage'``, ``'worker'``, ``'sequence'``, the
+        ``'wait'`` for the input, the ``'duration'`` of the work, the ``'putWait'`` for space
+        in the next queue, the ``'bytes'`` sent to the next stage and whether it ``'failed'``.
+    ``'queue'``
+        The number of ``'items'`` and ``'bytes'`` in queue ``'queue'`` after an item was put, if
+        the queues have a :class:`magSonify.Buffering.MemoryBudget`.
+    ``'worker'``
+        A worker finished: the ``'stage'``, ``'worker'``, the ``'busy'`` time spent working on
+        items and its ``'total'`` run time.
+    ``'audio'``
+        Playback received an event: the ``'headroom'`` in seconds of audio waiting in the ring
+        buffer, and the ``'underruns'`` and ``'overruns'`` so far.
+
+    Records are sent from the processes through a ``multiprocessing`` queue, which is emptied
+    by a thread in the process which created the metrics.
+    """
+    def __init__(self):
+        self.startTime = time()
+        self.records: List[dict] = []
+        """Records received so far"""
+        self._queue = mp.Queue()
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def record(self, kind: str, **fields) -> None:
+        """Adds a record, from any process"""
+        self._queue.put({'kind': kind, 'time': time() - self.startTime, **fields})
+
+    def _collect(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self.records.append(record)
+
+    def close(self) -> List[dict]:
+        """Waits for all records to be received, returning them. Should be called once the
+        processes sending records have been joined."""
+        if self._collector is not None:
+            self._queue.put(None)
+            self._collector.join()
+            self._collector = None
+        return self.records
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['records'] = []
+        state['_collector'] = None
+        return state
+
+    def ofKind(self, kind: str) -> List[dict]:
+        """Returns the records of ``kind``"""
+        return [record for record in self.records if record['kind'] == kind]
+
+    def writeJsonLines(self, fileName: str) -> None:
+        """Writes the records to ``fileName``, one JSON object per line"""
+        with open(fileName, "w") as file:
+            for record in self.records:
+                file.write(json.dumps(record) + "\n")
+
+    def stageSummary(self) -> dict:
+        """Returns a dictionary of statistics for each stage: the number of ``'items'``, the
+        ``'meanDuration'`` and ``'maxDuration'`` per item, the ``'meanWait'`` for input, the total
+        ``'bytes'`` sent on and the ``'utilisation'``, the fraction of the run time the workers
+        of the stage spent working."""
+        summary = {}
+        items = self.ofKind('item')
+        workers = self.ofKind('worker')
+        for stage in dict.fromkeys(record['stage'] for record in items + workers):
+            durations = np.array([r['duration'] for r in items if r['stage'] == stage])
+            waits = np.array([r['wait'] for r in items if r['stage'] == stage])
+            stageWorkers = [r for r in workers if r['stage'] == stage]
+            totalTime = sum(r['total'] for r in stageWorkers)
+            summary[stage] = {
+                'items': len(durations),
+                'meanDuration': durations.mean() if len(durations) else np.nan,
+                'maxDuration': durations.max() if len(durations) else np.nan,
+                'meanWait': waits.mean() if len(waits) else np.nan,
+                'bytes': sum(r['bytes'] for r in items if r['stage'] == stage),
+                'utilisation': (
+                    sum(r['busy'] for r in stageWorkers) / totalTime if totalTime else np.nan
+                ),
+            }
+        return summary
+
+    def summary(self) -> str:
+        """Returns a table summarising each stage, the queues and the audio buffer"""
+        lines = [
+            f"{'Stage':<14}{'Items':>7}{'Mean (s)':>10}{'Max (s)':>10}"
+            f"{'Wait (s)':>10}{'MiB out':>10}{'Busy':>7}"
+        ]
+        for stage, stats in self.stageSummary().items():
+            lines.append(
+                f"{stage:<14}{stats['items']:>7}{stats['meanDuration']:>10.2f}"
+                f"{stats['maxDuration']:>10.2f}{stats['meanWait']:>10.2f}"
+                f"{stats['bytes']/1024**2:>10.1f}{stats['utilisation']:>7.0%}"
+            )
+        queues = self.ofKind('queue')
+        for queueIndex in sorted(set(record['queue'] for record in queues)):
+            samples = [record for record in queues if record['queue'] == queueIndex]
+            lines.append(
+                f"Queue {queueIndex}: max {max(r['items'] for r in samples)} items, "
+                f"max {max(r['bytes'] for r in samples)/1024**2:.1f} MiB"
+            )
+        audio = self.ofKind('audio')
+        if audio:
+            lines.append(
+                f"Audio: min headroom {min(r['headroom'] for r in audio):.1f} s, "
+                f"{audio[-1]['underruns']} underruns, {audio[-1]['overruns']} overruns"
+            )
+        return "\n".join(lines)
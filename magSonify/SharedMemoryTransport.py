@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import io
+import os
+import pickle
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+class SharedArray(np.ndarray):
+    """A numpy array whose data is held in a ``multiprocessing.shared_memory`` block, as returned
+    by :meth:`SharedMemoryTransport.get`. The block is released once the array and all views of
+    it are garbage collected. Arrays computed from a :class:`SharedArray`, eg. by arithmetic, are
+    ordinary numpy arrays."""
+    _sharedMemory = None
+
+    def __array_finalize__(self,obj):
+        if np.may_share_memory(self,obj):
+            self._sharedMemory = getattr(obj,'_sharedMemory',None)
+        else:
+            self._sharedMemory = None
+
+    def __array_wrap__(self,array,context=None,return_scalar=False):
+        array = super().__array_wrap__(array,context)
+        # As for numpy.memmap, results which do not share the block are returned as ndarray
+        if self is array or type(self) is not SharedArray:
+            return array
+        if array.shape == ():
+            return array[()]
+        return array.view(np.ndarray)
+
+try:
+    from numpy.lib.array_utils import byte_bounds as _byteBounds
+except ImportError:
+    # numpy < 2.0
+    from numpy import byte_bounds as _byteBounds
+
+def _rootArray(array: np.ndarray) -> np.ndarray:
+    """Returns the array owning the memory of ``array``, or ``array`` itself if that is not a
+    contiguous numpy array, so that views of one array can be placed in a single block"""
+    root = array
+    while isinstance(root.base,np.ndarray):
+        root = root.base
+    if root is not array and not (root.flags.c_contiguous or root.flags.f_contiguous):
+        return array
+    return root
+
+class _SharedMemoryPickler(pickle.Pickler):
+    """Pickler which replaces numpy arrays of at least ``minSharedBytes`` by a persistent id
+    ``("SharedArray", index)``. Once pickled, :meth:`share` copies them into shared memory and
+    returns a descriptor of each in place of the index.
+    
+    An array referenced several times gets one index, and arrays which are views of the same
+    array are placed in one block covering only the bytes that they span, so identity and
+    aliasing are kept by the transport."""
+    def __init__(self,file,minSharedBytes):
+        super().__init__(file,protocol=pickle.HIGHEST_PROTOCOL)
+        self.minSharedBytes = minSharedBytes
+        self.blocks = []
+        # Indexed by id(), which is only unique whilst the arrays are kept alive by this list
+        self.arrays = []
+        self._indices = {}
+
+    def persistent_id(self,obj):
+        if not (
+            isinstance(obj,np.ndarray)
+            and obj.nbytes >= max(self.minSharedBytes,1)
+            and obj.dtype.fields is None
+            and not obj.dtype.hasobject
+        ):
+            return None
+        index = self._indices.get(id(obj))
+        if index is None:
+            index = self._indices[id(obj)] = len(self.arrays)
+            self.arrays.append(obj)
+        return ("SharedArray", index)
+
+    def share(self) -> list:
+        """Copies the pickled arrays into shared memory blocks. Returns a descriptor
+        ``(blockName, offset, shape, strides, dtype)`` for each array, in order of index."""
+        groups = {}
+        for array in self.arrays:
+            root = _rootArray(array)
+            groups.setdefault(id(root),(root,[]))[1].append(array)
+        descriptors = {}
+        for root, arrays in groups.values():
+            if not (root.flags.c_contiguous or root.flags.f_contiguous):
+                # Not a view, copied into its own contiguous block
+                (array,) = arrays
+                block = shared_memory.SharedMemory(create=True,size=array.nbytes)
+                self.blocks.append(block)
+                np.ndarray(array.shape,array.dtype,buffer=block.buf)[...] = array
+                descriptors[id(array)] = (block.name, 0, array.shape, None, array.dtype.str)
+                continue
+            rootStart = _byteBounds(root)[0]
+            bounds = [_byteBounds(array) for array in arrays]
+            # Keep the alignment of the arrays relative to the root
+            start = min(low for low, high in bounds)
+            start -= (start - rootStart) % 64
+            stop = max(high for low, high in bounds)
+            block = shared_memory.SharedMemory(create=True,size=stop - start)
+            self.blocks.append(block)
+            rootBytes = root.ravel(order='K').view(np.uint8)
+            np.ndarray(stop - start,np.uint8,buffer=block.buf)[...] = (
+                rootBytes[start - rootStart:stop - rootStart]
+            )
+            for array in arrays:
+                offset = array.__array_interface__['data'][0] - start
+                descriptors[id(array)] = (
+                    block.name, offset, array.shape, array.strides, array.dtype.str
+                )
+        return [descriptors[id(array)] for array in self.arrays]
+
+class _SharedMemoryUnpickler(pickle.Unpickler):
+    """Unpickler which attaches to the shared memory blocks described by ``descriptors``, see
+    :meth:`_SharedMemoryPickler.share`. Each block is unlinked as it is attached, so it is freed
+    once the resulting arrays are garbage collected."""
+    def __init__(self,file,descriptors):
+        super().__init__(file)
+        self.descriptors = descriptors
+        self.blocks = {}
+        self.arrays = {}
+
+    def persistent_load(self,pid):
+        tag, index = pid
+        if tag != "SharedArray":
+            raise pickle.UnpicklingError(f"Unsupported persistent id {tag!r}")
+        if index not in self.arrays:
+            name, offset, shape, strides, dtype = self.descriptors[index]
+            block = self.blocks.get(name)
+            if block is None:
+                block = self.blocks[name] = shared_memory.SharedMemory(name=name)
+                block.unlink()
+            array = np.ndarray(
+                shape,dtype,buffer=block.buf,offset=offset,strides=strides
+            ).view(SharedArray)
+            array._sharedMemory = block
+            self.arrays[index] = array
+        return self.arrays[index]
+
+class SharedMemoryTransport():
+    """Wraps a ``multiprocessing`` queue, sending objects with their numpy arrays placed in
+    shared memory. Only a small pickle with descriptors of the arrays passes through the queue,
+    so large data sets, eg. :class:`THEMISdata` or :class:`DataSet_1D` with wavelet coefficients,
+    are copied once into shared memory rather than serialised and copied through the queue.
+    ::
+
+        transport = SharedMemoryTransport(manager.Queue())
+        transport.put(mag)          # In the producing process
+        mag = transport.get()       # In the consuming process
+
+    An array referenced several times within ``obj`` is received as one array, and views of the
+    same array, eg. the components of a :class:`DataSet_3D` and its vector buffer, are received
+    as views of one block, so writes through one are seen by the others.
+
+    Each object should be received by exactly one consumer. The shared memory for an object is
+    unlinked when it is received, and freed once the received arrays are no longer referenced.
+    Blocks which are never received, eg. as a consumer failed, are unlinked by the
+    ``multiprocessing`` resource tracker once the processes have exited.
+
+    The transport should be created in the parent process, before the producing and consuming
+    processes are started, so that they share a resource tracker.
+
+    :param queue:
+        Queue to send the descriptors through, eg. from ``multiprocessing.Manager().Queue()``.
+    :param minSharedBytes:
+        Arrays smaller than this are pickled as normal, as a shared memory block has a fixed cost.
+    """
+    def __init__(self,queue,minSharedBytes=2**16):
+        self.queue = queue
+        self.minSharedBytes = minSharedBytes
+        self._openBlocks = []
+        if os.name != "nt":
+            # Windows has no resource tracker, blocks are freed when the last handle is closed
+            resource_tracker.ensure_running()
+
+    def dumps(self,obj) -> bytes:
+        """Returns ``obj`` pickled, with its arrays placed in shared memory"""
+        file = io.BytesIO()
+        pickler = _SharedMemoryPickler(file,self.minSharedBytes)
+        pickler.dump(obj)
+        data = io.BytesIO()
+        # The descriptors are only known once the whole object is pickled, so precede it
+        pickle.dump(pickler.share(),data,protocol=pickle.HIGHEST_PROTOCOL)
+        data.write(file.getvalue())
+        for block in pickler.blocks:
+            if os.name == "nt":
+                # Keep the block alive until it is attached by the consumer, see cleanup()
+                self._openBlocks.append(block)
+            else:
+                block.close()
+        return data.getvalue()
+
+    def loads(self,data: bytes):
+        """Returns the object pickled by :meth:`dumps`, with arrays as :class:`SharedArray`"""
+        file = io.BytesIO(data)
+        descriptors = pickle.load(file)
+        return _SharedMemoryUnpickler(file,descriptors).load()
+
+    def put(self,obj,block=True,timeout=None) -> None:
+        """Sends ``obj`` through the queue, see ``multiprocessing.Queue.put``"""
+        self.queue.put(self.dumps(obj),block,timeout)
+
+    def get(self,block=True,timeout=None):
+        """Receives an object from the queue, see ``multiprocessing.Queue.get``"""
+        return self.loads(self.queue.get(block,timeout))
+
+    def cleanup(self) -> None:
+        """Closes the handles to blocks sent from this process that are kept open on Windows.
+        Should be called once the consumers have received all objects."""
+        for block in self._openBlocks:
+            block.close()
+        self._openBlocks = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_openBlocks'] = []
+        return state
@@ -2,10 +2,7 @@
 from datetime import time
 from magSonify.DataSet import DataSet
 import numpy as np
-from numpy.core.arrayprint import _array_str_implementation
-from scipy import signal
 from .TimeSeries import TimeSeries
-from scipy.signal import chirp
 
 rng: np.random.Generator = np.random.default_rng()
 
@@ -56,6 +53,7 @@ class SimulateData():
         return s.genHarmonic(timeSeries,frequencies,amplitude,phase)
 
     def genSweep(self,timeSeries: TimeSeries, f0, f1, amplitude=1, method='linear'):
+        from scipy.signal import chirp
         timeSeries = self._setupTimeSeries(timeSeries)
         times = timeSeries.asFloat()
         t1 = np.max(times)
@@ -63,6 +61,7 @@ class SimulateData():
         return signal
 
     def genSweepExpectation(self,timeSeries:TimeSeries,stretch,f0,f1,amplitdue=1,method='linear'):
+        from scipy.signal import chirp
         timeSeries = self._setupTimeSeries(timeSeries,stretch)
         times = timeSeries.asFloat()
         t1 = np.max(times)
@@ -40,8 +40,8 @@ def generateTimeSeries(
 
 def _GenerateTimeSeriesWithSpacing(start, timeUnit, spacing, intervalLength):
     number = int(intervalLength/spacing)
-    t = np.arange(0,number+1) * spacing
-    return TimeSeries(t,timeUnit,start)
+    t = (np.arange(0,number+1) * spacing) / timeUnit
+    return TimeSeries._fromFloat(t,timeUnit,start)
 
 def _GenerateTimeSeriesWithNumber(start, timeUnit, number, intervalLength):
     t = np.linspace(
@@ -49,7 +49,7 @@ def _GenerateTimeSeriesWithNumber(start, timeUnit, number, intervalLength):
             intervalLength / timeUnit,
             number
         )
-    return TimeSeries(t,timeUnit,start)
+    return TimeSeries._fromFloat(t,timeUnit,start)
     
 
 class TimeSeries():
@@ -92,19 +92,96 @@ class TimeSeries():
             times = times / timeUnit
 
         self.times = times
-        """A numpy array of times stored as ``np.float``"""
         self.timeUnit = timeUnit
         """The time unit used stored as ``np.timedelta64``"""
         self.startTime = startTime
         """The starting time of the series stored as ``np.datetime64``"""
 
+    @classmethod
+    def _fromFloat(
+        cls,
+        times: np.array,
+        timeUnit: np.timedelta64 = np.timedelta64(1,'s'),
+        startTime: np.datetime64 = None,
+    ) -> TimeSeries:
+        """Constructs a time series directly from a float array of times, without copying or 
+        parsing. Used internally where the times are already in the stored representation.
+
+        :param times: Array of times as ``np.float``, referenced rather than copied
+        :param timeUnit: The time unit as ``np.timedelta64``
+        :param startTime: The start time as ``np.datetime64`` or ``None``
+        """
+        timeSeries = cls.__new__(cls)
+        timeSeries.times = times
+        timeSeries.timeUnit = timeUnit
+        timeSeries.startTime = startTime
+        return timeSeries
+
+    def _shallowCopy(self) -> TimeSeries:
+        """Returns a new time series which shares the :attr:`times` array of this one. Used to give
+        derived data sets their own time series object without copying the times."""
+        return self._fromFloat(self.times,self.timeUnit,self.startTime)
+
+    def _getMetadata(self) -> dict:
+        """Returns the time unit and start time as JSON serialisable values, used when saving a 
+        data set. See :meth:`DataSet.save`."""
+        unit = np.datetime_data(self.timeUnit.dtype)[0]
+        return {
+            'timeUnit': [int(self.timeUnit / np.timedelta64(1,unit)), unit],
+            'startTime': None if self.startTime is None else str(self.startTime),
+        }
+
+    @classmethod
+    def _fromMetadata(cls,times: np.array,metadata: dict) -> TimeSeries:
+        """Constructs a time series from ``times`` and the output of :meth:`_getMetadata`. 
+        ``times`` is referenced rather than copied, so a memory mapped array is not read until it
+        is accessed."""
+        value, unit = metadata['timeUnit']
+        startTime = metadata['startTime']
+        return cls._fromFloat(
+            times,
+            np.timedelta64(value,unit),
+            None if startTime is None else np.datetime64(startTime)
+        )
+
+    def _sharesTimes(self,other: TimeSeries) -> bool:
+        """Whether both :attr:`times` are the same array, or views of the same memory with the 
+        same layout, eg. the time series of data sets derived from one another or the same slice
+        of one. Their times are then equal however they have been modified, so this is O(1)."""
+        if self.times is other.times:
+            return True
+        if not (isinstance(self.times,np.ndarray) and isinstance(other.times,np.ndarray)):
+            return False
+        return (
+            self.times.__array_interface__['data'][0] == other.times.__array_interface__['data'][0]
+            and self.times.shape == other.times.shape
+            and self.times.strides == other.times.strides
+            and self.times.dtype == other.times.dtype
+        )
+
+    def _hasSameRepresentation(self,other: TimeSeries) -> bool:
+        """Whether both series express their times with the same unit and start time"""
+        return (
+            self.timeUnit == other.timeUnit 
+            and (
+                self.startTime is other.startTime
+                or (
+                    self.startTime is not None and other.startTime is not None 
+                    and self.startTime == other.startTime
+                )
+            )
+        )
+
     def _raiseIfNoStartTime(self) -> None:
         if self.startTime is None: 
             raise ValueError("Time series is defined only for relative times (startTime is None)")
 
     def getStart(self) -> np.datetime64:
+        """Returns the datetime of the first time point"""
         self._raiseIfNoStartTime()
-        return self.startTime
+        if len(self.times) == 0:
+            return self.startTime
+        return self.startTime + self.times[0] * self.timeUnit
 
     def getEnd(self) -> np.datetime64:
         self._raiseIfNoStartTime()
@@ -138,22 +215,65 @@ class TimeSeries():
             return self.asDatetime()
         return self.asTimedelta()
 
-    def argFirstAfter(self,datetime) -> int:
-        """Returns the argument of the first time point occuring after ``datetime``"""
-        datetime = np.datetime64(datetime)
+    def _datetimeToFloat(self,datetime) -> float:
+        """Expresses ``datetime`` in the float representation used by :attr:`times`"""
         self._raiseIfNoStartTime()
-        val = (datetime - self.startTime) / self.timeUnit
-        return np.argmax(self.times - val)
+        return (np.datetime64(datetime) - self.startTime) / self.timeUnit
+
+    def argFirstAfter(self,datetime) -> int:
+        """Returns the argument of the first time point occuring after ``datetime``. Returns 
+        ``len(self)`` if there are no time points after ``datetime``.
+
+        Uses a binary search, so :attr:`times` must be sorted.
+        """
+        val = self._datetimeToFloat(datetime)
+        return int(np.searchsorted(self.times,val,side='right'))
+
+    def argLastBefore(self,datetime) -> int:
+        """Returns the argument of the last time point occuring before ``datetime``. Returns 
+        ``-1`` if there are no time points before ``datetime``.
 
-    def interpolate(self,factor) -> None:
+        Uses a binary search, so :attr:`times` must be sorted.
+        """
+        val = self._datetimeToFloat(datetime)
+        return int(np.searchsorted(self.times,val,side='left')) - 1
+
+    def sliceBetween(self,start=None,end=None) -> slice:
+        """Returns the ``slice`` selecting time points with ``start <= time <= end``. If ``start``
+        or ``end`` is ``None`` the range is unbounded on that side.
+
+        Uses a binary search, so :attr:`times` must be sorted.
+        """
+        iStart = None
+        iEnd = None
+        if start is not None:
+            iStart = int(np.searchsorted(self.times,self._datetimeToFloat(start),side='left'))
+        if end is not None:
+            iEnd = int(np.searchsorted(self.times,self._datetimeToFloat(end),side='right'))
+        return slice(iStart,iEnd)
+
+    def interpolate(self,factor,out: np.array = None,blockSize: int = 2**18) -> None:
         """Interpolates the time series, increasing the density of points by ``factor`` times and 
         evenly spacing the points. If ``factor < 1``, reduces density of points.
+
+        :param out:
+            Array of length ``int(len(self) * factor)`` to place the times in, eg. a 
+            ``numpy.memmap``. It is filled in blocks of ``blockSize`` points, so the interpolated 
+            times are never fully in memory.
         """
-        self.times = np.linspace(
-            self.times[0],
-            self.times[-1],
-            int(len(self.times) * factor)
-        )
+        length = int(len(self.times) * factor)
+        if out is None:
+            self.times = np.linspace(self.times[0],self.times[-1],length)
+            return
+        start, stop = float(self.times[0]), float(self.times[-1])
+        step = (stop - start) / (length - 1) if length > 1 else 0
+        # As np.linspace, evaluated in blocks
+        for blockStart in range(0,length,blockSize):
+            blockStop = min(blockStart + blockSize,length)
+            out[blockStart:blockStop] = start + np.arange(blockStart,blockStop) * step
+        if length > 1:
+            out[-1] = stop
+        self.times = out
     
     def changeUnit(self,newTimeUnit: np.timedelta64) -> None:
         """Change the units of time that the time series is expressed in to ``newTimeUnit``
@@ -164,27 +284,37 @@ class TimeSeries():
 
     def copy(self) -> TimeSeries:
         """Returns a copy of the time series"""
-        return type(self)(self.times.copy(),self.timeUnit,self.startTime)
+        return self._fromFloat(self.times.copy(),self.timeUnit,self.startTime)
 
     def __eq__(self,other: TimeSeries) -> bool:
         """
         Supports equality testing::
             
             firstTimeSeries == secondTimeSeries
+
+        Series sharing their :attr:`times` array, eg. of data sets derived from one another, 
+        compare in O(1). Series with the same time unit and start time compare their float 
+        times, and otherwise the times are compared as ``np.datetime64`` element wise.
         """
-        return (
-            self is other 
-            or  np.all(self.asNumpy() == other.asNumpy())
-        )
+        if self is other:
+            return True
+        if len(self) != len(other):
+            return False
+        if self._hasSameRepresentation(other):
+            return self._sharesTimes(other) or bool(np.array_equal(self.times,other.times))
+        return bool(np.all(self.asNumpy() == other.asNumpy()))
     
     def __getitem__(self,subscript:slice) -> TimeSeries:
         """
         Supports getting a subset of times using a slice::
 
             myNewTimeSeries = myTimeSeries[100:200]
+
+        The new time series keeps the same :attr:`startTime` and :attr:`timeUnit`, and its 
+        :attr:`times` is a view of the parent array, so no data is copied.
         """
         if isinstance(subscript,slice):
-            return type(self)(self.asNumpy()[subscript],self.timeUnit)
+            return self._fromFloat(self.times[subscript],self.timeUnit,self.startTime)
 
     def __len__(self):
         return len(self.times)
\ No newline at end of file
@@ -1,28 +1,68 @@
 # WARNING: Delete cache before package uninstall by calling cacheControl.deleteCache()
 
-from ai import cdas
-from .Utilities import ensureFolder
+import sys as _sys
+import types as _types
 
 try:
     from .devCaching.config import CACHING_ENABLED
 except ImportError:
     CACHING_ENABLED = False
 
-def enableCaching():
-    from .devCaching.initialise import local_app_path,cdas_cache_path
-    if local_app_path is not None:
-        ensureFolder(local_app_path)
-        ensureFolder(cdas_cache_path)
-        cdas.set_cache("True",cdas_cache_path)
+try:
+    from .devCaching.config import CACHE_MAX_BYTES
+except ImportError:
+    CACHE_MAX_BYTES = 2**30
+
+def enableCaching(maxBytes=CACHE_MAX_BYTES):
+    """Caches the responses to all CDAS requests which do not specify a data source, see 
+    :class:`magSonify.Caching.CachedDataSource`."""
+    from .devCaching.initialise import cdas_cache_path
+    from .Caching import CachedDataSource
+    from .DataSource import setDefaultDataSource
+    setDefaultDataSource(CachedDataSource(directory=cdas_cache_path,maxBytes=maxBytes))
 
 if CACHING_ENABLED:
     enableCaching()
 
-from .MagnetometerData import MagnetometerData, THEMISdata
-from .SimulateData import SimulateData
-from .TimeSeries import TimeSeries, generateTimeSeries
-from .DataSet import DataSet, DataSet_3D
-from .DataSet_1D import DataSet_1D
+# The public names are imported from their modules when first used (PEP 562), so that importing 
+# magSonify, eg. in each worker process, only loads the modules which are needed
+_LAZY_IMPORTS = {
+    'MagnetometerData': 'MagnetometerData',
+    'THEMISdata': 'MagnetometerData',
+    'SimulateData': 'SimulateData',
+    'TimeSeries': 'TimeSeries',
+    'generateTimeSeries': 'TimeSeries',
+    'DataSet': 'DataSet',
+    'DataSet_3D': 'DataSet',
+    'DataSet_1D': 'DataSet_1D',
+    'LazyDataSet': 'LazyDataSet',
+}
+
+__all__ = ['enableCaching', *_LAZY_IMPORTS]
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f".{_LAZY_IMPORTS[name]}",__name__),name)
+    # Cached, so later accesses do not call __getattr__
+    globals()[name] = value
+    return value
 
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
 
+class _Package(_types.ModuleType):
+    """Importing a submodule sets it as an attribute of the package, which would hide the public
+    name of the same name, eg. the class ``TimeSeries`` by the module ``TimeSeries``. The public
+    name is set instead."""
+    def __setattr__(self, name, value):
+        if (
+            isinstance(value,_types.ModuleType)
+            and _LAZY_IMPORTS.get(name) == name
+            and value.__name__ == f"{__name__}.{name}"
+        ):
+            value = getattr(value,name)
+        super().__setattr__(name,value)
 
+_sys.modules[__name__].__class__ = _Package
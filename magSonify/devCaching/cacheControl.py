@@ -1,32 +1,20 @@
 import os, shutil
-from .initialise import cdas_cache_path
-
-def _get_directory_size(directory):
-    """Returns the `directory` size in bytes and number of files"""
-    totalSize = 0
-    try:
-        # print("[+] Getting the size of", directory)
-        for entry in os.scandir(directory):
-            if entry.is_file():
-                # if it's a file, use stat() function
-                totalSize += entry.stat().st_size
-            elif entry.is_dir():
-                # if it's a directory, recursively call this function
-                totalSize += _get_directory_size(entry.path)
-    except NotADirectoryError:
-        # if `directory` isn't a directory, get the file size then
-        return os.path.getsize(directory)
-    except PermissionError:
-        # if for whatever reason we can't open the folder, return 0
-        return 0
-    return totalSize
+from .initialise import local_app_path, cdas_cache_path
+from ..Caching import CachedDataSource, _directorySize
 
 def cacheDetails():
     """Prints cache details to console"""
-    cdasSize = _get_directory_size(cdas_cache_path/1024**2)
-    print(f"CDAS cache size: {cdasSize}")
+    size, numberFiles = _directorySize(cdas_cache_path)
+    print(f"CDAS cache size: {size/1024**2:.1f} MiB in {numberFiles} files ({cdas_cache_path})")
 
 def deleteCache():
-    """Deletes the cache"""
-    shutil.rmtree(cdas_cache_path)
+    """Deletes the cache of CDAS responses, and the responses cached by a 
+    :class:`magSonify.Caching.CachedDataSource` in its default directory. Other files in the 
+    cache directory, which may be set by ``MAGSONIFY_CACHE_DIR``, are kept."""
+    for directory in (
+        cdas_cache_path,
+        os.path.join(local_app_path,CachedDataSource._defaultSubdirectory),
+    ):
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
     print("The cache has been deleted")
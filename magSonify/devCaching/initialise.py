@@ -1,17 +1,8 @@
 import os
+from ..Caching import defaultCacheDirectory
 
-localappdata = os.getenv("LOCALAPPDATA")
-
-if localappdata is not None:
-    local_app_path = os.path.join(
-        localappdata,
-        "magSonify"
-    )
-    cdas_cache_path = os.path.join(
-        local_app_path,
-        "CDAScache"
-    )
-else:
-    print("Failed to get cache path, do not use cache operations")
-    local_app_path = None
-    cdas_cache_path = None
\ No newline at end of file
+local_app_path = defaultCacheDirectory()
+cdas_cache_path = os.path.join(
+    local_app_path,
+    "CDAScache"
+)
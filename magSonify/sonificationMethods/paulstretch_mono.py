@@ -13,12 +13,32 @@
 import numpy as np
 
 
+def _windowSize(windowsize_seconds: float, samplerate=44100) -> int:
+    #make sure that windowsize is even and larger than 16
+    windowsize=int(windowsize_seconds*samplerate)
+    if windowsize<16:
+        windowsize=16
+    return int(windowsize/2)*2
+
+def paulstretchMaxOutputLength(
+    numberSamples: int,
+    stretch: float,
+    windowsize_seconds: float,
+    samplerate=44100
+) -> int:
+    """Returns an upper bound on the length of the output of :func:`paulstretch`, for 
+    preallocating the ``out`` array."""
+    windowsize = _windowSize(windowsize_seconds, samplerate)
+    displace_pos=(windowsize*0.5)/stretch
+    return (int(np.ceil(numberSamples/displace_pos)) + 1) * (windowsize//2)
+
 def paulstretch(
     audioSample: np.array,
     stretch: float, 
     windowsize_seconds: float, 
     samplerate=44100, 
-    enableDebugOutput=False
+    enableDebugOutput=False,
+    out: np.array = None
 ) -> np.array:
     """ Implementation of paulstretch.
 
@@ -26,15 +46,15 @@ def paulstretch(
         Returns a tuple as output, where the first element is the standard output, the second
         element is a 2D numpy array containing the amplitude component of the fft of each window,
         the third is the start index of each window and the fourth is the window function.
+    :param out:
+        Array to write the output into, of at least the length given by 
+        :func:`paulstretchMaxOutputLength`, eg. a ``numpy.memmap``. The output is then the 
+        initial section of ``out`` which was written to.
     """
     
     smp = audioSample
 
-    #make sure that windowsize is even and larger than 16
-    windowsize=int(windowsize_seconds*samplerate)
-    if windowsize<16:
-        windowsize=16
-    windowsize=int(windowsize/2)*2
+    windowsize=_windowSize(windowsize_seconds, samplerate)
     half_windowsize=int(windowsize/2)
 
     #correct the end of the smp
@@ -56,6 +76,7 @@ def paulstretch(
     hinv_buf=hinv_sqrt2-(1.0-hinv_sqrt2)*np.cos(np.arange(half_windowsize,dtype='float')*2.0*np.pi/half_windowsize)
 
     finalOutput = []
+    outputLength = 0
     debugOutput = []
     intervalStarts = []
 
@@ -71,8 +92,9 @@ def paulstretch(
         #get the amplitudes of the frequency components and discard the phases
         freqs=abs(np.fft.rfft(buf))
 
-        debugOutput.append(freqs.copy())
-        intervalStarts.append(istart_pos)
+        if enableDebugOutput:
+            debugOutput.append(freqs.copy())
+            intervalStarts.append(istart_pos)
 
         #randomize the phases by multiplication with a random complex number with modulus=1
         ph=np.random.uniform(0,2*np.pi,len(freqs))*1j
@@ -95,9 +117,16 @@ def paulstretch(
         start_pos+=displace_pos
         if start_pos>=len(smp):
             break
-        finalOutput.append(output)
-
-    finalOutput = np.concatenate(finalOutput)
+        if out is None:
+            finalOutput.append(output)
+        else:
+            out[outputLength:outputLength+half_windowsize] = output
+        outputLength += half_windowsize
+
+    if out is None:
+        finalOutput = np.concatenate(finalOutput)
+    else:
+        finalOutput = out[:outputLength]
     if enableDebugOutput:
         return finalOutput, np.array(debugOutput), np.array(intervalStarts), window
     else:
@@ -33,5 +33,6 @@ setuptools.setup(
     ],
     extras_require={
         'bufferingTest': ['sounddevice'],
+        'cdf': ['cdflib>=1.0'],
     }
  )